@@ -0,0 +1,58 @@
+from dotenv import load_dotenv
+
+_ = load_dotenv(override=True)
+
+import argparse
+
+parser = argparse.ArgumentParser(description="Dense encoding throughput benchmark")
+parser.add_argument(
+    "-n",
+    "--limit",
+    type=int,
+    default=512,
+    help="Number of content chunks to encode",
+)
+parser.add_argument(
+    "-b",
+    "--batch-size",
+    type=int,
+    default=32,
+    help="Batch size for the batched, length-sorted path",
+)
+args = parser.parse_args()
+
+import os
+import time
+
+from services import TextEncoder
+from services.ingestion_pipeline import load_content_chunks
+
+
+def main():
+    chunks = load_content_chunks(limit=args.limit)
+    print(f"# Loaded {len(chunks)} content chunks")
+
+    text_encoder = TextEncoder(
+        sparse_model_name=os.getenv("SPARSE_EMBEDDINGS_MODEL_NAME"),
+        dense_model_name=os.getenv("DENSE_EMBEDDINGS_MODEL_NAME"),
+    )
+    # Warm up so model loading is not part of the measurement
+    text_encoder.encode_dense("Hello World", "retrieval.passage")
+
+    start = time.perf_counter()
+    for chunk in chunks:
+        text_encoder.encode_dense(chunk, "retrieval.passage")
+    per_chunk_elapsed = time.perf_counter() - start
+    print(f"# Per-chunk encoding: {len(chunks) / per_chunk_elapsed:.2f} chunks/sec ({per_chunk_elapsed:.2f}s)")
+
+    start = time.perf_counter()
+    text_encoder.encode_dense(chunks, "retrieval.passage", batch_size=args.batch_size)
+    batched_elapsed = time.perf_counter() - start
+    print(
+        f"# Batched encoding (batch_size={args.batch_size}): {len(chunks) / batched_elapsed:.2f} chunks/sec ({batched_elapsed:.2f}s)"
+    )
+    print(f"# Speedup: {per_chunk_elapsed / batched_elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
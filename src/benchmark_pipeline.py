@@ -0,0 +1,296 @@
+from dotenv import load_dotenv
+
+_ = load_dotenv(override=True)
+
+import argparse
+
+parser = argparse.ArgumentParser(
+    description="End-to-end benchmark of ingestion and of every query pipeline stage on a synthetic corpus"
+)
+parser.add_argument("--species", type=int, default=200, help="Number of synthetic species to index")
+parser.add_argument("--sentences", type=int, default=40, help="Number of content sentences per synthetic species")
+parser.add_argument("-q", "--queries", type=int, default=50, help="Number of benchmark queries")
+parser.add_argument("-b", "--batch-size", type=int, default=256, help="Ingestion batch size")
+parser.add_argument("--llm-tokens", type=int, default=64, help="Number of tokens streamed by the stub LLM")
+parser.add_argument("--llm-first-token-ms", type=float, default=50, help="Stub LLM delay before the first token")
+parser.add_argument("--llm-token-ms", type=float, default=5, help="Stub LLM delay between tokens")
+parser.add_argument("--seed", type=int, default=7, help="Random seed of the synthetic corpus and queries")
+parser.add_argument("-o", "--output", default="benchmark_results.json", help="Path of the JSON report")
+parser.add_argument("--baseline", help="JSON report of a previous run to compare the p95 latencies against")
+args = parser.parse_args()
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from transformers import logging as hf_logging
+
+hf_logging.set_verbosity_error()
+
+from fake_ollama_server import FakeOllamaServer
+from models import Plague
+from services import IngestionPipeline, QueryProcessor, RagPipeline, Reranker, TextEncoder, VectorStore
+from services.context_builder import create_context_builder
+from services.llm_client import OllamaClient
+from services.species_gazetteer import build_species_gazetteer
+from text_chunker import TokenChunker
+
+COLLECTION_NAME = "benchmark"
+SPARSE_VECTORS_NAME = "benchmark_sparse"
+DENSE_VECTORS_NAME = "benchmark_dense"
+
+GENERA = ["Azolla", "Bactericera", "Sorghum", "Phytophthora", "Xylella", "Tuta", "Spodoptera", "Bemisia", "Fusarium", "Ralstonia"]
+EPITHETS = ["pinnata", "cockerelli", "halepense", "infestans", "fastidiosa", "absoluta", "frugiperda", "tabaci", "oxysporum", "solanacearum"]
+COMMON_NOUNS = ["fern", "psyllid", "grass", "blight", "moth", "armyworm", "whitefly", "wilt", "rot", "beetle"]
+COMMON_ADJECTIVES = ["mosquito", "tomato", "johnson", "late", "leaf", "fall", "silverleaf", "vascular", "brown", "golden"]
+HOSTS = ["potato", "tomato", "maize", "rice", "citrus", "olive", "grapevine", "soybean", "cotton", "wheat"]
+REGIONS = ["Peru", "Chile", "Mexico", "Spain", "Kenya", "India", "Brazil", "Italy", "Vietnam", "Australia"]
+SENTENCES = [
+    "{name} is reported on {host} crops in {region}, where it causes significant yield losses.",
+    "Infested {host} plants show chlorosis, stunting and wilting within a few weeks of the first symptoms.",
+    "The pest spreads through infected planting material, irrigation water and the movement of machinery.",
+    "Quarantine measures in {region} include inspection of {host} consignments and destruction of infected lots.",
+    "Biological control agents have reduced {name} populations in experimental {host} fields.",
+    "Chemical control is limited because resistant populations have been detected in {region}.",
+    "Early detection relies on field scouting, sticky traps and laboratory confirmation of samples.",
+    "Climate warming extends the period in which {name} completes several generations per season.",
+]
+QUERY_TEMPLATES = [
+    "Which crops are affected by {name}?",
+    "How is {common} controlled in {region}?",
+    "What symptoms does {name} cause on {host}?",
+    "Is {common} a quarantine pest for {host} exports?",
+    "How does the pest spread between {host} fields?",
+]
+
+
+def generate_plagues(rng: random.Random) -> List[Plague]:
+    plagues = []
+    for idx in range(args.species):
+        name = f"{rng.choice(GENERA)} {rng.choice(EPITHETS)}{idx}"
+        common = f"{rng.choice(COMMON_ADJECTIVES)} {rng.choice(COMMON_NOUNS)}"
+        content = " ".join(
+            rng.choice(SENTENCES).format(name=name, host=rng.choice(HOSTS), region=rng.choice(REGIONS))
+            for _ in range(args.sentences)
+        )
+        # The same label PlagueService stores for the es_cuarentenaria filter
+        is_quarantine = "Es cuarentenanaria" if rng.random() < 0.3 else "No es cuarentenanaria"
+        plagues.append(Plague(name, common, f"https://example.org/species/{idx}", content, is_quarantine))
+    return plagues
+
+
+def generate_queries(rng: random.Random, plagues: List[Plague]) -> List[str]:
+    queries = []
+    for _ in range(args.queries):
+        plague = rng.choice(plagues)
+        queries.append(
+            rng.choice(QUERY_TEMPLATES).format(
+                name=plague.scientific_name, common=plague.common_names, host=rng.choice(HOSTS), region=rng.choice(REGIONS)
+            )
+        )
+    return queries
+
+
+def summarize(durations: List[float], items: int = 0) -> Dict[str, float]:
+    total = sum(durations)
+    summary = {
+        "count": len(durations),
+        "mean_ms": float(np.mean(durations) * 1000),
+        "p50_ms": float(np.percentile(durations, 50) * 1000),
+        "p95_ms": float(np.percentile(durations, 95) * 1000),
+        "p99_ms": float(np.percentile(durations, 99) * 1000),
+        "throughput_per_sec": len(durations) / total if total else 0.0,
+    }
+    if items:
+        summary["items_per_sec"] = items / total if total else 0.0
+    return summary
+
+
+def benchmark_ingestion(vector_store: VectorStore, plagues: List[Plague]) -> Dict:
+    # Times every add_documents call made by the ingestion pipeline, per vector kind
+    durations = defaultdict(list)
+    points = defaultdict(int)
+    add_documents = vector_store.add_documents
+
+    def timed_add_documents(collection_name, documents, use_sparse=False, use_dense=False, **kwargs):
+        start = time.perf_counter()
+        added = add_documents(collection_name, documents, use_sparse=use_sparse, use_dense=use_dense, **kwargs)
+        kind = "dense" if use_dense else "sparse"
+        durations[kind].append(time.perf_counter() - start)
+        points[kind] += len(documents)
+        return added
+
+    vector_store.add_documents = timed_add_documents
+    pipeline = IngestionPipeline(
+        vector_store,
+        COLLECTION_NAME,
+        TokenChunker(os.getenv("DENSE_EMBEDDINGS_MODEL_NAME")),
+        batch_size=args.batch_size,
+    )
+    start = time.perf_counter()
+    total_points = pipeline.run(plagues)
+    elapsed = time.perf_counter() - start
+    vector_store.add_documents = add_documents
+
+    report = {"total_points": total_points, "total_seconds": elapsed, "points_per_sec": total_points / elapsed}
+    for kind in durations:
+        report[f"add_documents_{kind}"] = summarize(durations[kind], points[kind])
+    return report
+
+
+def benchmark_queries(rag_pipeline: RagPipeline, queries: List[str]) -> Tuple[Dict, Dict]:
+    # Times the calls RagPipeline.retrieve makes to its components, one after another, so
+    # the stages are disjoint and, with retrieve_overhead, add up to the retrieve time
+    durations: Dict[str, List[float]] = defaultdict(list)
+    stage_seconds = 0.0
+
+    def timed(stage: str, function: Callable) -> Callable:
+        def timed_function(*function_args, **function_kwargs):
+            nonlocal stage_seconds
+            start = time.perf_counter()
+            result = function(*function_args, **function_kwargs)
+            elapsed = time.perf_counter() - start
+            durations[stage].append(elapsed)
+            stage_seconds += elapsed
+            return result
+
+        return timed_function
+
+    stage_methods = [
+        ("species_gazetteer", rag_pipeline.species_gazetteer, "extract_terms"),
+        ("keyword_extraction", rag_pipeline.query_processor, "extract_keywords"),
+        ("sparse_encode", rag_pipeline.text_encoder, "encode_sparse"),
+        ("dense_encode", rag_pipeline.text_encoder, "encode_dense"),
+        ("hybrid_search", rag_pipeline.vector_store, "hybrid_search"),
+        ("rerank", rag_pipeline.reranker, "compute_scores"),
+    ]
+    for stage, component, method_name in stage_methods:
+        setattr(component, method_name, timed(stage, getattr(component, method_name)))
+
+    retrieve_durations = []
+    try:
+        for query in queries:
+            # Keyword extraction only runs when the gazetteer finds no species mention
+            stage_seconds = 0.0
+            start = time.perf_counter()
+            _, ranked_results = rag_pipeline.retrieve(query)
+            retrieve_durations.append(time.perf_counter() - start)
+            durations["retrieve_overhead"].append(retrieve_durations[-1] - stage_seconds)
+
+            start = time.perf_counter()
+            knowledge = rag_pipeline.build_knowledge(ranked_results)
+            durations["context_build"].append(time.perf_counter() - start)
+
+            # Generation is split at the first token: waiting for it, then streaming the rest
+            start = time.perf_counter()
+            first_token_time = None
+            for _ in rag_pipeline.stream_answer(query, knowledge):
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+            end = time.perf_counter()
+            durations["time_to_first_token"].append((first_token_time or end) - start)
+            durations["token_streaming"].append(end - (first_token_time or end))
+    finally:
+        for _, component, method_name in stage_methods:
+            delattr(component, method_name)
+
+    stages = {stage: summarize(stage_durations) for stage, stage_durations in durations.items() if stage_durations}
+    return stages, summarize(retrieve_durations)
+
+
+def print_comparison(report: Dict, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"# p95 latency compared with {baseline_path}:")
+    for stage, summary in report["stages"].items():
+        baseline_summary = baseline.get("stages", {}).get(stage)
+        if baseline_summary and baseline_summary["p95_ms"] > 0:
+            ratio = summary["p95_ms"] / baseline_summary["p95_ms"]
+            print(f" - {stage}: {baseline_summary['p95_ms']:.1f} ms -> {summary['p95_ms']:.1f} ms ({ratio:.2f}x)")
+
+
+def main():
+    rng = random.Random(args.seed)
+    plagues = generate_plagues(rng)
+    queries = generate_queries(rng, plagues)
+    storage_path = tempfile.mkdtemp(prefix="benchmark_qdrant_")
+
+    llm_server = FakeOllamaServer(args.llm_first_token_ms, args.llm_token_ms, args.llm_tokens).start()
+
+    try:
+        # No query caches: every stage runs its full computation on every query
+        text_encoder = TextEncoder(
+            sparse_model_name=os.getenv("SPARSE_EMBEDDINGS_MODEL_NAME"),
+            dense_model_name=os.getenv("DENSE_EMBEDDINGS_MODEL_NAME"),
+            inference_precision=os.getenv("INFERENCE_PRECISION", "fp32"),
+            inference_backend=os.getenv("INFERENCE_BACKEND", "torch"),
+        )
+        vector_store = VectorStore(storage_path, text_encoder, SPARSE_VECTORS_NAME, DENSE_VECTORS_NAME)
+        vector_store.create_collection(COLLECTION_NAME, dense_vector_size=text_encoder.get_dense_embedding_size())
+
+        print(f"# Indexing {len(plagues)} synthetic species into: {storage_path}")
+        ingestion_report = benchmark_ingestion(vector_store, plagues)
+
+        query_processor = QueryProcessor(
+            os.getenv("DENSE_EMBEDDINGS_MODEL_NAME"), inference_precision=os.getenv("INFERENCE_PRECISION", "fp32")
+        )
+        query_processor.set_seed_keywords([plague.scientific_name for plague in plagues])
+        reranker = Reranker(
+            os.getenv("RERANKER_MODEL_NAME"),
+            inference_precision=os.getenv("INFERENCE_PRECISION", "fp32"),
+            inference_backend=os.getenv("INFERENCE_BACKEND", "torch"),
+        )
+        species_gazetteer = build_species_gazetteer((plague.scientific_name, [plague.common_names]) for plague in plagues)
+        rag_pipeline = RagPipeline(
+            text_encoder,
+            vector_store,
+            query_processor,
+            reranker,
+            COLLECTION_NAME,
+            SPARSE_VECTORS_NAME,
+            DENSE_VECTORS_NAME,
+            hybrid_search_mode=os.getenv("HYBRID_SEARCH_MODE", "rrf"),
+            hybrid_search_prefetch_limit=int(os.getenv("HYBRID_SEARCH_PREFETCH_LIMIT", "100")),
+            species_gazetteer=species_gazetteer,
+            llm_client=OllamaClient(llm_server.url),
+            context_builder=create_context_builder(),
+        )
+        rag_pipeline.warm_up()
+
+        print(f"# Running {len(queries)} queries")
+        stages, retrieve_summary = benchmark_queries(rag_pipeline, queries)
+        report = {
+            "config": {**vars(args), "inference_precision": os.getenv("INFERENCE_PRECISION", "fp32"), "inference_backend": os.getenv("INFERENCE_BACKEND", "torch")},
+            "ingestion": ingestion_report,
+            "retrieve": retrieve_summary,
+            "stages": stages,
+        }
+    finally:
+        llm_server.stop()
+        shutil.rmtree(storage_path, ignore_errors=True)
+
+    print(f"# Ingestion: {ingestion_report['total_points']} points in {ingestion_report['total_seconds']:.1f}s ({ingestion_report['points_per_sec']:.1f} points/sec)")
+    print(f"# Retrieval: p50 {retrieve_summary['p50_ms']:.1f} ms, p95 {retrieve_summary['p95_ms']:.1f} ms")
+    print("# Query stages:")
+    for stage, summary in report["stages"].items():
+        print(
+            f" - {stage}: p50 {summary['p50_ms']:.1f} ms, p95 {summary['p95_ms']:.1f} ms, "
+            f"p99 {summary['p99_ms']:.1f} ms, {summary['throughput_per_sec']:.1f}/sec"
+        )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"# Report written to {args.output}")
+
+    if args.baseline:
+        print_comparison(report, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+from dotenv import load_dotenv
+
+_ = load_dotenv(override=True)
+
+import argparse
+
+parser = argparse.ArgumentParser(
+    description="Compares the embedded Qdrant and the NumPy vector store backends on synthetic vectors: ingestion, startup, search latency and result agreement"
+)
+parser.add_argument("--species", type=int, default=500, help="Number of synthetic species (one keyword point each)")
+parser.add_argument("--chunks", type=int, default=40, help="Number of chunk points per species")
+parser.add_argument("--dim", type=int, default=1024, help="Dense vector size")
+parser.add_argument("--vocabulary", type=int, default=30522, help="Sparse vocabulary size")
+parser.add_argument("--sparse-terms", type=int, default=24, help="Non-zero terms per sparse vector")
+parser.add_argument("-q", "--queries", type=int, default=200, help="Number of benchmark queries")
+parser.add_argument("-k", "--top-k", type=int, default=12, help="Results per query")
+parser.add_argument("--prefetch-limit", type=int, default=100, help="Candidates kept by each hybrid pre-selection")
+parser.add_argument("--dense-dtype", choices=["float32", "float16"], default="float32", help="Dense matrix dtype of the NumPy backend")
+parser.add_argument("-b", "--batch-size", type=int, default=256, help="Ingestion batch size")
+parser.add_argument("--seed", type=int, default=7, help="Random seed of the synthetic vectors and queries")
+parser.add_argument("-o", "--output", default="benchmark_vector_store.json", help="Path of the JSON report")
+args = parser.parse_args()
+
+import json
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+from qdrant_client.models import NamedSparseVector, NamedVector, SparseVector
+
+from models import VectorizableDocument
+from services import NumpyVectorStore, VectorStore
+from services.model_registry import get_rss_bytes
+from services.rag_pipeline import RETRIEVAL_PAYLOAD_FIELDS
+
+COLLECTION_NAME = "benchmark"
+SPARSE_VECTORS_NAME = "keywords"
+DENSE_VECTORS_NAME = "content"
+FILTER_URLS = 12
+
+
+class SyntheticEncoder:
+    # Returns precomputed vectors, so the benchmark measures the index and not the models
+    def __init__(self, dense_by_text: Dict[str, np.ndarray], sparse_by_text: Dict[str, Tuple[List[int], List[float]]]):
+        self.dense_by_text = dense_by_text
+        self.sparse_by_text = sparse_by_text
+
+    def encode_sparse_batch(self, texts: List[str], batch_size: int = 32) -> List[Tuple[List[int], List[float]]]:
+        return [self.sparse_by_text[text] for text in texts]
+
+    def encode_dense(self, texts: List[str], task: str, batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        return np.stack([self.dense_by_text[text] for text in texts])
+
+
+def generate_corpus(rng: np.random.Generator) -> Tuple[List[VectorizableDocument], List[VectorizableDocument], SyntheticEncoder]:
+    filler = " ".join(["Synthetic chunk content describing the pest, its hosts and its distribution."] * 25)
+    dense_by_text, sparse_by_text = {}, {}
+    keyword_documents, chunk_documents = [], []
+    for species in range(args.species):
+        keywords = f"species-{species}"
+        indices = rng.choice(args.vocabulary, args.sparse_terms, replace=False)
+        sparse_by_text[keywords] = (indices.tolist(), rng.random(args.sparse_terms).astype(np.float32).tolist())
+        metadata = {
+            "scientific_name": f"Species {species}",
+            "common_names": f"common name {species}",
+            "source_url": f"https://example.org/species/{species}",
+            "es_cuarentenaria": "Es cuarentenanaria" if species % 5 == 0 else "No es cuarentenanaria",
+        }
+        keyword_documents.append(VectorizableDocument(id=len(keyword_documents) + len(chunk_documents), text=keywords, metadata=metadata))
+        for chunk in range(args.chunks):
+            text = f"species-{species}-chunk-{chunk}"
+            dense_by_text[text] = rng.standard_normal(args.dim).astype(np.float32)
+            chunk_documents.append(
+                VectorizableDocument(
+                    id=len(keyword_documents) + len(chunk_documents),
+                    text=text,
+                    sparse_text=keywords,
+                    metadata={**metadata, "content_chunk": f"{text}: {filler}"},
+                )
+            )
+    return keyword_documents, chunk_documents, SyntheticEncoder(dense_by_text, sparse_by_text)
+
+
+def generate_queries(rng: np.random.Generator, encoder: SyntheticEncoder) -> List[Dict]:
+    # Queries lie near a random chunk and share part of its species keywords
+    queries = []
+    for _ in range(args.queries):
+        species = int(rng.integers(args.species))
+        chunk = int(rng.integers(args.chunks))
+        dense_vector = encoder.dense_by_text[f"species-{species}-chunk-{chunk}"]
+        dense_vector = dense_vector + 0.5 * rng.standard_normal(args.dim).astype(np.float32)
+        indices, values = encoder.sparse_by_text[f"species-{species}"]
+        terms = rng.choice(len(indices), max(1, len(indices) // 4), replace=False)
+        filter_species = {species, *rng.choice(args.species, FILTER_URLS - 1, replace=False).tolist()}
+        queries.append({
+            "dense": NamedVector(name=DENSE_VECTORS_NAME, vector=dense_vector.tolist()),
+            "sparse": NamedSparseVector(
+                name=SPARSE_VECTORS_NAME,
+                vector=SparseVector(indices=[indices[t] for t in terms], values=[values[t] for t in terms]),
+            ),
+            "filter": {"source_url": [f"https://example.org/species/{s}" for s in sorted(filter_species)]},
+        })
+    return queries
+
+
+def get_operations(vector_store) -> Dict:
+    # Operation name -> function running it for one query
+    operations = {
+        "dense_search": lambda query: vector_store.search(
+            COLLECTION_NAME, query["dense"], top_k=args.top_k, with_payload=RETRIEVAL_PAYLOAD_FIELDS
+        ),
+        "sparse_search": lambda query: vector_store.search(
+            COLLECTION_NAME, query["sparse"], top_k=args.prefetch_limit, with_payload=["source_url"]
+        ),
+        "filtered_dense_search": lambda query: vector_store.search(
+            COLLECTION_NAME, query["dense"], filter_criteria=query["filter"], top_k=args.top_k, with_payload=RETRIEVAL_PAYLOAD_FIELDS
+        ),
+    }
+    for mode in ("keyword_filtered", "rrf", "dbsf"):
+        operations[f"hybrid_{mode}"] = lambda query, mode=mode: vector_store.hybrid_search(
+            COLLECTION_NAME,
+            query["sparse"],
+            query["dense"],
+            mode=mode,
+            prefetch_limit=args.prefetch_limit,
+            top_k=args.top_k,
+            with_payload=RETRIEVAL_PAYLOAD_FIELDS,
+        )
+    return operations
+
+
+def summarize(durations: List[float]) -> Dict[str, float]:
+    total = sum(durations)
+    return {
+        "count": len(durations),
+        "mean_ms": float(np.mean(durations) * 1000),
+        "p50_ms": float(np.percentile(durations, 50) * 1000),
+        "p95_ms": float(np.percentile(durations, 95) * 1000),
+        "p99_ms": float(np.percentile(durations, 99) * 1000),
+        "throughput_per_sec": len(durations) / total if total else 0.0,
+    }
+
+
+def open_backend(backend: str, storage_path: str, encoder: SyntheticEncoder):
+    if backend == "numpy":
+        return NumpyVectorStore(storage_path, encoder, SPARSE_VECTORS_NAME, DENSE_VECTORS_NAME, dense_dtype=args.dense_dtype)
+    return VectorStore(storage_path, encoder, SPARSE_VECTORS_NAME, DENSE_VECTORS_NAME)
+
+
+def benchmark_backend(backend: str, storage_path: str, encoder: SyntheticEncoder, documents: List[Tuple[bool, List[VectorizableDocument]]], queries: List[Dict]) -> Tuple[Dict, Dict]:
+    print(f"# {backend}: indexing")
+    vector_store = open_backend(backend, storage_path, encoder)
+    start = time.perf_counter()
+    vector_store.create_collection(COLLECTION_NAME, dense_vector_size=args.dim)
+    total_points = 0
+    for use_dense, batch_documents in documents:
+        for batch_start in range(0, len(batch_documents), args.batch_size):
+            total_points += vector_store.add_documents(
+                COLLECTION_NAME,
+                batch_documents[batch_start:batch_start + args.batch_size],
+                use_sparse=True,
+                use_dense=use_dense,
+                verbose=False,
+            )
+    vector_store.flush(COLLECTION_NAME)
+    ingestion_seconds = time.perf_counter() - start
+    vector_store.close()
+
+    # A fresh instance, as a worker process would open it
+    rss_before = get_rss_bytes()
+    start = time.perf_counter()
+    vector_store = open_backend(backend, storage_path, encoder)
+    get_operations(vector_store)["hybrid_keyword_filtered"](queries[0])
+    startup_seconds = time.perf_counter() - start
+    rss_delta = get_rss_bytes() - rss_before
+
+    print(f"# {backend}: running {len(queries)} queries")
+    durations = defaultdict(list)
+    results = defaultdict(list)
+    for name, operation in get_operations(vector_store).items():
+        for query in queries:
+            start = time.perf_counter()
+            result = operation(query)
+            durations[name].append(time.perf_counter() - start)
+            results[name].append([point[0] for point in result])
+    vector_store.close()
+
+    report = {
+        "ingestion": {
+            "total_points": total_points,
+            "total_seconds": ingestion_seconds,
+            "points_per_sec": total_points / ingestion_seconds if ingestion_seconds else 0.0,
+        },
+        "startup_seconds": startup_seconds,
+        "startup_rss_delta_mb": rss_delta / 1024 ** 2,
+        "operations": {name: summarize(operation_durations) for name, operation_durations in durations.items()},
+    }
+    return report, results
+
+
+def agreement(reference: Dict[str, List[List]], results: Dict[str, List[List]]) -> Dict[str, float]:
+    # Mean share of the reference result ids also returned by the other backend
+    return {
+        name: float(np.mean([
+            len(set(expected) & set(found)) / len(expected) if expected else 1.0
+            for expected, found in zip(reference[name], results[name])
+        ]))
+        for name in reference
+    }
+
+
+def main():
+    rng = np.random.default_rng(args.seed)
+    keyword_documents, chunk_documents, encoder = generate_corpus(rng)
+    queries = generate_queries(rng, encoder)
+    documents = [(False, keyword_documents), (True, chunk_documents)]
+    print(f"# {len(keyword_documents)} keyword points, {len(chunk_documents)} chunk points of {args.dim} dimensions")
+
+    report = {"config": vars(args), "backends": {}}
+    backend_results = {}
+    for backend in ("qdrant", "numpy"):
+        storage_path = tempfile.mkdtemp(prefix=f"benchmark_{backend}_")
+        try:
+            report["backends"][backend], backend_results[backend] = benchmark_backend(
+                backend, storage_path, encoder, documents, queries
+            )
+        finally:
+            shutil.rmtree(storage_path, ignore_errors=True)
+    report["agreement"] = agreement(backend_results["qdrant"], backend_results["numpy"])
+
+    for backend, backend_report in report["backends"].items():
+        ingestion = backend_report["ingestion"]
+        print(
+            f"# {backend}: ingestion {ingestion['points_per_sec']:.0f} points/sec, "
+            f"startup {backend_report['startup_seconds'] * 1000:.0f} ms (+{backend_report['startup_rss_delta_mb']:.0f} MB)"
+        )
+    print("# Search latency (qdrant -> numpy) and agreement of the numpy results:")
+    for name, qdrant_summary in report["backends"]["qdrant"]["operations"].items():
+        numpy_summary = report["backends"]["numpy"]["operations"][name]
+        print(
+            f" - {name}: p50 {qdrant_summary['p50_ms']:.2f} -> {numpy_summary['p50_ms']:.2f} ms, "
+            f"p95 {qdrant_summary['p95_ms']:.2f} -> {numpy_summary['p95_ms']:.2f} ms, "
+            f"agreement {report['agreement'][name]:.1%}"
+        )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"# Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,161 +3,236 @@ from dotenv import load_dotenv
 _ = load_dotenv(override=True)
 
 import argparse
-
-parser = argparse.ArgumentParser(description="Vector store creation utility")
-parser.add_argument(
-    "-f",
-    "--force",
-    action="store_true",
-    help="Force recreation of vector store even if it already exists",
-)
-args = parser.parse_args()
-print("# Force recreation of vector store:", args.force)
-
 import os
-from typing import List
-
-from tqdm import tqdm
-from transformers import AutoTokenizer
-from langchain.text_splitter import TokenTextSplitter
-from transformers import logging as hf_logging
-
-hf_logging.set_verbosity_error()
-
-from services import VectorStore
-from services import TextEncoder
-from services import PlagueService
-from models import VectorizableDocument
 
 # Define constants for collection and vector names
 COLLECTION_NAME = os.getenv("COLLECTION_NAME")
 SPARSE_VECTORS_NAME = os.getenv("COLLECTION_SPARSE_VECTORS_NAME")
 DENSE_VECTORS_NAME = os.getenv("COLLECTION_DENSE_VECTORS_NAME")
+# PCA is fitted on a few evenly spread chunks of every species, up to the sample size
+PCA_CHUNKS_PER_SPECIES = 4
+
+
+# Chunking workers are spawned and import this file again: module level only loads the
+# settings, arguments are parsed and the services (torch, the models and qdrant) imported in main()
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Vector store creation utility")
+    update_mode = parser.add_mutually_exclusive_group()
+    update_mode.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="Force recreation of vector store even if it already exists",
+    )
+    update_mode.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        help="Only embed new or changed species and delete points of removed species (use --force after changing models or chunking)",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=256,
+        help="Number of documents encoded and upserted per batch",
+    )
+    parser.add_argument(
+        "--max-pending-batches",
+        type=int,
+        default=4,
+        help="Maximum number of prepared batches waiting for encoding (bounds memory usage)",
+    )
+    parser.add_argument(
+        "-w",
+        "--chunk-workers",
+        type=int,
+        default=min(4, os.cpu_count() or 1),
+        help="Number of processes splitting content into chunks, 0 chunks in the main process",
+    )
+    parser.add_argument(
+        "--dump-chunks",
+        action="store_true",
+        help="Write every content chunk to data/content_chunks/ for inspection and benchmarks",
+    )
+    return parser.parse_args()
+
+
+def update_collection_settings(vector_store):
+    # Existing collections get new payload indexes and quantization settings without a rebuild
+    created_indexes = vector_store.create_payload_indexes(COLLECTION_NAME)
+    if created_indexes:
+        print(f"# Payload indexes created: {', '.join(created_indexes)}")
+    if vector_store.update_quantization(COLLECTION_NAME):
+        print(f"# Dense quantization set to: {vector_store.quantization or 'none'}")
+
+
+def sample_content_chunks(chunker, sample_size: int):
+    from services import PlagueService
+
+    chunks = []
+    for plague in PlagueService().iter_plagues():
+        content_chunks = chunker.split_text(plague.content)
+        step = max(1, len(content_chunks) // PCA_CHUNKS_PER_SPECIES)
+        chunks.extend(content_chunks[::step][:PCA_CHUNKS_PER_SPECIES])
+        if len(chunks) >= sample_size:
+            break
+    return chunks[:sample_size]
+
+
+def create_dense_projection(text_encoder, vector_store, chunker):
+    """
+    Builds the projection selected by DENSE_DIMENSION and DENSE_PROJECTION for a new
+    collection and saves it next to it, or removes a previous one for full-size vectors.
+    """
+    from services import DenseProjection
+    from services.dense_projection import get_dense_projection_path
+
+    projection_path = get_dense_projection_path(vector_store.storage_path, COLLECTION_NAME)
+    full_dimension = text_encoder.get_full_dense_embedding_size()
+    dimension = int(os.getenv("DENSE_DIMENSION", "0"))
+    if dimension <= 0 or dimension >= full_dimension:
+        if os.path.exists(projection_path):
+            os.remove(projection_path)
+        return None
+
+    projection_type = os.getenv("DENSE_PROJECTION", "matryoshka")
+    if projection_type == "pca":
+        chunks = sample_content_chunks(chunker, int(os.getenv("DENSE_PROJECTION_SAMPLE_SIZE", "4096")))
+        print(f"# Fitting a {dimension}-dimension PCA projection on {len(chunks)} content chunks...")
+        dense_projection = DenseProjection.fit_pca(
+            text_encoder.encode_dense(chunks, "retrieval.passage", batch_size=32, show_progress_bar=True), dimension
+        )
+        print(f"# PCA explained variance: {dense_projection.explained_variance:.1%}")
+    else:
+        dense_projection = DenseProjection.matryoshka(full_dimension, dimension)
+    os.makedirs(os.path.dirname(projection_path) or ".", exist_ok=True)
+    dense_projection.save(projection_path)
+    return dense_projection
+
 
+def load_dense_projection(text_encoder, vector_store):
+    # Existing collections keep the projection they were built with, changing it requires --force
+    from services import DenseProjection
+    from services.dense_projection import get_dense_projection_path
 
-def get_safe_filename(filename: str, word_limit=5):
-    words = filename.split()
-    limited_name = " ".join(words[:word_limit])
-    safe_filename = "".join(
-        c for c in limited_name if c.isalnum() or c in (" ", "_", "-")
-    ).rstrip()
-    return safe_filename
+    dense_projection = DenseProjection.load(get_dense_projection_path(vector_store.storage_path, COLLECTION_NAME))
+    text_encoder.set_dense_projection(dense_projection)
+    configured_dimension = int(os.getenv("DENSE_DIMENSION", "0"))
+    stored_dimension = dense_projection.output_dim if dense_projection is not None else 0
+    if configured_dimension != stored_dimension:
+        print(f"# DENSE_DIMENSION={configured_dimension} differs from the collection ({stored_dimension or 'full'}), use --force to rebuild it")
+    return dense_projection
 
 
 def main():
-    plagues = PlagueService().get_plagues()
+    args = parse_args()
+    print("# Force recreation of vector store:", args.force)
+    print("# Incremental update of vector store:", args.incremental)
+
+    from transformers import logging as hf_logging
+
+    hf_logging.set_verbosity_error()
+
+    from services import open_vector_store
+    from services import TextEncoder
+    from services import PlagueService
+    from services import IngestionPipeline
+    from services import EmbeddingCache
+    from services.metrics import collect_cache_metrics, configure_metrics, metrics
+    from services.species_gazetteer import build_species_gazetteer
+    from text_chunker import TokenChunker
+
+    configure_metrics()
+
+    # Reuse embeddings of unchanged texts across rebuilds when a cache directory is configured
+    embedding_cache = None
+    if os.getenv("EMBEDDING_CACHE_DIR"):
+        embedding_cache = EmbeddingCache(
+            os.getenv("EMBEDDING_CACHE_DIR"),
+            max_size_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_SIZE_MB", "4096")) * 1024 * 1024,
+            dtype=os.getenv("EMBEDDING_CACHE_DTYPE", "float32"),
+        )
+        print(f"# Embedding cache enabled at: {os.getenv('EMBEDDING_CACHE_DIR')}")
+        if metrics.enabled:
+            metrics.add_collector(lambda: collect_cache_metrics({"embeddings": embedding_cache}))
 
     # Initialize the text encoder with sparse and dense models
     text_encoder = TextEncoder(
         sparse_model_name=os.getenv("SPARSE_EMBEDDINGS_MODEL_NAME"),
         dense_model_name=os.getenv("DENSE_EMBEDDINGS_MODEL_NAME"),
+        embedding_cache=embedding_cache,
+        inference_precision=os.getenv("INFERENCE_PRECISION", "fp32"),
+        inference_backend=os.getenv("INFERENCE_BACKEND", "torch"),
+        onnx_cache_dir=os.getenv("ONNX_CACHE_DIR", "onnx_models"),
+        onnx_num_threads=int(os.getenv("ONNX_NUM_THREADS", "0")),
     )
 
-    # Initialize the vector store with storage path and encoder
-    vector_store = VectorStore(
-        "qdrant_storage", text_encoder, SPARSE_VECTORS_NAME, DENSE_VECTORS_NAME
-    )
-    print("# Initializing VectorStore")
+    # Initialize the vector store backend selected by VECTOR_STORE_BACKEND
+    vector_store = open_vector_store(text_encoder, SPARSE_VECTORS_NAME, DENSE_VECTORS_NAME)
+    print(f"# Initializing {type(vector_store).__name__}")
 
     # Check if the collection already exists
     collection_exists = vector_store.collection_exists(COLLECTION_NAME)
 
-    current_id = 0
-    if not collection_exists or args.force:
-        # Create a new collection if it doesn't exist or if forced
-        vector_store.create_collection(
-            COLLECTION_NAME, dense_vector_size=text_encoder.get_dense_embedding_size()
-        )
-
-        print("# Preparing documents for sparse embeddings")
-        documents_for_sparse_embeddings = []
-        for plague_data in plagues:
-            current_id += 1
-            documents_for_sparse_embeddings.append(
-                VectorizableDocument(
-                    id=current_id,
-                    text=plague_data.keywords,
-                    metadata={
-                        "scientific_name": plague_data.scientific_name,
-                        "common_names": plague_data.common_names,
-                        "source_url": plague_data.source_url,
-                        "es_cuarentenaria": plague_data.is_quarantine
-                    },
-                )
-            )
-
-        print(
-            f"# Total vectorizable documents for sparse embeddings: {len(documents_for_sparse_embeddings)}"
-        )
-
-        # Add sparse embeddings to the vector store
-        print("# Building sparse embeddings...")
-        vector_store.add_documents(
-            COLLECTION_NAME, documents_for_sparse_embeddings, use_sparse=True
-        )
-
+    if not collection_exists or args.force or args.incremental:
         # Define chunking parameters for splitting text into smaller pieces
         chunk_size = 400
         chunk_overlap = 80
 
-        # Initialize tokenizer for dense embeddings
-        tokenizer = AutoTokenizer.from_pretrained(
-            os.getenv("DENSE_EMBEDDINGS_MODEL_NAME"), trust_remote_code=True
+        # Chunk sizes are counted in tokens of the dense embeddings model
+        chunker = TokenChunker(
+            os.getenv("DENSE_EMBEDDINGS_MODEL_NAME"), chunk_size=chunk_size, chunk_overlap=chunk_overlap
         )
 
-        # Initialize text splitter using the tokenizer
-        text_splitter = TokenTextSplitter.from_huggingface_tokenizer(
-            tokenizer=tokenizer, chunk_size=chunk_size, chunk_overlap=chunk_overlap
-        )
+        if not collection_exists or args.force:
+            # Dense vectors are stored at the reduced dimension when DENSE_DIMENSION is set
+            dense_projection = create_dense_projection(text_encoder, vector_store, chunker)
+            text_encoder.set_dense_projection(dense_projection)
+            print(f"# Dense vectors size: {text_encoder.get_dense_embedding_size()} ({dense_projection or 'full'})")
 
-        if not os.path.exists("data/content_chunks"):
-            os.makedirs("data/content_chunks", exist_ok=True)
-
-        # Prepare documents for dense embeddings
-        documents_for_dense_embeddings: List[VectorizableDocument] = []
-        for plague_data in plagues:
-            content_chunks = text_splitter.split_text(plague_data.content)
-            for content_chunk in content_chunks:
-
-                # Save content chunks to a file for debugging or inspection
-                safe_filename = get_safe_filename(plague_data.scientific_name)
-                with open(
-                    f"data/content_chunks/{safe_filename}.txt",
-                    "a",
-                    encoding="utf-8",
-                ) as f:
-                    f.write(content_chunk + "\n")
-                    f.write(f"Text Len: {len(content_chunk)}\n")
-                    f.write("-" * 80 + "\n")
-
-                current_id += 1
-                documents_for_dense_embeddings.append(
-                    VectorizableDocument(
-                        id=current_id,
-                        text=content_chunk,
-                        metadata={
-                            "scientific_name": plague_data.scientific_name,
-                            "common_names": plague_data.common_names,
-                            "source_url": plague_data.source_url,
-                            "content_chunk": content_chunk,
-                            "es_cuarentenaria": plague_data.is_quarantine
-                        },
-                    )
-                )
-
-        print(
-            f"# Total vectorizable documents for dense embeddings: {len(documents_for_dense_embeddings)}"
-        )
-
-        # Add dense embeddings to the vector store
-        print("# Building dense embeddings")
-        vector_store.add_documents(
-            COLLECTION_NAME, documents_for_dense_embeddings, use_dense=True
+            # Create a new collection if it doesn't exist or if forced
+            vector_store.create_collection(
+                COLLECTION_NAME, dense_vector_size=text_encoder.get_dense_embedding_size()
+            )
+        else:
+            load_dense_projection(text_encoder, vector_store)
+
+        # Stream source rows through chunking, encoding and upserting in bounded batches
+        pipeline = IngestionPipeline(
+            vector_store,
+            COLLECTION_NAME,
+            chunker,
+            batch_size=args.batch_size,
+            max_pending_batches=args.max_pending_batches,
+            chunk_workers=args.chunk_workers,
+            chunks_dump_dir="data/content_chunks" if args.dump_chunks else None,
         )
+        if collection_exists and args.incremental:
+            update_collection_settings(vector_store)
+            print("# Updating new and changed sparse and dense embeddings...")
+            total_points, deleted_points = pipeline.run_incremental(PlagueService().iter_plagues())
+            print(f"# Total points saved to Qdrant: {total_points}")
+            print(f"# Total stale points deleted from Qdrant: {deleted_points}")
+        else:
+            print("# Building sparse and dense embeddings...")
+            total_points = pipeline.run(PlagueService().iter_plagues())
+            print(f"# Total points saved to Qdrant: {total_points}")
+
+        # Rebuild the query-side species gazetteer so it matches the indexed catalogue
+        gazetteer_path = os.getenv("SPECIES_GAZETTEER_PATH", "data/species_gazetteer.pkl")
+        build_species_gazetteer(PlagueService().iter_species_names()).save(gazetteer_path)
+        print(f"# Species gazetteer saved to: {gazetteer_path}")
 
     else:
         # Skip creation if the collection already exists
         print(f"# Collection '{COLLECTION_NAME}' already exists. Skipping creation.")
+        load_dense_projection(text_encoder, vector_store)
+        update_collection_settings(vector_store)
+
+    if embedding_cache is not None:
+        print("# Embedding cache stats:", embedding_cache.stats())
+        embedding_cache.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+from dotenv import load_dotenv
+
+_ = load_dotenv(override=True)
+
+import argparse
+
+parser = argparse.ArgumentParser(description="Compare reduced dense embedding dimensions: retrieval quality, search latency and size")
+parser.add_argument(
+    "-n",
+    "--limit",
+    type=int,
+    default=1024,
+    help="Number of content chunks used as the retrieval corpus",
+)
+parser.add_argument(
+    "-q",
+    "--queries",
+    type=int,
+    default=64,
+    help="Number of species names from the sampled chunks used as queries",
+)
+parser.add_argument(
+    "-k",
+    "--top-k",
+    type=int,
+    default=10,
+    help="Top-k used to measure recall against the full dimension",
+)
+parser.add_argument(
+    "-d",
+    "--dimensions",
+    default="768,512,256,128,64",
+    help="Comma-separated reduced dimensions to evaluate",
+)
+parser.add_argument(
+    "-p",
+    "--projections",
+    default="matryoshka,pca",
+    help="Comma-separated projections to evaluate (matryoshka only suits models trained for it)",
+)
+parser.add_argument(
+    "--latency-corpus-size",
+    type=int,
+    default=100000,
+    help="Rows of the matrix searched to measure latency, the corpus vectors repeated",
+)
+parser.add_argument("-o", "--output", help="Optional path of a JSON report")
+args = parser.parse_args()
+
+import json
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from services import DenseProjection
+from services import EmbeddingCache
+from services import TextEncoder
+from services.ingestion_pipeline import iter_content_chunks
+
+
+def get_top_k(scores: np.ndarray, k: int) -> List[int]:
+    return list(np.argsort(-scores, kind="stable")[:k])
+
+
+def get_overlap(reference: List[List[int]], candidate: List[List[int]]) -> float:
+    return float(np.mean([len(set(r) & set(c)) / len(r) for r, c in zip(reference, candidate) if r]))
+
+
+def summarize_latencies(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "mean_ms": float(np.mean(latencies) * 1000),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+    }
+
+
+def evaluate_dimension(name: str, chunk_embeddings: np.ndarray, query_embeddings: np.ndarray) -> Dict:
+    # Vectors are normalized, cosine similarity is a dot product as in both vector store backends
+    top_k = [get_top_k(chunk_embeddings @ query_embedding, args.top_k) for query_embedding in query_embeddings]
+
+    latency_corpus = np.resize(chunk_embeddings, (args.latency_corpus_size, chunk_embeddings.shape[1]))
+    latencies = []
+    for query_embedding in query_embeddings:
+        start = time.perf_counter()
+        scores = latency_corpus @ query_embedding
+        np.argpartition(-scores, args.top_k)[:args.top_k]
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        "projection": name,
+        "dimension": int(chunk_embeddings.shape[1]),
+        "bytes_per_vector": int(chunk_embeddings.shape[1] * 4),
+        "latency_corpus_mb": latency_corpus.nbytes / 1024 ** 2,
+        "search_latency": summarize_latencies(latencies),
+        "top_k": top_k,
+    }
+
+
+def main():
+    dimensions = [int(dimension) for dimension in args.dimensions.split(",") if dimension.strip()]
+    projections = [projection.strip() for projection in args.projections.split(",") if projection.strip()]
+    sampled = []
+    for name, text in iter_content_chunks():
+        sampled.append((name, text))
+        if len(sampled) >= args.limit:
+            break
+    chunks = [text for _, text in sampled]
+    queries = list(dict.fromkeys(name for name, _ in sampled))[:args.queries]
+    print(f"# Evaluating {projections} at {dimensions} dimensions on {len(chunks)} chunks and {len(queries)} queries")
+
+    # Full embeddings are computed once, every projection is applied to the same vectors
+    embedding_cache = None
+    if os.getenv("EMBEDDING_CACHE_DIR"):
+        embedding_cache = EmbeddingCache(os.getenv("EMBEDDING_CACHE_DIR"))
+    text_encoder = TextEncoder(
+        sparse_model_name=os.getenv("SPARSE_EMBEDDINGS_MODEL_NAME"),
+        dense_model_name=os.getenv("DENSE_EMBEDDINGS_MODEL_NAME"),
+        embedding_cache=embedding_cache,
+        inference_precision=os.getenv("INFERENCE_PRECISION", "fp32"),
+        inference_backend=os.getenv("INFERENCE_BACKEND", "torch"),
+    )
+    chunk_embeddings = text_encoder.encode_dense(chunks, "retrieval.passage")
+    query_embeddings = np.asarray(text_encoder.encode_dense(queries, "retrieval.query"), dtype=np.float32)
+    chunk_embeddings /= np.linalg.norm(chunk_embeddings, axis=1, keepdims=True)
+    query_embeddings /= np.linalg.norm(query_embeddings, axis=1, keepdims=True)
+    full_dimension = chunk_embeddings.shape[1]
+
+    baseline = evaluate_dimension("full", chunk_embeddings, query_embeddings)
+    reports = [baseline]
+    for projection_type in projections:
+        for dimension in dimensions:
+            if dimension >= full_dimension:
+                continue
+            start = time.perf_counter()
+            if projection_type == "pca":
+                # Fitted on the evaluated corpus, as create_vector_store.py fits it on the indexed one
+                dense_projection = DenseProjection.fit_pca(chunk_embeddings, min(dimension, len(chunks)))
+            else:
+                dense_projection = DenseProjection.matryoshka(full_dimension, dimension)
+            fit_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            projected_queries = dense_projection.project(query_embeddings)
+            projection_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            report = evaluate_dimension(projection_type, dense_projection.project(chunk_embeddings), projected_queries)
+            report["fit_seconds"] = fit_seconds
+            report["query_projection_ms"] = projection_ms
+            report["explained_variance"] = dense_projection.explained_variance
+            reports.append(report)
+
+    reference_top_k = baseline["top_k"]
+    for report in reports:
+        report[f"recall@{args.top_k}"] = get_overlap(reference_top_k, report.pop("top_k"))
+
+    for report in reports:
+        latency = report["search_latency"]
+        explained_variance = report.get("explained_variance")
+        print(f"# {report['projection']} {report['dimension']} dimensions")
+        print(f" - recall@{args.top_k} against {full_dimension} dimensions: {report[f'recall@{args.top_k}']:.2%}")
+        if explained_variance is not None:
+            print(f" - PCA explained variance: {explained_variance:.1%}")
+        print(f" - size: {report['bytes_per_vector']} bytes per vector, {report['latency_corpus_mb']:.0f} MB for {args.latency_corpus_size} vectors")
+        print(f" - search latency over {args.latency_corpus_size} vectors: mean {latency['mean_ms']:.2f} ms, p50 {latency['p50_ms']:.2f} ms, p95 {latency['p95_ms']:.2f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+        print(f"# Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+from dotenv import load_dotenv
+
+_ = load_dotenv(override=True)
+
+import argparse
+
+parser = argparse.ArgumentParser(description="Compare fp32 and int8 inference: latency, memory and retrieval agreement")
+parser.add_argument(
+    "-n",
+    "--limit",
+    type=int,
+    default=256,
+    help="Number of content chunks used as the retrieval corpus",
+)
+parser.add_argument(
+    "-q",
+    "--queries",
+    type=int,
+    default=32,
+    help="Number of species names from the sampled chunks used as queries",
+)
+parser.add_argument(
+    "-k",
+    "--top-k",
+    type=int,
+    default=10,
+    help="Top-k used to measure retrieval agreement against fp32",
+)
+parser.add_argument(
+    "-p",
+    "--precisions",
+    default="fp32,int8",
+    help="Comma-separated inference precisions to evaluate, fp32 first",
+)
+parser.add_argument(
+    "-B",
+    "--backend",
+    choices=("torch", "onnx"),
+    default="torch",
+    help="Inference backend used for every evaluated precision",
+)
+parser.add_argument("-o", "--output", help="Optional path of a JSON report")
+args = parser.parse_args()
+
+import io
+import json
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+import torch
+
+from services import TextEncoder
+from services import Reranker
+from services import model_registry
+from services.ingestion_pipeline import iter_content_chunks
+
+
+def get_rss_mb() -> float:
+    # Current resident set size, Linux only
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+
+
+def get_model_size_mb(model) -> float:
+    if not isinstance(model, torch.nn.Module):
+        # ONNX graph and its external weight files
+        model_dir = os.path.dirname(model.model_path)
+        return sum(os.path.getsize(os.path.join(model_dir, name)) for name in os.listdir(model_dir)) / 1024 ** 2
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes / 1024 ** 2
+
+
+def get_top_k(scores: np.ndarray, k: int) -> List[int]:
+    return list(np.argsort(-scores, kind="stable")[:k])
+
+
+def get_overlap(reference: List[List[int]], candidate: List[List[int]]) -> float:
+    return float(np.mean([len(set(r) & set(c)) / len(r) for r, c in zip(reference, candidate) if r]))
+
+
+def summarize_latencies(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "mean_ms": float(np.mean(latencies) * 1000),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+    }
+
+
+def evaluate_precision(precision: str, chunks: List[str], queries: List[str], candidate_ids: List[List[int]]) -> Dict:
+    report = {"precision": precision, "backend": args.backend}
+    rss_before = get_rss_mb()
+
+    text_encoder = TextEncoder(
+        sparse_model_name=os.getenv("SPARSE_EMBEDDINGS_MODEL_NAME"),
+        dense_model_name=os.getenv("DENSE_EMBEDDINGS_MODEL_NAME"),
+        inference_precision=precision,
+        inference_backend=args.backend,
+    )
+    text_encoder.load_sparse_model()
+    text_encoder.load_dense_model()
+    reranker = Reranker(os.getenv("RERANKER_MODEL_NAME"), inference_precision=precision, inference_backend=args.backend)
+
+    report["rss_delta_mb"] = get_rss_mb() - rss_before
+    report["model_size_mb"] = {
+        "sparse": get_model_size_mb(text_encoder.sparse_model),
+        "dense": get_model_size_mb(text_encoder.dense_model),
+        "reranker": get_model_size_mb(getattr(reranker.model, "model", reranker.model)),
+    }
+
+    # Corpus encoding throughput
+    start = time.perf_counter()
+    dense_embeddings = text_encoder.encode_dense(chunks, "retrieval.passage")
+    report["dense_chunks_per_sec"] = len(chunks) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    sparse_embeddings = text_encoder.encode_sparse_batch(chunks)
+    report["sparse_chunks_per_sec"] = len(chunks) / (time.perf_counter() - start)
+
+    vocab_size = len(text_encoder.sparse_tokenizer)
+    sparse_matrix = np.zeros((len(chunks), vocab_size), dtype=np.float32)
+    for row, (indices, values) in enumerate(sparse_embeddings):
+        sparse_matrix[row, indices] = values
+    dense_embeddings /= np.linalg.norm(dense_embeddings, axis=1, keepdims=True)
+
+    # Per-query latency and retrieval
+    dense_latencies, sparse_latencies, reranker_latencies = [], [], []
+    dense_top_k, sparse_top_k, reranker_top_k = [], [], []
+    for query, candidates in zip(queries, candidate_ids):
+        start = time.perf_counter()
+        query_dense = np.asarray(text_encoder.encode_dense(query, "retrieval.query"), dtype=np.float32)
+        dense_latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        query_indices, query_values = text_encoder.encode_sparse(query)
+        sparse_latencies.append(time.perf_counter() - start)
+
+        dense_top_k.append(get_top_k(dense_embeddings @ (query_dense / np.linalg.norm(query_dense)), args.top_k))
+        sparse_top_k.append(get_top_k(sparse_matrix[:, query_indices] @ np.asarray(query_values, dtype=np.float32), args.top_k))
+
+        # Every precision reranks the same fp32 dense candidates
+        start = time.perf_counter()
+        scores = reranker.compute_scores(query, [(idx, chunks[idx]) for idx in candidates])
+        reranker_latencies.append(time.perf_counter() - start)
+        reranker_top_k.append([candidates[idx] for idx in get_top_k(np.asarray(scores), max(1, args.top_k // 2))])
+
+    report["latency"] = {
+        "dense_query": summarize_latencies(dense_latencies),
+        "sparse_query": summarize_latencies(sparse_latencies),
+        "reranker": summarize_latencies(reranker_latencies),
+    }
+    report["top_k"] = {"dense": dense_top_k, "sparse": sparse_top_k, "reranker": reranker_top_k}
+
+    del text_encoder, reranker, sparse_matrix
+    model_registry.clear()
+    return report
+
+
+def main():
+    precisions = [precision.strip() for precision in args.precisions.split(",") if precision.strip()]
+    sampled = []
+    for name, text in iter_content_chunks():
+        sampled.append((name, text))
+        if len(sampled) >= args.limit:
+            break
+    chunks = [text for _, text in sampled]
+    queries = list(dict.fromkeys(name for name, _ in sampled))[:args.queries]
+    print(f"# Evaluating {precisions} ({args.backend}) on {len(chunks)} chunks and {len(queries)} queries")
+
+    # Reranker candidates come from an fp32 dense search so every precision reranks the same set
+    reference_encoder = TextEncoder(
+        sparse_model_name=os.getenv("SPARSE_EMBEDDINGS_MODEL_NAME"),
+        dense_model_name=os.getenv("DENSE_EMBEDDINGS_MODEL_NAME"),
+    )
+    chunk_embeddings = reference_encoder.encode_dense(chunks, "retrieval.passage")
+    query_embeddings = reference_encoder.encode_dense(queries, "retrieval.query")
+    candidate_ids = [get_top_k(chunk_embeddings @ query_embedding, args.top_k) for query_embedding in query_embeddings]
+    del reference_encoder
+    model_registry.clear()
+
+    reports = [evaluate_precision(precision, chunks, queries, candidate_ids) for precision in precisions]
+
+    baseline = reports[0]
+    for report in reports:
+        report["agreement_with_" + baseline["precision"]] = {
+            kind: get_overlap(baseline["top_k"][kind], report["top_k"][kind]) for kind in ("dense", "sparse", "reranker")
+        }
+        del report["top_k"]
+
+    for report in reports:
+        print(f"# Precision: {report['precision']}")
+        print(f" - RSS delta after loading: {report['rss_delta_mb']:.0f} MB")
+        for name, size in report["model_size_mb"].items():
+            print(f" - {name} model size: {size:.0f} MB")
+        print(f" - Dense corpus encoding: {report['dense_chunks_per_sec']:.2f} chunks/sec")
+        print(f" - Sparse corpus encoding: {report['sparse_chunks_per_sec']:.2f} chunks/sec")
+        for name, latency in report["latency"].items():
+            print(f" - {name} latency: mean {latency['mean_ms']:.1f} ms, p50 {latency['p50_ms']:.1f} ms, p95 {latency['p95_ms']:.1f} ms")
+        for name, overlap in report["agreement_with_" + baseline["precision"]].items():
+            print(f" - {name} top-k overlap with {baseline['precision']}: {overlap:.2%}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+        print(f"# Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
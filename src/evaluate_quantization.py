@@ -0,0 +1,189 @@
+from dotenv import load_dotenv
+
+_ = load_dotenv(override=True)
+
+import argparse
+import os
+
+parser = argparse.ArgumentParser(
+    description="Evaluate dense vector quantization of the NumPy vector store: recall@k against unquantized search, latency and RAM saved"
+)
+parser.add_argument("--storage-path", default=os.getenv("NUMPY_STORAGE_PATH", "numpy_storage"), help="NumPy vector store holding the evaluated collection")
+parser.add_argument("--collection", default=os.getenv("COLLECTION_NAME"), help="Name of the evaluated collection")
+parser.add_argument("--synthetic", type=int, default=0, help="Evaluate on this many synthetic clustered vectors instead of a stored collection")
+parser.add_argument("--dim", type=int, default=1024, help="Dense vector size of the synthetic vectors")
+parser.add_argument("-q", "--queries", type=int, default=200, help="Number of queries, stored chunk vectors with added noise")
+parser.add_argument("--query-noise", type=float, default=0.5, help="Norm of the noise added to the query vectors (stored vectors have norm 1)")
+parser.add_argument("-k", "--top-k", type=int, default=12, help="Top-k used for recall")
+parser.add_argument("--quantizations", default="int8,binary", help="Comma-separated quantizations to evaluate")
+parser.add_argument("--oversampling", default="1,2,4", help="Comma-separated oversampling factors to evaluate")
+parser.add_argument("--seed", type=int, default=7, help="Random seed of the queries and synthetic vectors")
+parser.add_argument("-o", "--output", help="Optional path of a JSON report")
+args = parser.parse_args()
+
+import json
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+from qdrant_client.models import NamedVector
+
+from models import VectorizableDocument
+from services import NumpyVectorStore
+
+SPARSE_VECTORS_NAME = os.getenv("COLLECTION_SPARSE_VECTORS_NAME", "keywords")
+DENSE_VECTORS_NAME = os.getenv("COLLECTION_DENSE_VECTORS_NAME", "content")
+
+
+class ArrayEncoder:
+    # Serves the synthetic vectors through the TextEncoder interface used by add_documents
+    def __init__(self, vectors_by_text: Dict[str, np.ndarray]):
+        self.vectors_by_text = vectors_by_text
+
+    def encode_sparse_batch(self, texts: List[str], batch_size: int = 32):
+        return [([0], [1.0]) for _ in texts]
+
+    def encode_dense(self, texts: List[str], task: str, batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        return np.stack([self.vectors_by_text[text] for text in texts])
+
+
+def create_synthetic_collection(storage_path: str, collection_name: str, rng: np.random.Generator):
+    # Clustered vectors, closer to text embeddings than isotropic noise
+    centers = rng.standard_normal((max(1, args.synthetic // 100), args.dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=args.synthetic)]
+    vectors = vectors + 0.7 * rng.standard_normal(vectors.shape).astype(np.float32)
+    vectors_by_text = {f"chunk-{idx}": vector for idx, vector in enumerate(vectors)}
+
+    vector_store = NumpyVectorStore(storage_path, ArrayEncoder(vectors_by_text), SPARSE_VECTORS_NAME, DENSE_VECTORS_NAME)
+    vector_store.create_collection(collection_name, dense_vector_size=args.dim)
+    documents = [
+        VectorizableDocument(id=idx, text=text, metadata={"content_chunk": text})
+        for idx, text in enumerate(vectors_by_text)
+    ]
+    for start in range(0, len(documents), 1024):
+        vector_store.add_documents(collection_name, documents[start:start + 1024], use_dense=True, verbose=False)
+    vector_store.close()
+
+
+def open_copy(source_path: str, collection_name: str, quantization: str) -> NumpyVectorStore:
+    # Each quantization is evaluated on its own copy, the source collection is never modified
+    storage_path = tempfile.mkdtemp(prefix=f"evaluate_{quantization}_")
+    shutil.copytree(os.path.join(source_path, collection_name), os.path.join(storage_path, collection_name))
+    vector_store = NumpyVectorStore(
+        storage_path,
+        None,
+        SPARSE_VECTORS_NAME,
+        DENSE_VECTORS_NAME,
+        quantization=None if quantization == "none" else quantization,
+    )
+    vector_store.update_quantization(collection_name)
+    return vector_store
+
+
+def generate_queries(vector_store: NumpyVectorStore, collection_name: str, rng: np.random.Generator) -> List[NamedVector]:
+    collection = vector_store.get_collection(collection_name)
+    rows = rng.choice(collection.dense_rows, size=min(args.queries, len(collection.dense_rows)), replace=False)
+    queries = []
+    for row in rows:
+        vector = np.asarray(collection.dense[row], dtype=np.float32)
+        noise = rng.standard_normal(len(vector)).astype(np.float32)
+        vector = vector / np.linalg.norm(vector) + args.query_noise * noise / np.linalg.norm(noise)
+        queries.append(NamedVector(name=DENSE_VECTORS_NAME, vector=vector.tolist()))
+    return queries
+
+
+def run_queries(vector_store: NumpyVectorStore, collection_name: str, queries: List[NamedVector], **search_options) -> Dict:
+    latencies, top_k_ids = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results = vector_store.search(collection_name, query, top_k=args.top_k, with_payload=False, **search_options)
+        latencies.append(time.perf_counter() - start)
+        top_k_ids.append([result[0] for result in results])
+    return {
+        "latency": {
+            "mean_ms": float(np.mean(latencies) * 1000),
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        },
+        "top_k": top_k_ids,
+    }
+
+
+def get_recall(reference: List[List], candidate: List[List]) -> float:
+    return float(np.mean([len(set(r) & set(c)) / len(r) for r, c in zip(reference, candidate) if r]))
+
+
+def main():
+    rng = np.random.default_rng(args.seed)
+    quantizations = [quantization.strip() for quantization in args.quantizations.split(",") if quantization.strip()]
+    oversampling_factors = [float(factor) for factor in args.oversampling.split(",") if factor.strip()]
+    collection_name = args.collection or "evaluation"
+
+    source_path = args.storage_path
+    synthetic_path = None
+    if args.synthetic:
+        synthetic_path = source_path = tempfile.mkdtemp(prefix="evaluate_synthetic_")
+        print(f"# Creating {args.synthetic} synthetic vectors of {args.dim} dimensions")
+        create_synthetic_collection(source_path, collection_name, rng)
+    elif not os.path.exists(os.path.join(source_path, collection_name)):
+        raise SystemExit(f"# Collection '{collection_name}' not found in {source_path}, build it with VECTOR_STORE_BACKEND=numpy or use --synthetic")
+
+    vector_stores = {}
+    try:
+        for quantization in ["none", *quantizations]:
+            vector_stores[quantization] = open_copy(source_path, collection_name, quantization)
+
+        exact_store = vector_stores["none"]
+        exact_collection = exact_store.get_collection(collection_name)
+        queries = generate_queries(exact_store, collection_name, rng)
+        print(f"# Evaluating {quantizations} on {len(exact_collection.dense_rows)} vectors with {len(queries)} queries")
+
+        exact = run_queries(exact_store, collection_name, queries)
+        exact_ram_mb = exact_collection.dense.nbytes / 1024 ** 2
+        reports = [{"quantization": "none", "latency": exact["latency"], f"recall@{args.top_k}": 1.0, "index_ram_mb": exact_ram_mb}]
+
+        for quantization in quantizations:
+            collection = vector_stores[quantization].get_collection(collection_name)
+            index_ram_mb = collection.quantized.nbytes / 1024 ** 2
+            for oversampling in oversampling_factors:
+                for rescore in (True, False):
+                    result = run_queries(
+                        vector_stores[quantization], collection_name, queries, oversampling=oversampling, rescore=rescore
+                    )
+                    reports.append({
+                        "quantization": quantization,
+                        "oversampling": oversampling,
+                        "rescore": rescore,
+                        "latency": result["latency"],
+                        f"recall@{args.top_k}": get_recall(exact["top_k"], result["top_k"]),
+                        "index_ram_mb": index_ram_mb,
+                        "ram_saved_mb": exact_ram_mb - index_ram_mb,
+                    })
+    finally:
+        for vector_store in vector_stores.values():
+            shutil.rmtree(vector_store.storage_path, ignore_errors=True)
+        if synthetic_path is not None:
+            shutil.rmtree(synthetic_path, ignore_errors=True)
+
+    # The exact index must be fully in RAM (or the page cache) to be scanned at this speed,
+    # a quantized one only keeps the quantized vectors there and reads the rescored originals
+    print(f"# Exact search: p50 {exact['latency']['p50_ms']:.2f} ms, p95 {exact['latency']['p95_ms']:.2f} ms, {exact_ram_mb:.1f} MB in RAM")
+    for report in reports[1:]:
+        latency = report["latency"]
+        print(
+            f" - {report['quantization']} x{report['oversampling']:g}{' rescored' if report['rescore'] else ''}: "
+            f"recall@{args.top_k} {report[f'recall@{args.top_k}']:.3f}, "
+            f"p50 {latency['p50_ms']:.2f} ms, p95 {latency['p95_ms']:.2f} ms, "
+            f"{report['index_ram_mb']:.1f} MB in RAM ({report['ram_saved_mb']:.1f} MB saved)"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "reports": reports}, f, indent=2)
+        print(f"# Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
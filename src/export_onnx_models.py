@@ -0,0 +1,118 @@
+from dotenv import load_dotenv
+
+_ = load_dotenv(override=True)
+
+import argparse
+
+parser = argparse.ArgumentParser(
+    description="Export the sparse, dense and reranker models to ONNX and check them against the PyTorch models"
+)
+parser.add_argument(
+    "-n",
+    "--limit",
+    type=int,
+    default=64,
+    help="Number of content chunks used for the equivalence check",
+)
+parser.add_argument(
+    "--atol",
+    type=float,
+    default=1e-3,
+    help="Maximum absolute difference accepted between fp32 ONNX and PyTorch outputs",
+)
+parser.add_argument(
+    "--skip-check",
+    action="store_true",
+    help="Only export (and quantize) the models, without comparing them to PyTorch",
+)
+args = parser.parse_args()
+
+import os
+import sys
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from services import TextEncoder
+from services import Reranker
+from services.ingestion_pipeline import iter_content_chunks
+
+SAMPLE_TEXTS = [
+    "Hello World",
+    "Which crops are affected by Bactericera cockerelli?",
+    "Azolla pinnata is a floating aquatic fern that can cover the surface of ponds and rice fields.",
+]
+
+
+def get_sparse_difference(reference: List[Tuple[List[int], List[float]]], candidate: List[Tuple[List[int], List[float]]]) -> float:
+    max_difference = 0.0
+    for (reference_indices, reference_values), (candidate_indices, candidate_values) in zip(reference, candidate):
+        reference_vector: Dict[int, float] = dict(zip(reference_indices, reference_values))
+        candidate_vector: Dict[int, float] = dict(zip(candidate_indices, candidate_values))
+        for index in reference_vector.keys() | candidate_vector.keys():
+            max_difference = max(max_difference, abs(reference_vector.get(index, 0.0) - candidate_vector.get(index, 0.0)))
+    return max_difference
+
+
+def main():
+    inference_precision = os.getenv("INFERENCE_PRECISION", "fp32")
+    onnx_options = dict(
+        inference_backend="onnx",
+        onnx_cache_dir=os.getenv("ONNX_CACHE_DIR", "onnx_models"),
+        onnx_num_threads=int(os.getenv("ONNX_NUM_THREADS", "0")),
+    )
+
+    # Loading the ONNX models exports them on first use and reuses the cached graphs afterwards
+    onnx_encoder = TextEncoder(
+        sparse_model_name=os.getenv("SPARSE_EMBEDDINGS_MODEL_NAME"),
+        dense_model_name=os.getenv("DENSE_EMBEDDINGS_MODEL_NAME"),
+        inference_precision=inference_precision,
+        **onnx_options,
+    )
+    onnx_encoder.load_sparse_model()
+    onnx_encoder.load_dense_model()
+    onnx_reranker = Reranker(os.getenv("RERANKER_MODEL_NAME"), inference_precision=inference_precision, **onnx_options)
+    print(f"# ONNX models ready in: {onnx_options['onnx_cache_dir']} ({inference_precision})")
+    if args.skip_check:
+        return
+
+    texts = SAMPLE_TEXTS + [text for _, text in zip(range(args.limit), iter_content_chunks())]
+    query = SAMPLE_TEXTS[1]
+    print(f"# Comparing ONNX ({inference_precision}) against PyTorch (fp32) on {len(texts)} texts")
+
+    torch_encoder = TextEncoder(
+        sparse_model_name=os.getenv("SPARSE_EMBEDDINGS_MODEL_NAME"),
+        dense_model_name=os.getenv("DENSE_EMBEDDINGS_MODEL_NAME"),
+    )
+    torch_reranker = Reranker(os.getenv("RERANKER_MODEL_NAME"))
+
+    differences = {}
+    for task in ("retrieval.query", "retrieval.passage"):
+        torch_embeddings = torch_encoder.encode_dense(texts, task)
+        onnx_embeddings = onnx_encoder.encode_dense(texts, task)
+        cosine_similarities = np.sum(torch_embeddings * onnx_embeddings, axis=1) / (
+            np.linalg.norm(torch_embeddings, axis=1) * np.linalg.norm(onnx_embeddings, axis=1)
+        )
+        differences[f"dense ({task})"] = float(np.max(np.abs(torch_embeddings - onnx_embeddings)))
+        print(f" - Dense ({task}) minimum cosine similarity: {np.min(cosine_similarities):.6f}")
+
+    differences["sparse"] = get_sparse_difference(torch_encoder.encode_sparse_batch(texts), onnx_encoder.encode_sparse_batch(texts))
+
+    documents = list(enumerate(texts))
+    torch_scores = np.asarray(torch_reranker.compute_scores(query, documents))
+    onnx_scores = np.asarray(onnx_reranker.compute_scores(query, documents))
+    differences["reranker"] = float(np.max(np.abs(torch_scores - onnx_scores)))
+
+    for name, difference in differences.items():
+        print(f" - {name} maximum absolute difference: {difference:.2e}")
+
+    # Quantized graphs are expected to drift, only fp32 exports must match PyTorch
+    failed = [name for name, difference in differences.items() if difference > args.atol]
+    if inference_precision == "fp32" and failed:
+        print(f"# ONNX outputs differ from PyTorch by more than {args.atol}: {', '.join(failed)}")
+        sys.exit(1)
+    print("# Equivalence check finished")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    # Speaks the streaming Ollama /api/chat protocol (chunked NDJSON) with fixed delays
+    protocol_version = "HTTP/1.1"
+    server: "FakeOllamaServer"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with self.server.lock:
+            self.server.requests.append(payload)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        # An empty message list only loads the model, as in Ollama
+        if not payload.get("messages"):
+            self.write_chunk((json.dumps({"model": payload.get("model"), "done": True}) + "\n").encode("utf-8"))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        try:
+            time.sleep(self.server.first_token_ms / 1000)
+            for idx in range(self.server.tokens):
+                if idx:
+                    time.sleep(self.server.token_ms / 1000)
+                self.write_chunk((json.dumps({"message": {"content": f"token{idx} "}, "done": False}) + "\n").encode("utf-8"))
+            self.write_chunk((json.dumps({"message": {"content": ""}, "done": True}) + "\n").encode("utf-8"))
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the stream
+            with self.server.lock:
+                self.server.cancelled_streams += 1
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Ollama chat endpoint, for benchmarks and client tests
+    that must not depend on a running model. Use it as a context manager or through
+    start() / stop(); `url` is the base URL to hand to OllamaClient.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, first_token_ms: float = 50, token_ms: float = 5, tokens: int = 64):
+        super().__init__(("127.0.0.1", 0), FakeOllamaHandler)
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.tokens = tokens
+        self.connections = 0
+        self.cancelled_streams = 0
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def start(self) -> "FakeOllamaServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
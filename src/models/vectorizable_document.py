@@ -1,11 +1,13 @@
-from typing import Dict
+from typing import Dict, Optional, Union
 
 
 class VectorizableDocument:
-    def __init__(self, id: int, text: str, metadata: Dict[str, str]):
+    def __init__(self, id: Union[int, str], text: str, metadata: Dict[str, str], sparse_text: Optional[str] = None):
         self.id = id
         self.text = text
         self.metadata = metadata
+        # Text used for the sparse vector when it differs from the dense text
+        self.sparse_text = sparse_text if sparse_text is not None else text
 
     def __repr__(self):
         return f"VectorizableDocument(id={self.id}, text={self.text}, metadata={self.metadata})"
\ No newline at end of file
@@ -1,4 +1,5 @@
 from db import PostgresSession, MongoSession
+from typing import Dict, Iterator, List
 
 from entities import CabiSpecie
 
@@ -22,5 +23,25 @@ class CabiSpeciesRepository:
         else:
             return documents[0].get("contenido")
 
+    def get_cabi_species_content_by_scientific_names(self, scientific_names: List[str], batch_size: int = 1000) -> Dict[str, str]:
+        contents: Dict[str, str] = {}
+        unique_scientific_names = list(dict.fromkeys(scientific_names))
+        for start in range(0, len(unique_scientific_names), batch_size):
+            cursor = self.cabi_scraper_collection.find(
+                {"nombre_cientifico": {"$in": unique_scientific_names[start:start + batch_size]}},
+                {
+                    "nombre_cientifico": True,
+                    "contenido": True,
+                },
+            )
+            for document in cursor:
+                # First document wins, same as find(...).limit(1) per name
+                contents.setdefault(document.get("nombre_cientifico"), document.get("contenido"))
+        return contents
+
     def get_all_cabi_species(self) -> list[CabiSpecie]:
         return PostgresSession.query(CabiSpecie).all()
+
+    def iter_all_cabi_species(self, batch_size: int = 1000) -> Iterator[CabiSpecie]:
+        # Streams rows with a server-side cursor instead of loading the whole table
+        return PostgresSession.query(CabiSpecie).yield_per(batch_size)
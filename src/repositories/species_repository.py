@@ -1,5 +1,5 @@
 from db import PostgresSession, MongoSession
-from typing import Dict, List
+from typing import Dict, Iterator, List
 
 from entities import Specie
 
@@ -23,5 +23,25 @@ class SpeciesRepository:
         else:
             return documents[0].get("contenido")
 
+    def get_cabi_species_content_by_source_urls(self, source_urls: List[str], batch_size: int = 1000) -> Dict[str, str]:
+        contents: Dict[str, str] = {}
+        unique_source_urls = list(dict.fromkeys(source_urls))
+        for start in range(0, len(unique_source_urls), batch_size):
+            cursor = self.url_scraper_collection.find(
+                {"source_url": {"$in": unique_source_urls[start:start + batch_size]}},
+                {
+                    "source_url": True,
+                    "contenido": True,
+                },
+            )
+            for document in cursor:
+                # First document wins, same as find(...).limit(1) per url
+                contents.setdefault(document.get("source_url"), document.get("contenido"))
+        return contents
+
     def get_all_species(self) -> List[Specie]:
         return PostgresSession.query(Specie).all()
+
+    def iter_all_species(self, batch_size: int = 1000) -> Iterator[Specie]:
+        # Streams rows with a server-side cursor instead of loading the whole table
+        return PostgresSession.query(Specie).yield_per(batch_size)
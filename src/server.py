@@ -0,0 +1,258 @@
+from dotenv import load_dotenv
+
+_ = load_dotenv(override=True)
+
+import argparse
+
+parser = argparse.ArgumentParser(description="HTTP query service for the RAG pipeline")
+parser.add_argument("--host", default="0.0.0.0", help="Interface to bind")
+parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+parser.add_argument(
+    "-w",
+    "--workers",
+    type=int,
+    default=16,
+    help="Number of threads running queries; with micro-batching this bounds the batch size reached under load",
+)
+parser.add_argument(
+    "--max-pending",
+    type=int,
+    default=64,
+    help="Maximum number of requests waiting for or running inference before rejecting new ones",
+)
+parser.add_argument(
+    "--batch-window-ms",
+    type=float,
+    default=10,
+    help="Micro-batching window for encoder and reranker inference, 0 disables micro-batching",
+)
+parser.add_argument(
+    "--max-batch-size",
+    type=int,
+    default=32,
+    help="Maximum number of requests merged into one micro-batch",
+)
+parser.add_argument(
+    "--max-queue-size",
+    type=int,
+    default=1024,
+    help="Maximum number of requests waiting in each micro-batcher queue",
+)
+args = parser.parse_args()
+
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+
+from aiohttp import web
+from transformers import logging as hf_logging
+
+hf_logging.set_verbosity_error()
+
+from services import configure_metrics, create_rag_pipeline, metrics, model_registry
+from services.answer_cache import iter_answer_chunks
+from services.llm_client import LLMRequestError
+
+RAG_PIPELINE = web.AppKey("rag_pipeline")
+EXECUTOR = web.AppKey("executor")
+PENDING = web.AppKey("pending")
+
+
+class ServerBusyError(Exception):
+    pass
+
+
+async def run_inference(app: web.Application, function, *function_args):
+    # Bounded queue: reject instead of letting waiting requests pile up without limit
+    if app[PENDING]["count"] >= args.max_pending:
+        raise ServerBusyError()
+    app[PENDING]["count"] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(app[EXECUTOR], function, *function_args)
+    finally:
+        app[PENDING]["count"] -= 1
+
+
+async def read_query(request: web.Request) -> str:
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="Request body must be JSON")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="Request body must be a JSON object")
+    query = str(body.get("query", "")).strip()
+    if not query:
+        raise web.HTTPBadRequest(text="Missing 'query'")
+    return query
+
+
+def serialize_results(results):
+    return [
+        {
+            "id": result[0],
+            "score": result[1],
+            "scientific_name": result[2].get("scientific_name"),
+            "common_names": result[2].get("common_names"),
+            "source_url": result[2].get("source_url"),
+            "content_chunk": result[2].get("content_chunk"),
+        }
+        for result in results
+    ]
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok", "pending": request.app[PENDING]["count"]})
+
+
+async def handle_stats(request: web.Request) -> web.Response:
+    rag_pipeline = request.app[RAG_PIPELINE]
+    batchers = [
+        rag_pipeline.text_encoder.sparse_batcher,
+        rag_pipeline.text_encoder.dense_batcher,
+        rag_pipeline.reranker.batcher,
+    ]
+    return web.json_response(
+        {
+            "pending": request.app[PENDING]["count"],
+            "query_caches": {name: cache.stats() for name, cache in rag_pipeline.query_caches.items()},
+            "micro_batchers": {batcher.name: batcher.stats() for batcher in batchers if batcher is not None},
+            "models": model_registry.stats(),
+        }
+    )
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    # Prometheus text exposition format
+    if not metrics.enabled:
+        raise web.HTTPNotFound(text="Metrics are disabled, set METRICS_ENABLED=true")
+    return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+def collect_micro_batcher_metrics(rag_pipeline):
+    batchers = [
+        rag_pipeline.text_encoder.sparse_batcher,
+        rag_pipeline.text_encoder.dense_batcher,
+        rag_pipeline.reranker.batcher,
+    ]
+    for batcher in batchers:
+        if batcher is not None:
+            stats = batcher.stats()
+            yield "micro_batcher_batches_total", "counter", {"batcher": batcher.name}, stats["batches"]
+            yield "micro_batcher_items_total", "counter", {"batcher": batcher.name}, stats["items"]
+            yield "micro_batcher_queue_depth", "gauge", {"batcher": batcher.name}, stats["queue_depth"]
+
+
+async def handle_search(request: web.Request) -> web.Response:
+    query = await read_query(request)
+    try:
+        keywords, results = await run_inference(request.app, request.app[RAG_PIPELINE].retrieve, query)
+    except ServerBusyError:
+        raise web.HTTPServiceUnavailable(text="Server busy, retry later")
+    return web.json_response({"query": query, "keywords": keywords, "results": serialize_results(results)})
+
+
+def retrieve_for_answer(rag_pipeline, query: str):
+    _, results = rag_pipeline.retrieve(query)
+    if not results:
+        return results, None, None
+    cached_answer = rag_pipeline.lookup_answer(query, results)
+    # Context packing tokenizes every chunk, so it runs on the inference workers, not the event loop
+    knowledge = rag_pipeline.build_knowledge(results) if cached_answer is None else None
+    return results, cached_answer, knowledge
+
+
+async def handle_answer(request: web.Request) -> web.StreamResponse:
+    """
+    Streams the answer as newline-delimited JSON: one "sources" event, then one
+    "token" event per generated chunk and a final "done" event, or an "error" event
+    when Ollama fails or times out. If the client disconnects, the Ollama request is
+    closed with it. Cached answers are replayed as the same token events.
+    """
+    query = await read_query(request)
+    rag_pipeline = request.app[RAG_PIPELINE]
+    try:
+        results, cached_answer, knowledge = await run_inference(request.app, retrieve_for_answer, rag_pipeline, query)
+    except ServerBusyError:
+        raise web.HTTPServiceUnavailable(text="Server busy, retry later")
+
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+
+    async def send(event):
+        await response.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    await send({"type": "sources", "results": serialize_results(results)})
+    if not results:
+        await send({"type": "done"})
+        return response
+
+    if cached_answer is not None:
+        for content in iter_answer_chunks(cached_answer):
+            await send({"type": "token", "content": content})
+        await send({"type": "done"})
+        return response
+
+    contents = []
+    try:
+        # aclosing closes the Ollama stream as soon as a write to a disconnected client fails
+        async with aclosing(rag_pipeline.astream_answer(query, knowledge)) as answer_chunks:
+            async for content in answer_chunks:
+                contents.append(content)
+                await send({"type": "token", "content": content})
+    except LLMRequestError as e:
+        await send({"type": "error", "message": str(e)})
+        return response
+
+    await send({"type": "done"})
+    await asyncio.get_running_loop().run_in_executor(
+        request.app[EXECUTOR], rag_pipeline.store_answer, query, results, "".join(contents)
+    )
+    return response
+
+
+async def on_startup(app: web.Application):
+    app[EXECUTOR] = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="inference")
+    app[PENDING] = {"count": 0}
+
+    configure_metrics()
+
+    # Load and warm up every model once, before the first request arrives
+    loop = asyncio.get_running_loop()
+    rag_pipeline = await loop.run_in_executor(app[EXECUTOR], create_rag_pipeline)
+    await loop.run_in_executor(app[EXECUTOR], rag_pipeline.warm_up)
+    if args.batch_window_ms > 0:
+        micro_batching = dict(
+            max_batch_size=args.max_batch_size,
+            batch_window_ms=args.batch_window_ms,
+            max_queue_size=args.max_queue_size,
+        )
+        rag_pipeline.text_encoder.enable_micro_batching(**micro_batching)
+        rag_pipeline.reranker.enable_micro_batching(**micro_batching)
+        print(f"# Micro-batching enabled: {micro_batching}")
+        if metrics.enabled:
+            metrics.add_collector(lambda: collect_micro_batcher_metrics(rag_pipeline))
+    app[RAG_PIPELINE] = rag_pipeline
+    print(f"# Query service ready on http://{args.host}:{args.port} with {args.workers} inference workers")
+
+
+async def on_cleanup(app: web.Application):
+    await app[RAG_PIPELINE].llm_client.aclose()
+    app[EXECUTOR].shutdown(wait=False, cancel_futures=True)
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/stats", handle_stats)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_post("/search", handle_search)
+    app.router.add_post("/answer", handle_answer)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host=args.host, port=args.port)
@@ -1,4 +1,17 @@
-from .vector_store import VectorStore
+from .vector_store import VectorStore, open_vector_store
 from .query_processor import QueryProcessor
 from .text_encoder import TextEncoder
-from .plague_service import PlagueService
\ No newline at end of file
+from .plague_service import PlagueService
+from .ingestion_pipeline import IngestionPipeline
+from .embedding_cache import EmbeddingCache
+from .query_cache import LRUCache
+from .reranker import Reranker
+from .rag_pipeline import RagPipeline, create_rag_pipeline
+from .micro_batcher import MicroBatcher
+from .model_registry import ModelRegistry, model_registry
+from .species_gazetteer import SpeciesGazetteer
+from .metrics import Metrics, metrics, configure_metrics
+from .llm_client import OllamaClient, LLMRequestError
+from .answer_cache import AnswerCache
+from .numpy_vector_store import NumpyVectorStore
+from .dense_projection import DenseProjection
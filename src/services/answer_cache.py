@@ -0,0 +1,129 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+
+ANSWER_CHUNK_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+def iter_answer_chunks(answer: str) -> Iterator[str]:
+    # Replays a cached answer word by word, so callers stream it like a generation
+    yield from ANSWER_CHUNK_PATTERN.findall(answer)
+
+
+class AnswerCache:
+    """
+    Semantic cache of generated answers. An entry is reused when the new query
+    embedding has a cosine similarity of at least `similarity_threshold` with the
+    cached one and retrieval returned exactly the same points, so the answer was
+    generated from the same knowledge. Entries expire after `ttl_seconds`, the least
+    recently used are evicted past `capacity`, and every entry is dropped when the
+    collection version changes.
+    """
+
+    def __init__(self, capacity: int = 512, ttl_seconds: Optional[float] = None, similarity_threshold: float = 0.95):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        # entry id -> (slot, point ids, answer, expires_at); embeddings live in matrix[slot]
+        self.entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self.matrix: Optional[np.ndarray] = None
+        self.slot_entries: List[Optional[int]] = [None] * capacity
+        self.free_slots = list(range(capacity - 1, -1, -1))
+        self.next_entry_id = 0
+        self.index_version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def normalize(embedding: Union[List[float], np.ndarray]) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def __check_version(self, index_version: str):
+        # Answers generated against a previous build of the collection are stale
+        if index_version != self.index_version:
+            self.__clear()
+            self.index_version = index_version
+
+    def get(self, query_embedding: Union[List[float], np.ndarray], point_ids: Iterable[Hashable], index_version: str) -> Optional[str]:
+        query_embedding = self.normalize(query_embedding)
+        point_ids = frozenset(point_ids)
+        with self.lock:
+            self.__check_version(index_version)
+            if not self.entries:
+                self.misses += 1
+                return None
+
+            similarities = self.matrix @ query_embedding
+            now = time.monotonic()
+            for slot in np.argsort(-similarities):
+                if similarities[slot] < self.similarity_threshold:
+                    break
+                entry_id = self.slot_entries[slot]
+                if entry_id is None:
+                    continue
+                _, entry_point_ids, answer, expires_at = self.entries[entry_id]
+                if expires_at is not None and expires_at <= now:
+                    self.__remove(entry_id)
+                    continue
+                if entry_point_ids == point_ids:
+                    self.entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return answer
+            self.misses += 1
+            return None
+
+    def put(self, query_embedding: Union[List[float], np.ndarray], point_ids: Iterable[Hashable], answer: str, index_version: str):
+        if self.capacity <= 0 or not answer:
+            return
+        query_embedding = self.normalize(query_embedding)
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self.lock:
+            self.__check_version(index_version)
+            if self.matrix is None or self.matrix.shape[1] != query_embedding.shape[0]:
+                self.__clear()
+                self.matrix = np.zeros((self.capacity, query_embedding.shape[0]), dtype=np.float32)
+            if not self.free_slots:
+                self.__remove(next(iter(self.entries)))
+
+            slot = self.free_slots.pop()
+            entry_id = self.next_entry_id
+            self.next_entry_id += 1
+            self.matrix[slot] = query_embedding
+            self.slot_entries[slot] = entry_id
+            self.entries[entry_id] = (slot, frozenset(point_ids), answer, expires_at)
+
+    def __remove(self, entry_id: int):
+        slot = self.entries.pop(entry_id)[0]
+        self.slot_entries[slot] = None
+        # A zeroed row never reaches the similarity threshold
+        self.matrix[slot] = 0
+        self.free_slots.append(slot)
+
+    def __clear(self):
+        self.entries.clear()
+        self.slot_entries = [None] * self.capacity
+        self.free_slots = list(range(self.capacity - 1, -1, -1))
+        if self.matrix is not None:
+            self.matrix[:] = 0
+
+    def clear(self):
+        with self.lock:
+            self.__clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self.entries),
+                "capacity": self.capacity,
+            }
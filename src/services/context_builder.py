@@ -0,0 +1,168 @@
+import json
+import os
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from transformers import AutoTokenizer
+
+from .metrics import metrics
+
+TOKEN_COUNT_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+
+def serialize_json_knowledge(ranked_semantic_search_results: List[Tuple]) -> str:
+    # Original knowledge format: every chunk, grouped by species, as indented JSON
+    grouped = defaultdict(list)
+    for result in ranked_semantic_search_results:
+        key = (result[2]["scientific_name"], result[2].get("common_names") or None)
+        grouped[key].append(result[2]["content_chunk"])
+
+    context_contents_result = []
+    for (related_specie, common_names), contents in grouped.items():
+        entry = OrderedDict()
+        entry["related_specie"] = related_specie
+        if common_names:
+            entry["common_names"] = common_names
+        entry["contents"] = contents
+        context_contents_result.append(entry)
+    return json.dumps(context_contents_result, ensure_ascii=False, indent=2)
+
+
+def merge_overlapping(text: str, chunk: str, min_overlap_chars: int) -> Optional[str]:
+    """
+    Returns text and chunk merged into one passage when they share an overlap of at
+    least min_overlap_chars (consecutive windows of the same document), the longer
+    one when one contains the other, or None when they are unrelated.
+    """
+    if chunk in text:
+        return text
+    if text in chunk:
+        return chunk
+    best_overlap, merged = 0, None
+    for head, tail in ((text, chunk), (chunk, text)):
+        # The start of the tail must appear near the end of the head and run to its end;
+        # the earliest such position is the longest overlap of this order
+        probe = tail[:min_overlap_chars]
+        position = head.find(probe, max(0, len(head) - len(tail)))
+        while position != -1:
+            if tail.startswith(head[position:]):
+                if len(head) - position > best_overlap:
+                    best_overlap, merged = len(head) - position, head + tail[len(head) - position:]
+                break
+            position = head.find(probe, position + 1)
+    # Repeated phrases can match by chance, the longer overlap is the real one
+    return merged
+
+
+class ContextBuilder:
+    """
+    Packs reranked chunks into the LLM knowledge block under a token budget. Chunks
+    are taken in rank order while they fit, overlapping windows of the same species
+    are merged so the shared tokens are sent once, and the result is plain text
+    grouped by species instead of indented JSON.
+    """
+
+    def __init__(self, tokenizer_name: str, max_tokens: int = 2048, min_overlap_chars: int = 32, fallback_tokenizer_name: Optional[str] = None):
+        self.tokenizer_name = tokenizer_name
+        self.max_tokens = max_tokens
+        self.min_overlap_chars = min_overlap_chars
+        # Loaded instead when tokenizer_name cannot be (not downloaded, gated or offline)
+        self.fallback_tokenizer_name = fallback_tokenizer_name
+        self.tokenizer = None
+
+    def load_tokenizer(self):
+        if self.tokenizer is None:
+            try:
+                self.tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name, trust_remote_code=True)
+            except (OSError, ValueError) as error:
+                if not self.fallback_tokenizer_name or self.fallback_tokenizer_name == self.tokenizer_name:
+                    raise
+                print(f"# Context tokenizer {self.tokenizer_name} could not be loaded ({type(error).__name__}), counting tokens with {self.fallback_tokenizer_name} (approximate)")
+                self.tokenizer_name = self.fallback_tokenizer_name
+                self.tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name, trust_remote_code=True)
+
+    def count_tokens(self, text: str) -> int:
+        self.load_tokenizer()
+        return len(self.tokenizer(text, add_special_tokens=False, verbose=False)["input_ids"])
+
+    def format_header(self, scientific_name: str, common_names: Optional[str]) -> str:
+        return f"## {scientific_name}" + (f" ({common_names})" if common_names else "")
+
+    def build(self, ranked_semantic_search_results: List[Tuple], measure_savings: bool = False) -> Tuple[str, Dict[str, int]]:
+        # tokens is the budget spent, measure_savings also tokenizes the packed text and the
+        # JSON format it replaces, two full passes only worth paying for verbose output or metrics
+        # species key -> list of passages, in the order species first appear in the ranking
+        sections: Dict[Tuple[str, Optional[str]], List[str]] = {}
+        used_tokens = 0
+        merged_chunks = 0
+        dropped_chunks = 0
+
+        for result in ranked_semantic_search_results:
+            payload = result[2]
+            key = (payload["scientific_name"], payload.get("common_names") or None)
+            chunk = payload["content_chunk"].strip()
+            passages = sections.get(key, [])
+
+            merged_idx, merged_text = None, None
+            for idx, passage in enumerate(passages):
+                merged_text = merge_overlapping(passage, chunk, self.min_overlap_chars)
+                if merged_text is not None:
+                    merged_idx = idx
+                    break
+
+            if merged_idx is not None:
+                # Only the tokens the merge adds count against the budget
+                cost = self.count_tokens(merged_text) - self.count_tokens(passages[merged_idx])
+            else:
+                # One extra token for the line break separating passages
+                cost = self.count_tokens(chunk) + 1
+                if not passages:
+                    cost += self.count_tokens(self.format_header(*key)) + 1
+
+            if used_tokens + cost > self.max_tokens:
+                dropped_chunks += 1
+                continue
+            used_tokens += cost
+            if merged_idx is not None:
+                passages[merged_idx] = merged_text
+                merged_chunks += 1
+            else:
+                passages.append(chunk)
+                sections[key] = passages
+
+        knowledge = "\n\n".join(
+            "\n".join([self.format_header(*key), *passages]) for key, passages in sections.items()
+        )
+        stats = {
+            "chunks": len(ranked_semantic_search_results),
+            "merged_chunks": merged_chunks,
+            "dropped_chunks": dropped_chunks,
+            "tokens": used_tokens,
+        }
+        if measure_savings:
+            stats["tokens"] = self.count_tokens(knowledge) if knowledge else 0
+            stats["json_tokens"] = self.count_tokens(serialize_json_knowledge(ranked_semantic_search_results))
+            stats["tokens_saved"] = stats["json_tokens"] - stats["tokens"]
+            metrics.increment("context_tokens_saved_total", max(0, stats["tokens_saved"]))
+        metrics.observe("context_tokens", stats["tokens"], buckets=TOKEN_COUNT_BUCKETS)
+        metrics.increment("context_chunks_dropped_total", dropped_chunks)
+        metrics.increment("context_chunks_merged_total", merged_chunks)
+        return knowledge, stats
+
+
+def create_context_builder() -> ContextBuilder:
+    # The budget bounds the LLM prompt, so tokens are counted with the LLM tokenizer. The dense
+    # embedding model tokenizer, already available locally, is the approximation used when it
+    # is not configured ("dense" selects it explicitly) or cannot be loaded
+    dense_tokenizer_name = os.getenv("DENSE_EMBEDDINGS_MODEL_NAME")
+    tokenizer_name = os.getenv("CONTEXT_TOKENIZER_NAME", "").strip()
+    if not tokenizer_name:
+        print(f"# CONTEXT_TOKENIZER_NAME is not set, counting context tokens with {dense_tokenizer_name} (approximate)")
+        tokenizer_name = "dense"
+    if tokenizer_name == "dense":
+        tokenizer_name = dense_tokenizer_name
+    return ContextBuilder(
+        tokenizer_name,
+        max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "2048")),
+        fallback_tokenizer_name=dense_tokenizer_name,
+    )
@@ -0,0 +1,101 @@
+import hashlib
+import os
+from typing import List, Optional, Union
+
+import numpy as np
+
+DENSE_PROJECTION_TYPES = ("matryoshka", "pca")
+
+
+def get_dense_projection_path(storage_path: str, collection_name: str) -> str:
+    # Kept next to the collection, as its version file, so queries always use the projection it was built with
+    return os.path.join(storage_path, f"{collection_name}.dense_projection.npz")
+
+
+class DenseProjection:
+    """
+    Maps full dense embeddings to `output_dim` dimensions, at index and query time alike:
+    - matryoshka: keeps the first dimensions, for models trained with Matryoshka losses.
+    - pca: projects onto the principal components of a sample of corpus embeddings.
+    Projected vectors are normalized again, so cosine scores stay comparable.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        input_dim: int,
+        output_dim: int,
+        mean: Optional[np.ndarray] = None,
+        components: Optional[np.ndarray] = None,
+        explained_variance: Optional[float] = None,
+    ):
+        if kind not in DENSE_PROJECTION_TYPES:
+            raise ValueError(f"Unknown dense projection: {kind}. Expected one of {DENSE_PROJECTION_TYPES}")
+        if not 0 < output_dim <= input_dim:
+            raise ValueError(f"Dense projection dimension must be between 1 and {input_dim}, got {output_dim}")
+        if kind == "pca" and (mean is None or components is None or components.shape != (output_dim, input_dim)):
+            raise ValueError(f"A pca projection needs a mean and a ({output_dim}, {input_dim}) components matrix")
+        self.kind = kind
+        self.input_dim = input_dim
+        self.output_dim = output_dim
+        self.mean = None if mean is None else np.ascontiguousarray(mean, dtype=np.float32)
+        # Stored transposed, so projecting is one (n, input_dim) @ (input_dim, output_dim) product
+        self.components = None if components is None else np.ascontiguousarray(components.T, dtype=np.float32)
+        self.explained_variance = explained_variance
+        digest = hashlib.sha256(self.components.tobytes()).hexdigest()[:12] if self.components is not None else ""
+        self.key = f"{kind}-{output_dim}{'-' + digest if digest else ''}"
+
+    @classmethod
+    def matryoshka(cls, input_dim: int, output_dim: int) -> "DenseProjection":
+        return cls("matryoshka", input_dim, output_dim)
+
+    @classmethod
+    def fit_pca(cls, embeddings: np.ndarray, output_dim: int) -> "DenseProjection":
+        # Fitted on normalized embeddings, the vectors cosine similarity is computed on
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(embeddings) < output_dim:
+            raise ValueError(f"Fitting {output_dim} components needs at least {output_dim} embeddings, got {len(embeddings)}")
+        embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        mean = embeddings.mean(axis=0)
+        _, singular_values, components = np.linalg.svd(embeddings - mean, full_matrices=False)
+        variances = singular_values ** 2
+        explained_variance = float(variances[:output_dim].sum() / max(variances.sum(), 1e-12))
+        return cls("pca", embeddings.shape[1], output_dim, mean, components[:output_dim], explained_variance)
+
+    def project(self, embeddings: Union[List[float], np.ndarray]) -> np.ndarray:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.shape[-1] != self.input_dim:
+            raise ValueError(f"Expected {self.input_dim}-dimension embeddings, got {embeddings.shape[-1]}")
+        if self.kind == "matryoshka":
+            projected = embeddings[..., :self.output_dim]
+        else:
+            embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=-1, keepdims=True), 1e-12)
+            projected = (embeddings - self.mean) @ self.components
+        norms = np.linalg.norm(projected, axis=-1, keepdims=True)
+        return np.ascontiguousarray(projected / np.maximum(norms, 1e-12), dtype=np.float32)
+
+    def save(self, path: str):
+        arrays = {"kind": np.array(self.kind), "input_dim": np.array(self.input_dim), "output_dim": np.array(self.output_dim)}
+        if self.kind == "pca":
+            arrays.update(mean=self.mean, components=self.components.T, explained_variance=np.array(self.explained_variance))
+        # Written aside and renamed, a reader never sees a partial file
+        temp_path = f"{path}.tmp.npz"
+        np.savez(temp_path, **arrays)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["DenseProjection"]:
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as arrays:
+            return cls(
+                str(arrays["kind"]),
+                int(arrays["input_dim"]),
+                int(arrays["output_dim"]),
+                arrays["mean"] if "mean" in arrays else None,
+                arrays["components"] if "components" in arrays else None,
+                float(arrays["explained_variance"]) if "explained_variance" in arrays else None,
+            )
+
+    def __repr__(self) -> str:
+        return f"DenseProjection({self.kind}, {self.input_dim} -> {self.output_dim})"
@@ -0,0 +1,296 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+SPARSE_TASK = "sparse"
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (model name, task, dtype, text hash).
+
+    Dense vectors live in one memory-mapped matrix per (model, task, dtype), one row per entry.
+    Sparse vectors are stored as packed int32 indices followed by their values. The
+    least recently used entries are evicted once the cache grows past `max_size_bytes`.
+    A cache directory must not be shared by concurrently running processes.
+    """
+
+    def __init__(self, cache_dir: str, max_size_bytes: int = 4 * 1024 ** 3, dtype: str = "float32"):
+        if dtype not in ("float16", "float32"):
+            raise ValueError(f"Unsupported embedding cache dtype: {dtype}")
+
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.dtype = np.dtype(dtype)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.dense_matrices: Dict[int, np.memmap] = {}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), check_same_thread=False)
+        self.__drop_entries_without_dtype()
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS dense_stores (
+                store_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                model_name TEXT NOT NULL,
+                task TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                dtype TEXT NOT NULL,
+                capacity INTEGER NOT NULL,
+                UNIQUE (model_name, task, dtype)
+            );
+            CREATE TABLE IF NOT EXISTS dense_free_slots (
+                store_id INTEGER NOT NULL,
+                slot INTEGER NOT NULL,
+                PRIMARY KEY (store_id, slot)
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                model_name TEXT NOT NULL,
+                task TEXT NOT NULL,
+                dtype TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                store_id INTEGER,
+                slot INTEGER,
+                data BLOB,
+                nbytes INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model_name, task, dtype, text_hash)
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+            """
+        )
+        self.connection.commit()
+
+    def __drop_entries_without_dtype(self):
+        # Caches written before entries recorded their dtype may hold slots shared across
+        # dtypes, they cannot be trusted and are cleared once
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(entries)")]
+        if not columns or "dtype" in columns:
+            return
+        print(f"# Clearing embedding cache {self.cache_dir} written by a previous version")
+        store_ids = [store_id for (store_id,) in self.connection.execute("SELECT store_id FROM dense_stores")]
+        self.connection.executescript(
+            """
+            DROP TABLE entries;
+            DROP TABLE IF EXISTS dense_free_slots;
+            DROP TABLE IF EXISTS dense_stores;
+            """
+        )
+        self.connection.commit()
+        for store_id in store_ids:
+            for dtype in ("float16", "float32"):
+                path = os.path.join(self.cache_dir, f"dense_{store_id}.{dtype}")
+                if os.path.exists(path):
+                    os.remove(path)
+
+    @staticmethod
+    def get_text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def __get_dense_matrix(self, store_id: int, dim: int, capacity: int) -> np.memmap:
+        matrix = self.dense_matrices.get(store_id)
+        if matrix is None or matrix.shape[0] != capacity:
+            path = os.path.join(self.cache_dir, f"dense_{store_id}.{self.dtype.name}")
+            with open(path, "ab") as f:
+                f.truncate(capacity * dim * self.dtype.itemsize)
+            matrix = np.memmap(path, dtype=self.dtype, mode="r+", shape=(capacity, dim))
+            self.dense_matrices[store_id] = matrix
+        return matrix
+
+    def __get_dense_store(self, model_name: str, task: str, dim: Optional[int] = None) -> Optional[Tuple[int, int, int]]:
+        row = self.connection.execute(
+            "SELECT store_id, dim, capacity FROM dense_stores WHERE model_name = ? AND task = ? AND dtype = ?",
+            (model_name, task, self.dtype.name),
+        ).fetchone()
+        if row is None and dim is not None:
+            cursor = self.connection.execute(
+                "INSERT INTO dense_stores (model_name, task, dim, dtype, capacity) VALUES (?, ?, ?, ?, 0)",
+                (model_name, task, dim, self.dtype.name),
+            )
+            row = (cursor.lastrowid, dim, 0)
+        return row
+
+    def __allocate_dense_slots(self, store_id: int, dim: int, capacity: int, count: int) -> Tuple[List[int], int]:
+        free_slots = [
+            slot for (slot,) in self.connection.execute(
+                "SELECT slot FROM dense_free_slots WHERE store_id = ? ORDER BY slot LIMIT ?", (store_id, count)
+            )
+        ]
+        self.connection.executemany(
+            "DELETE FROM dense_free_slots WHERE store_id = ? AND slot = ?", [(store_id, slot) for slot in free_slots]
+        )
+
+        missing = count - len(free_slots)
+        if missing > 0:
+            # Grow geometrically so the memory map is not remapped for every batch
+            new_capacity = max(capacity + missing, capacity * 2, 1024)
+            free_slots.extend(range(capacity, capacity + missing))
+            self.connection.executemany(
+                "INSERT INTO dense_free_slots (store_id, slot) VALUES (?, ?)",
+                [(store_id, slot) for slot in range(capacity + missing, new_capacity)],
+            )
+            self.connection.execute(
+                "UPDATE dense_stores SET capacity = ? WHERE store_id = ?", (new_capacity, store_id)
+            )
+            capacity = new_capacity
+        return free_slots, capacity
+
+    def __lookup(self, model_name: str, task: str, texts: List[str]) -> Dict[str, Tuple]:
+        text_hashes = list(dict.fromkeys(self.get_text_hash(text) for text in texts))
+        found = {}
+        for start in range(0, len(text_hashes), 500):
+            batch = text_hashes[start:start + 500]
+            rows = self.connection.execute(
+                f"SELECT text_hash, store_id, slot, data, dtype FROM entries WHERE model_name = ? AND task = ? AND dtype = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                [model_name, task, self.dtype.name, *batch],
+            )
+            for text_hash, store_id, slot, data, dtype in rows:
+                found[text_hash] = (store_id, slot, data, dtype)
+
+        now = time.time()
+        self.connection.executemany(
+            "UPDATE entries SET last_access = ? WHERE model_name = ? AND task = ? AND dtype = ? AND text_hash = ?",
+            [(now, model_name, task, self.dtype.name, text_hash) for text_hash in found],
+        )
+        self.connection.commit()
+        return found
+
+    def __evict(self):
+        (size_bytes,) = self.connection.execute("SELECT COALESCE(SUM(nbytes), 0) FROM entries").fetchone()
+        if size_bytes <= self.max_size_bytes:
+            return
+
+        # Evict down to 90% of the limit so eviction does not run on every insert
+        to_free = size_bytes - int(self.max_size_bytes * 0.9)
+        evicted = []
+        for model_name, task, dtype, text_hash, store_id, slot, nbytes in self.connection.execute(
+            "SELECT model_name, task, dtype, text_hash, store_id, slot, nbytes FROM entries ORDER BY last_access"
+        ):
+            evicted.append((model_name, task, dtype, text_hash, store_id, slot))
+            to_free -= nbytes
+            if to_free <= 0:
+                break
+
+        self.connection.executemany(
+            "DELETE FROM entries WHERE model_name = ? AND task = ? AND dtype = ? AND text_hash = ?",
+            [(model_name, task, dtype, text_hash) for model_name, task, dtype, text_hash, _, _ in evicted],
+        )
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO dense_free_slots (store_id, slot) VALUES (?, ?)",
+            [(store_id, slot) for _, _, _, _, store_id, slot in evicted if store_id is not None],
+        )
+
+    def get_dense(self, model_name: str, task: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        with self.lock:
+            found = self.__lookup(model_name, task, texts)
+            store = self.__get_dense_store(model_name, task)
+
+            embeddings = []
+            for text in texts:
+                entry = found.get(self.get_text_hash(text))
+                # Slots are only valid in the store they were allocated in
+                if entry is None or store is None or entry[0] != store[0]:
+                    embeddings.append(None)
+                    continue
+                store_id, dim, capacity = store
+                matrix = self.__get_dense_matrix(store_id, dim, capacity)
+                embeddings.append(np.asarray(matrix[entry[1]], dtype=np.float32))
+
+            hits = sum(embedding is not None for embedding in embeddings)
+            self.hits += hits
+            self.misses += len(embeddings) - hits
+            return embeddings
+
+    def put_dense(self, model_name: str, task: str, texts: List[str], embeddings: np.ndarray):
+        unique = {self.get_text_hash(text): idx for idx, text in enumerate(texts)}
+        if not unique:
+            return
+
+        with self.lock:
+            store_id, dim, capacity = self.__get_dense_store(model_name, task, dim=embeddings.shape[1])
+            existing = {
+                text_hash: entry for text_hash, entry in self.__lookup(model_name, task, texts).items() if entry[0] == store_id
+            }
+            new_hashes = [text_hash for text_hash in unique if text_hash not in existing]
+
+            slots, capacity = self.__allocate_dense_slots(store_id, dim, capacity, len(new_hashes))
+            matrix = self.__get_dense_matrix(store_id, dim, capacity)
+            slot_by_hash = {text_hash: slot for text_hash, slot in zip(new_hashes, slots)}
+            slot_by_hash.update({text_hash: entry[1] for text_hash, entry in existing.items()})
+            for text_hash, idx in unique.items():
+                matrix[slot_by_hash[text_hash]] = embeddings[idx]
+            matrix.flush()
+
+            now = time.time()
+            nbytes = dim * self.dtype.itemsize
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO entries (model_name, task, dtype, text_hash, store_id, slot, data, nbytes, last_access) VALUES (?, ?, ?, ?, ?, ?, NULL, ?, ?)",
+                [(model_name, task, self.dtype.name, text_hash, store_id, slot_by_hash[text_hash], nbytes, now) for text_hash in unique],
+            )
+            self.__evict()
+            self.connection.commit()
+
+    def get_sparse(self, model_name: str, texts: List[str]) -> List[Optional[Tuple[List[int], List[float]]]]:
+        with self.lock:
+            found = self.__lookup(model_name, SPARSE_TASK, texts)
+
+            embeddings = []
+            for text in texts:
+                entry = found.get(self.get_text_hash(text))
+                if entry is None:
+                    embeddings.append(None)
+                    continue
+                # Values are decoded with the dtype recorded next to the blob
+                data, dtype = entry[2], np.dtype(entry[3])
+                length = len(data) // (4 + dtype.itemsize)
+                indices = np.frombuffer(data, dtype=np.int32, count=length)
+                values = np.frombuffer(data, dtype=dtype, count=length, offset=4 * length)
+                embeddings.append((indices.tolist(), values.astype(np.float32).tolist()))
+
+            hits = sum(embedding is not None for embedding in embeddings)
+            self.hits += hits
+            self.misses += len(embeddings) - hits
+            return embeddings
+
+    def put_sparse(self, model_name: str, texts: List[str], embeddings: List[Tuple[List[int], List[float]]]):
+        now = time.time()
+        rows = {}
+        for text, (indices, values) in zip(texts, embeddings):
+            data = np.asarray(indices, dtype=np.int32).tobytes() + np.asarray(values, dtype=self.dtype).tobytes()
+            rows[self.get_text_hash(text)] = (model_name, SPARSE_TASK, self.dtype.name, self.get_text_hash(text), data, len(data), now)
+
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO entries (model_name, task, dtype, text_hash, store_id, slot, data, nbytes, last_access) VALUES (?, ?, ?, ?, NULL, NULL, ?, ?, ?)",
+                list(rows.values()),
+            )
+            self.__evict()
+            self.connection.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            entries, size_bytes = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM entries"
+            ).fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "size_bytes": size_bytes,
+        }
+
+    def close(self):
+        with self.lock:
+            for matrix in self.dense_matrices.values():
+                matrix.flush()
+            self.dense_matrices.clear()
+            self.connection.close()
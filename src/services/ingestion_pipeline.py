@@ -0,0 +1,308 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import uuid
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+import tqdm
+
+from models import Plague, VectorizableDocument
+from text_chunker import TokenChunker, iter_split_texts
+from .vector_store import VectorStore
+
+SPARSE = "sparse"
+DENSE = "dense"
+
+# Namespace for deterministic point IDs, never change it or every ID changes with it
+POINT_ID_NAMESPACE = uuid.UUID("6f1c0f5e-4a43-4a8e-9d3b-2f0b7c1a9e52")
+
+# Bump whenever the point layout or chunking changes so --incremental re-indexes every species
+INDEX_SCHEMA_VERSION = 3
+
+CHUNK_SEPARATOR = "\n" + "-" * 80 + "\n"
+
+_END = object()
+
+
+class _ProducerError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def get_safe_filename(filename: str, word_limit=5):
+    words = filename.split()
+    limited_name = " ".join(words[:word_limit])
+    safe_filename = "".join(
+        c for c in limited_name if c.isalnum() or c in (" ", "_", "-")
+    ).rstrip()
+    return safe_filename
+
+
+def iter_content_chunks(directory: str = "data/content_chunks") -> Iterator[Tuple[str, str]]:
+    """
+    Reads back the chunk dumps written during ingestion, yielding (species name, chunk text).
+    """
+    for filename in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
+            for block in f.read().split(CHUNK_SEPARATOR):
+                # Each dumped chunk ends with a "Text Len: N" line
+                text = block.rsplit("\nText Len:", 1)[0].strip()
+                if text:
+                    yield os.path.splitext(filename)[0], text
+
+
+def load_content_chunks(directory: str = "data/content_chunks", limit: Optional[int] = None) -> List[str]:
+    return [text for _, text in islice(iter_content_chunks(directory), limit)]
+
+
+def get_point_id(source_url: str, scientific_name: str, kind: str, chunk_index: int = 0) -> str:
+    # scientific_name is part of the key because several species may share a source_url
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source_url}|{scientific_name}|{kind}|{chunk_index}"))
+
+
+def get_content_hash(plague: Plague) -> str:
+    serialized = json.dumps(
+        [INDEX_SCHEMA_VERSION, plague.scientific_name, plague.common_names, plague.source_url, plague.is_quarantine, plague.content],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def prefetch(iterable: Iterable, max_pending: int) -> Iterator:
+    """
+    Consumes `iterable` on a background thread through a bounded queue. The producer
+    blocks once `max_pending` items are waiting, so upstream stages never run ahead
+    of the consumer by more than that.
+    """
+    pending = queue.Queue(maxsize=max_pending)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_ProducerError(e))
+            return
+        put(_END)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is _END:
+                break
+            if isinstance(item, _ProducerError):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
+
+
+class IngestionPipeline:
+    """
+    Streams plagues into the vector store: source rows -> content fetch -> token chunking
+    -> batched encoding -> batched upsert. At most (max_pending_batches + 2) batches of
+    `batch_size` documents are alive at any time, whatever the size of the corpus.
+    Chunking runs on `chunk_workers` processes when set, and chunks are only dumped to
+    `chunks_dump_dir` when one is given.
+    """
+
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        collection_name: str,
+        chunker: TokenChunker,
+        batch_size: int = 256,
+        encode_batch_size: int = 32,
+        max_pending_batches: int = 4,
+        chunk_workers: int = 0,
+        chunks_dump_dir: Optional[str] = None,
+    ):
+        self.vector_store = vector_store
+        self.collection_name = collection_name
+        self.chunker = chunker
+        self.batch_size = batch_size
+        self.encode_batch_size = encode_batch_size
+        self.max_pending_batches = max_pending_batches
+        self.chunk_workers = chunk_workers
+        self.chunks_dump_dir = chunks_dump_dir
+        self.progress: Dict[str, tqdm.tqdm] = {}
+        self.upserted_point_ids: Optional[Set[str]] = None
+
+    def __dump_content_chunks(self, plague: Plague, content_chunks: List[str]):
+        # Save content chunks to a file for debugging or inspection, one buffered write per species
+        safe_filename = get_safe_filename(plague.scientific_name)
+        separator = CHUNK_SEPARATOR.lstrip("\n")
+        dump = "".join(
+            f"{content_chunk}\nText Len: {len(content_chunk)}\n{separator}" for content_chunk in content_chunks
+        )
+        with open(
+            f"{self.chunks_dump_dir}/{safe_filename}.txt",
+            "a",
+            encoding="utf-8",
+        ) as f:
+            f.write(dump)
+
+    def iter_documents(self, plagues: Iterable[Plague]) -> Iterator[Tuple[str, VectorizableDocument]]:
+        chunked_plagues = iter_split_texts(
+            self.chunker, ((plague, plague.content) for plague in plagues), workers=self.chunk_workers
+        )
+        for plague, content_chunks in chunked_plagues:
+            self.progress["plagues"].update(1)
+            content_hash = get_content_hash(plague)
+
+            point_id = get_point_id(plague.source_url, plague.scientific_name, SPARSE)
+            if self.upserted_point_ids is not None:
+                self.upserted_point_ids.add(point_id)
+            yield SPARSE, VectorizableDocument(
+                id=point_id,
+                text=plague.keywords,
+                metadata={
+                    "scientific_name": plague.scientific_name,
+                    "common_names": plague.common_names,
+                    "source_url": plague.source_url,
+                    "es_cuarentenaria": plague.is_quarantine,
+                    "content_hash": content_hash,
+                },
+            )
+
+            if self.chunks_dump_dir:
+                self.__dump_content_chunks(plague, content_chunks)
+
+            for chunk_index, content_chunk in enumerate(content_chunks):
+                point_id = get_point_id(plague.source_url, plague.scientific_name, DENSE, chunk_index)
+                if self.upserted_point_ids is not None:
+                    self.upserted_point_ids.add(point_id)
+                self.progress["chunks"].update(1)
+                # Chunks also carry the species keywords sparse vector for hybrid search
+                yield DENSE, VectorizableDocument(
+                    id=point_id,
+                    text=content_chunk,
+                    sparse_text=plague.keywords,
+                    metadata={
+                        "scientific_name": plague.scientific_name,
+                        "common_names": plague.common_names,
+                        "source_url": plague.source_url,
+                        "content_chunk": content_chunk,
+                        "es_cuarentenaria": plague.is_quarantine,
+                        "content_hash": content_hash,
+                    },
+                )
+
+    def iter_batches(self, documents: Iterable[Tuple[str, VectorizableDocument]]) -> Iterator[Tuple[str, List[VectorizableDocument]]]:
+        buffers: Dict[str, List[VectorizableDocument]] = {SPARSE: [], DENSE: []}
+        for kind, document in documents:
+            buffers[kind].append(document)
+            if len(buffers[kind]) >= self.batch_size:
+                yield kind, buffers[kind]
+                buffers[kind] = []
+
+        for kind, buffer in buffers.items():
+            if buffer:
+                yield kind, buffer
+
+    def run(self, plagues: Iterable[Plague]) -> int:
+        if self.chunks_dump_dir and not os.path.exists(self.chunks_dump_dir):
+            os.makedirs(self.chunks_dump_dir, exist_ok=True)
+
+        self.progress = {
+            "plagues": tqdm.tqdm(desc="# Plagues fetched", unit="plague", position=0),
+            "chunks": tqdm.tqdm(desc="# Chunks produced", unit="chunk", position=1),
+            SPARSE: tqdm.tqdm(desc="# Sparse points upserted", unit="point", position=2),
+            DENSE: tqdm.tqdm(desc="# Dense points upserted", unit="point", position=3),
+        }
+
+        total_points = 0
+        try:
+            batches = prefetch(self.iter_batches(self.iter_documents(plagues)), self.max_pending_batches)
+            for kind, batch in batches:
+                total_points += self.vector_store.add_documents(
+                    self.collection_name,
+                    batch,
+                    use_sparse=True,
+                    use_dense=kind == DENSE,
+                    batch_size=self.encode_batch_size,
+                    verbose=False,
+                )
+                self.progress[kind].update(len(batch))
+            self.vector_store.flush(self.collection_name)
+        finally:
+            for progress_bar in self.progress.values():
+                progress_bar.close()
+
+        return total_points
+
+    def get_indexed_species(self) -> Dict[Tuple[str, str], Tuple[Optional[str], List[Union[int, str]]]]:
+        indexed_species: Dict[Tuple[str, str], Tuple[Optional[str], List[Union[int, str]]]] = {}
+        points = self.vector_store.iter_points(
+            self.collection_name, ["source_url", "scientific_name", "content_hash"]
+        )
+        for point_id, payload in points:
+            key = (payload.get("source_url"), payload.get("scientific_name"))
+            content_hash, point_ids = indexed_species.setdefault(key, (payload.get("content_hash"), []))
+            # Mixed hashes mean a previous run was interrupted, force a re-index
+            if content_hash != payload.get("content_hash"):
+                indexed_species[key] = (None, point_ids)
+            point_ids.append(point_id)
+        return indexed_species
+
+    def run_incremental(self, plagues: Iterable[Plague]) -> Tuple[int, int]:
+        """
+        Embeds and upserts only new or changed plagues, then deletes the points of plagues
+        whose source disappeared and the leftover chunks of plagues that got shorter.
+        Returns the number of upserted and deleted points.
+        """
+        indexed_species = self.get_indexed_species()
+        print(f"# Species already indexed: {len(indexed_species)}")
+
+        seen_keys: Set[Tuple[str, str]] = set()
+        changed_keys: Set[Tuple[str, str]] = set()
+        unchanged_count = 0
+
+        def iter_changed_plagues() -> Iterator[Plague]:
+            nonlocal unchanged_count
+            for plague in plagues:
+                key = (plague.source_url, plague.scientific_name)
+                seen_keys.add(key)
+                indexed = indexed_species.get(key)
+                if indexed is not None and indexed[0] == get_content_hash(plague):
+                    unchanged_count += 1
+                    continue
+                if indexed is not None:
+                    changed_keys.add(key)
+                yield plague
+
+        self.upserted_point_ids = set()
+        try:
+            total_points = self.run(iter_changed_plagues())
+
+            stale_point_ids = []
+            for key, (_, point_ids) in indexed_species.items():
+                if key not in seen_keys or key in changed_keys:
+                    stale_point_ids.extend(
+                        point_id for point_id in point_ids if point_id not in self.upserted_point_ids
+                    )
+        finally:
+            self.upserted_point_ids = None
+
+        print(f"# Unchanged species skipped: {unchanged_count}")
+        print(f"# Removed species: {len([key for key in indexed_species if key not in seen_keys])}")
+        deleted_points = self.vector_store.delete_points(self.collection_name, stale_point_ids)
+        self.vector_store.flush(self.collection_name)
+        return total_points, deleted_points
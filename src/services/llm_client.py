@@ -0,0 +1,181 @@
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import metrics
+
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class LLMRequestError(RuntimeError):
+    pass
+
+
+def parse_chat_line(line: bytes) -> Optional[Dict]:
+    # One NDJSON object per line, optionally in the "data: " server-sent events framing
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith(b"data: "):
+        line = line[6:]
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError:
+        metrics.increment("llm_invalid_chunks_total")
+        return None
+    if "error" in data:
+        raise LLMRequestError(f"Ollama error: {data['error']}")
+    return data
+
+
+class GenerationTimer:
+    # Ollama streams one token per chunk, so chunks with content count as tokens
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_seconds: Optional[float] = None
+        self.tokens = 0
+
+    def add_token(self):
+        self.tokens += 1
+        if self.first_token_seconds is None:
+            self.first_token_seconds = time.perf_counter() - self.start
+
+    def record(self):
+        if not metrics.enabled:
+            return
+        total_seconds = time.perf_counter() - self.start
+        metrics.observe("llm_generation_seconds", total_seconds)
+        metrics.increment("llm_tokens_total", self.tokens)
+        if self.first_token_seconds is not None:
+            metrics.observe("llm_time_to_first_token_seconds", self.first_token_seconds)
+            if self.tokens > 1 and total_seconds > self.first_token_seconds:
+                metrics.observe(
+                    "llm_tokens_per_second",
+                    (self.tokens - 1) / (total_seconds - self.first_token_seconds),
+                    buckets=TOKENS_PER_SECOND_BUCKETS,
+                )
+
+
+class OllamaClient:
+    """
+    Streaming client for the Ollama /api/chat endpoint. Connections are pooled and
+    kept alive across queries, both for the blocking stream_chat and the asyncio
+    astream_chat. The read timeout bounds the wait for every chunk, not the whole
+    answer, so long generations are not cut while a stalled server is.
+    Streams are read to the end so their connection returns to the pool; closing a
+    stream early (or cancelling the task reading it) closes its connection instead,
+    which makes Ollama stop generating.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:11434",
+        keep_alive: Optional[str] = "30m",
+        connect_timeout: float = 5,
+        read_timeout: float = 120,
+        pool_size: int = 16,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.keep_alive = keep_alive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        # Created on first use, inside the event loop that uses it
+        self.async_session: Optional[aiohttp.ClientSession] = None
+
+    def build_request(self, payload: Dict) -> Dict:
+        # keep_alive tells Ollama how long to keep the model loaded after this request
+        if self.keep_alive is not None and "keep_alive" not in payload:
+            payload = {**payload, "keep_alive": self.keep_alive}
+        return payload
+
+    def preload(self, model_name: str) -> bool:
+        """
+        Loads the model into Ollama memory ahead of the first query (a chat request
+        without messages only loads the model). Returns False when Ollama is unreachable.
+        """
+        try:
+            response = self.session.post(
+                f"{self.base_url}/api/chat",
+                json=self.build_request({"model": model_name, "messages": []}),
+                timeout=(self.connect_timeout, self.read_timeout),
+            )
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"# LLM preload failed: {e}")
+            return False
+        print(f"# LLM preloaded: {model_name} (keep_alive {self.keep_alive})")
+        return True
+
+    def stream_chat(self, payload: Dict) -> Iterator[str]:
+        timer = GenerationTimer()
+        try:
+            with self.session.post(
+                f"{self.base_url}/api/chat",
+                json=self.build_request(payload),
+                stream=True,
+                timeout=(self.connect_timeout, self.read_timeout),
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    data = parse_chat_line(line)
+                    if data is None:
+                        continue
+                    content = data.get("message", {}).get("content", "")
+                    if content:
+                        timer.add_token()
+                        yield content
+        except requests.RequestException as e:
+            metrics.increment("llm_errors_total", error=type(e).__name__)
+            raise LLMRequestError(f"Ollama request failed: {e}") from e
+        timer.record()
+
+    async def astream_chat(self, payload: Dict) -> AsyncIterator[str]:
+        if self.async_session is None or self.async_session.closed:
+            self.async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+            )
+
+        timer = GenerationTimer()
+        try:
+            async with self.async_session.post(f"{self.base_url}/api/chat", json=self.build_request(payload)) as response:
+                response.raise_for_status()
+                async for line in response.content:
+                    data = parse_chat_line(line)
+                    if data is None:
+                        continue
+                    content = data.get("message", {}).get("content", "")
+                    if content:
+                        timer.add_token()
+                        yield content
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            metrics.increment("llm_errors_total", error=type(e).__name__)
+            raise LLMRequestError(f"Ollama request failed: {e!r}") from e
+        timer.record()
+
+    def close(self):
+        self.session.close()
+
+    async def aclose(self):
+        if self.async_session is not None:
+            await self.async_session.close()
+
+
+def create_llm_client() -> OllamaClient:
+    return OllamaClient(
+        os.getenv("OLLAMA_URL", "http://localhost:11434"),
+        keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "30m") or None,
+        connect_timeout=float(os.getenv("OLLAMA_CONNECT_TIMEOUT_SECONDS", "5")),
+        read_timeout=float(os.getenv("OLLAMA_READ_TIMEOUT_SECONDS", "120")),
+        pool_size=int(os.getenv("OLLAMA_POOL_SIZE", "16")),
+    )
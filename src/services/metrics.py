@@ -0,0 +1,219 @@
+import atexit
+import os
+import threading
+import time
+from contextlib import ExitStack
+from typing import Any, Callable, ContextManager, Dict, Iterable, List, Optional, Tuple
+
+# Latency buckets in seconds, from sub-millisecond cache hits to long generations
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+METRIC_PREFIX = "rag_"
+
+LabelsKey = Tuple[Tuple[str, str], ...]
+# (metric name, "counter" | "gauge", labels, value)
+Sample = Tuple[str, str, Dict[str, str], float]
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    def __init__(self, metrics: "Metrics", name: str, labels: Dict[str, str]):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.hooks = ExitStack()
+
+    def __enter__(self):
+        for hook in self.metrics.span_hooks:
+            self.hooks.enter_context(hook(self.name, self.labels))
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe(f"{self.name}_seconds", time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None:
+            self.metrics.increment(f"{self.name}_errors_total", **self.labels)
+        return self.hooks.__exit__(exc_type, exc_value, traceback)
+
+
+class Metrics:
+    """
+    In-process counters, histograms and timing spans, rendered in the Prometheus text
+    format. While disabled every call returns before taking the lock, so the
+    instrumentation left in the hot paths costs one attribute check.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.counters: Dict[Tuple[str, LabelsKey], float] = {}
+        self.histograms: Dict[Tuple[str, LabelsKey], Histogram] = {}
+        self.collectors: List[Callable[[], Iterable[Sample]]] = []
+        # Called as hook(name, labels) on span start, must return a context manager
+        self.span_hooks: List[Callable[[str, Dict[str, str]], ContextManager]] = []
+        self.lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def span(self, name: str, **labels):
+        # Records <name>_seconds, plus <name>_errors_total when the block raises
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, labels)
+
+    def add_collector(self, collect: Callable[[], Iterable[Sample]]):
+        # Collectors are read at render time, for values other components already keep
+        self.collectors.append(collect)
+
+    def add_span_hook(self, hook: Callable[[str, Dict[str, str]], ContextManager]):
+        self.span_hooks.append(hook)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render_prometheus(self) -> str:
+        lines = []
+        declared = set()
+
+        def declare(name: str, metric_type: str):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {metric_type}")
+
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, (histogram.buckets, list(histogram.counts), histogram.sum, histogram.count))
+                for key, histogram in self.histograms.items()
+            )
+
+        for (name, labels), value in counters:
+            declare(METRIC_PREFIX + name, "counter")
+            lines.append(f"{METRIC_PREFIX}{name}{format_labels(labels)} {value:g}")
+
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            name = METRIC_PREFIX + name
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total:g}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+
+        # Prometheus expects the samples of one metric to be contiguous
+        samples = [sample for collect in self.collectors for sample in collect()]
+        for name, metric_type, labels, value in sorted(samples, key=lambda sample: sample[0]):
+            declare(METRIC_PREFIX + name, metric_type)
+            lines.append(f"{METRIC_PREFIX}{name}{format_labels(tuple(sorted(labels.items())))} {value:g}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        # Atomic replace, so a textfile collector never reads a partial file
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+
+def format_labels(labels: LabelsKey) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def collect_cache_metrics(caches: Dict[str, Any]) -> Iterable[Sample]:
+    # Works for LRUCache and EmbeddingCache, both keep hit and miss counts in stats()
+    for cache_name, cache in caches.items():
+        if cache is None:
+            continue
+        stats = cache.stats()
+        yield "cache_hits_total", "counter", {"cache": cache_name}, stats["hits"]
+        yield "cache_misses_total", "counter", {"cache": cache_name}, stats["misses"]
+        yield "cache_entries", "gauge", {"cache": cache_name}, stats.get("size", stats.get("entries", 0))
+
+
+metrics = Metrics()
+
+
+def enable_opentelemetry(tracer_name: str = "rag-pipeline") -> bool:
+    """
+    Mirrors every span to the OpenTelemetry tracer provider configured by the
+    application. opentelemetry-api is optional and only needed when this is enabled.
+    """
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        print("# OpenTelemetry tracing requested but opentelemetry-api is not installed")
+        return False
+
+    tracer = trace.get_tracer(tracer_name)
+    metrics.add_span_hook(lambda name, labels: tracer.start_as_current_span(name, attributes=labels))
+    return True
+
+
+def configure_metrics(metrics_file: Optional[str] = None):
+    """
+    Enables the metrics from METRICS_ENABLED and OTEL_TRACING_ENABLED. With a metrics
+    file (METRICS_FILE by default) the Prometheus text is written there on exit.
+    """
+    if metrics.enabled or os.getenv("METRICS_ENABLED", "false").lower() != "true":
+        return
+    metrics.enabled = True
+    if os.getenv("OTEL_TRACING_ENABLED", "false").lower() == "true":
+        enable_opentelemetry()
+
+    metrics_file = metrics_file or os.getenv("METRICS_FILE")
+    if metrics_file:
+        atexit.register(metrics.write_prometheus, metrics_file)
+    print("# Metrics enabled" + (f", written to: {metrics_file}" if metrics_file else ""))
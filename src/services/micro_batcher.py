@@ -0,0 +1,146 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads and processes them together. A batch is
+    flushed when `max_batch_size` items are waiting or `batch_window_ms` has elapsed
+    since its first item arrived, whichever comes first. `process_batch` receives the
+    list of items and must return one result per item, in order. Every submitted future
+    is resolved: with its result, the batch error, or an error once the batcher is closed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 32,
+        batch_window_ms: float = 10,
+        max_queue_size: int = 1024,
+    ):
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.batch_window_ms = batch_window_ms
+        self.max_queue_size = max_queue_size
+        self.pending = queue.Queue(maxsize=max_queue_size)
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.last_batch_size = 0
+        self.largest_batch_size = 0
+        self.closed = False
+        self.worker = threading.Thread(target=self.__run, name=f"micro-batcher-{name}", daemon=True)
+        self.worker.start()
+
+    def submit(self, item: Any) -> Future:
+        if self.closed:
+            raise RuntimeError(f"Micro-batcher {self.name} is closed")
+        future = Future()
+        # Blocks the caller when the queue is full, which is the backpressure we want
+        self.pending.put((item, future))
+        if self.closed and not self.worker.is_alive():
+            # Queued after close() drained the queue, nothing would process it
+            self.__fail_pending()
+        return future
+
+    def process(self, item: Any) -> Any:
+        return self.submit(item).result()
+
+    def process_many(self, items: List[Any]) -> List[Any]:
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def __run(self):
+        stopping = False
+        while not stopping:
+            first = self.pending.get()
+            if first is _STOP:
+                break
+
+            batch = [first]
+            deadline = time.monotonic() + self.batch_window_ms / 1000
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self.pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+
+            self.__process(batch)
+
+    def __process(self, batch: List[tuple]):
+        # Cancelled futures are dropped, the others can no longer be cancelled
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        with self.lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.last_batch_size = len(batch)
+            self.largest_batch_size = max(self.largest_batch_size, len(batch))
+
+        # BaseException too (e.g. a KeyboardInterrupt raised inside torch): the worker must
+        # survive it, or every later submit would wait forever
+        try:
+            results = list(self.process_batch([item for item, _ in batch]))
+        except BaseException as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        if len(results) != len(batch):
+            # Results can no longer be matched to their items, none of them is returned
+            error = RuntimeError(f"Micro-batcher {self.name} got {len(results)} results for {len(batch)} items")
+            for _, future in batch:
+                future.set_exception(error)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def __fail_pending(self):
+        while True:
+            try:
+                entry = self.pending.get_nowait()
+            except queue.Empty:
+                return
+            if entry is not _STOP:
+                _, future = entry
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(RuntimeError(f"Micro-batcher {self.name} is closed"))
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            return {
+                "queue_depth": self.pending.qsize(),
+                "max_queue_size": self.max_queue_size,
+                "batch_window_ms": self.batch_window_ms,
+                "max_batch_size": self.max_batch_size,
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+                "last_batch_size": self.last_batch_size,
+                "largest_batch_size": self.largest_batch_size,
+            }
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.pending.put(_STOP)
+        self.worker.join()
+        # Items queued behind the stop marker are never processed
+        self.__fail_pending()
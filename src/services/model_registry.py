@@ -0,0 +1,80 @@
+import gc
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, Tuple
+
+from sentence_transformers import SentenceTransformer
+
+from .quantization import apply_inference_precision
+from .metrics import Sample, metrics
+
+
+def get_rss_bytes() -> int:
+    # Resident set size of the process, Linux only
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+class ModelRegistry:
+    """
+    Process-wide store of loaded models, keyed by (kind, model name, *options). Every
+    component asking for the same key gets the same instance, so each model is loaded
+    once per process however many encoders, query processors or rerankers use it.
+    """
+
+    def __init__(self):
+        self.models: Dict[Tuple[Hashable, ...], Any] = {}
+        self.load_stats: Dict[Tuple[Hashable, ...], Dict[str, float]] = {}
+        # Loads are serialized, which also keeps the per-model memory deltas accurate
+        self.lock = threading.RLock()
+
+    def get(self, key: Tuple[Hashable, ...], load_model: Callable[[], Any]) -> Any:
+        with self.lock:
+            if key not in self.models:
+                rss_before = get_rss_bytes()
+                start = time.perf_counter()
+                self.models[key] = load_model()
+                self.load_stats[key] = {
+                    "load_seconds": time.perf_counter() - start,
+                    "rss_delta_mb": (get_rss_bytes() - rss_before) / 1024 ** 2,
+                }
+                stats = self.load_stats[key]
+                print(f"# Model loaded: {self.__format_key(key)} in {stats['load_seconds']:.1f}s (+{stats['rss_delta_mb']:.0f} MB)")
+            return self.models[key]
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            return {self.__format_key(key): dict(stats) for key, stats in self.load_stats.items()}
+
+    def collect_metrics(self) -> Iterable[Sample]:
+        for name, stats in self.stats().items():
+            yield "model_load_seconds", "gauge", {"model": name}, stats["load_seconds"]
+            yield "model_rss_delta_bytes", "gauge", {"model": name}, stats["rss_delta_mb"] * 1024 ** 2
+
+    def clear(self):
+        # Drops the registry references; models are freed once no component holds them
+        with self.lock:
+            self.models.clear()
+            self.load_stats.clear()
+        gc.collect()
+
+    def __format_key(self, key: Tuple[Hashable, ...]) -> str:
+        kind, model_name, *options = key
+        return f"{kind}:{model_name}" + (f" ({', '.join(map(str, options))})" if options else "")
+
+
+model_registry = ModelRegistry()
+metrics.add_collector(model_registry.collect_metrics)
+
+
+def get_sentence_transformer(model_name: str, inference_precision: str = "fp32") -> SentenceTransformer:
+    # Shared by TextEncoder (dense embeddings) and QueryProcessor (KeyBERT)
+    def load_model() -> SentenceTransformer:
+        model = SentenceTransformer(model_name, trust_remote_code=True)
+        return apply_inference_precision(model, inference_precision, model.device)
+
+    return model_registry.get(("dense", model_name, "torch", inference_precision), load_model)
@@ -0,0 +1,632 @@
+import json
+import math
+import mmap
+import os
+import shutil
+import threading
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from qdrant_client import models
+
+from models import VectorizableDocument
+from .text_encoder import TextEncoder
+from .query_cache import LRUCache
+from .metrics import metrics
+from .vector_store import (
+    HYBRID_SEARCH_MODES,
+    PAYLOAD_INDEXES,
+    QUANTIZATION_TYPES,
+    FilterCriteria,
+    PayloadSelector,
+    build_search_cache_key,
+    encode_documents,
+    read_collection_version,
+    write_collection_version,
+)
+
+# Same rank constant as the Qdrant RRF fusion, so both backends rank alike
+RRF_RANKING_CONSTANT = 2
+# Rows scored per matrix product, bounds the float32 copy made of float16 matrices
+DENSE_BLOCK_ROWS = 16384
+DENSE_DTYPES = ("float32", "float16")
+# Share of the dense values kept inside the int8 range, the rest are clipped (as Qdrant's quantile)
+INT8_QUANTILE = 0.99
+INT8_SAMPLE_SIZE = 1_000_000
+# int8 rows converted to float32 per matrix product, small enough for the copy to stay in CPU cache
+QUANTIZED_BLOCK_ROWS = 1024
+
+
+def load_array(path: str) -> np.ndarray:
+    # Empty arrays cannot be memory-mapped
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        return np.load(path)
+
+
+def gather_ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # Positions of the concatenated [start, end) ranges, without a Python loop
+    lengths = (ends - starts).astype(np.int64)
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts.astype(np.int64) - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(total, dtype=np.int64)
+
+
+def top_k_rows(rows: np.ndarray, scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    if len(rows) > top_k:
+        selected = np.argpartition(-scores, top_k - 1)[:top_k]
+        rows, scores = rows[selected], scores[selected]
+    order = np.argsort(-scores, kind="stable")
+    return rows[order], scores[order]
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def quantize_int8(dense: np.ndarray) -> Tuple[np.ndarray, Dict[str, float]]:
+    # x ~= low + step * (code + 128), with low and high the bounds of the central INT8_QUANTILE of the values
+    values = dense.reshape(-1)
+    if len(values) > INT8_SAMPLE_SIZE:
+        values = values[np.random.default_rng(0).choice(len(values), INT8_SAMPLE_SIZE, replace=False)]
+    values = values.astype(np.float32)
+    low, high = (
+        np.quantile(values, [(1 - INT8_QUANTILE) / 2, (1 + INT8_QUANTILE) / 2]) if len(values) else (-1.0, 1.0)
+    )
+    step = max(float(high - low), 1e-12) / 255
+    codes = np.empty(dense.shape, dtype=np.int8)
+    for start in range(0, len(dense), DENSE_BLOCK_ROWS):
+        block = dense[start:start + DENSE_BLOCK_ROWS].astype(np.float32)
+        codes[start:start + len(block)] = np.clip(np.rint((block - low) / step) - 128, -128, 127)
+    return codes, {"low": float(low), "step": step}
+
+
+def quantize_binary(dense: np.ndarray) -> np.ndarray:
+    # One sign bit per dimension, padded to whole 64-bit words
+    bits = np.packbits(np.asarray(dense) > 0, axis=1)
+    padding = -bits.shape[1] % 8
+    if padding:
+        bits = np.pad(bits, ((0, 0), (0, padding)))
+    return np.ascontiguousarray(bits).view(np.uint64)
+
+
+if hasattr(np, "bitwise_count"):
+    def count_bits(words: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int32)
+else:
+    BYTE_BIT_COUNTS = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+    def count_bits(words: np.ndarray) -> np.ndarray:
+        return BYTE_BIT_COUNTS[words.view(np.uint8)].sum(axis=1, dtype=np.int32)
+
+
+def payload_values(payload: Dict, key: str) -> List:
+    value = payload.get(key)
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def fuse_rrf(results: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    rows = np.concatenate([result_rows for result_rows, _ in results])
+    weights = np.concatenate([
+        1.0 / (RRF_RANKING_CONSTANT + np.arange(len(result_rows))) for result_rows, _ in results
+    ])
+    fused_rows, inverse = np.unique(rows, return_inverse=True)
+    return fused_rows, np.bincount(inverse, weights=weights, minlength=len(fused_rows))
+
+
+def fuse_dbsf(results: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    # Distribution-Based Score Fusion: scores rescaled to mean +/- 3 standard deviations, then summed
+    normalized = []
+    for result_rows, result_scores in results:
+        result_scores = result_scores.astype(np.float64)
+        if len(result_scores) == 1:
+            normalized.append(np.full(1, 0.5))
+            continue
+        std_dev = result_scores.std(ddof=1) if len(result_scores) else 0.0
+        if std_dev == 0:
+            normalized.append(np.full(len(result_scores), 0.5))
+            continue
+        low = result_scores.mean() - 3 * std_dev
+        normalized.append((result_scores - low) / (6 * std_dev))
+    rows = np.concatenate([result_rows for result_rows, _ in results])
+    fused_rows, inverse = np.unique(rows, return_inverse=True)
+    return fused_rows, np.bincount(inverse, weights=np.concatenate(normalized), minlength=len(fused_rows))
+
+
+class NumpyCollection:
+    """
+    Read-only view of one saved collection. Vectors and payloads are memory-mapped,
+    so opening it only reads the point ids, the payload indexes and the config.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "config.json"), encoding="utf-8") as f:
+            self.config = json.load(f)
+        with open(os.path.join(path, "ids.json"), encoding="utf-8") as f:
+            self.ids: List[Union[int, str]] = json.load(f)
+
+        self.dense = load_array(os.path.join(path, "dense.npy"))
+        self.dense_rows = np.flatnonzero(load_array(os.path.join(path, "has_dense.npy")))
+        self.content_mask = load_array(os.path.join(path, "has_content.npy"))
+        # CSR (rows -> terms) to rebuild the collection, CSC postings (terms -> rows) to search it
+        self.sparse_indptr = load_array(os.path.join(path, "sparse_indptr.npy"))
+        self.sparse_indices = load_array(os.path.join(path, "sparse_indices.npy"))
+        self.sparse_values = load_array(os.path.join(path, "sparse_values.npy"))
+        self.postings_indptr = load_array(os.path.join(path, "postings_indptr.npy"))
+        self.postings_rows = load_array(os.path.join(path, "postings_rows.npy"))
+        self.postings_values = load_array(os.path.join(path, "postings_values.npy"))
+
+        # Quantized vectors are read into RAM, the originals stay memory-mapped for rescoring
+        self.quantization = self.config.get("quantization")
+        self.quantized = np.load(os.path.join(path, "dense_quantized.npy")) if self.quantization else None
+
+        self.payload_offsets = load_array(os.path.join(path, "payload_offsets.npy"))
+        with open(os.path.join(path, "payloads.jsonl"), "rb") as f:
+            self.payloads = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.payload_offsets[-1] else b""
+        with open(os.path.join(path, "payload_index.json"), encoding="utf-8") as f:
+            # field -> JSON-encoded value -> rows holding it
+            self.payload_index = {
+                field: {value: np.asarray(rows, dtype=np.int64) for value, rows in values.items()}
+                for field, values in json.load(f).items()
+            }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def payload_bytes(self, row: int) -> bytes:
+        return self.payloads[self.payload_offsets[row]:self.payload_offsets[row + 1]]
+
+    def payload(self, row: int) -> Dict:
+        return json.loads(self.payload_bytes(row))
+
+    def select_payload(self, row: int, with_payload: PayloadSelector) -> Optional[Dict]:
+        if with_payload is False:
+            return None
+        payload = self.payload(row)
+        if with_payload is True:
+            return payload
+        return {key: payload[key] for key in with_payload if key in payload}
+
+    def filter_mask(self, filter_criteria: Optional[FilterCriteria]) -> Optional[np.ndarray]:
+        if not filter_criteria:
+            return None
+        mask = np.ones(len(self), dtype=bool)
+        for key, values in filter_criteria.items():
+            values = values if isinstance(values, (list, tuple)) else [values]
+            encoded_values = {json.dumps(value) for value in values}
+            field_mask = np.zeros(len(self), dtype=bool)
+            index = self.payload_index.get(key)
+            if index is not None:
+                for encoded_value in encoded_values:
+                    rows = index.get(encoded_value)
+                    if rows is not None:
+                        field_mask[rows] = True
+            else:
+                # Fields without a payload index are matched by reading every payload
+                for row in range(len(self)):
+                    field_mask[row] = any(
+                        json.dumps(value) in encoded_values for value in payload_values(self.payload(row), key)
+                    )
+            mask &= field_mask
+        return mask
+
+    def dense_scores(self, query_vector: List[float], rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        # Rows are stored normalized, so the dot product is the cosine similarity
+        query_vector = normalize_rows(np.asarray(query_vector, dtype=np.float32))
+        if rows is not None:
+            return rows, self.dense[rows].astype(np.float32, copy=False) @ query_vector
+
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), DENSE_BLOCK_ROWS):
+            block = self.dense[start:start + DENSE_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32, copy=False) @ query_vector
+        return self.dense_rows, scores[self.dense_rows]
+
+    def quantized_scores(self, query_vector: List[float], rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        query_vector = normalize_rows(np.asarray(query_vector, dtype=np.float32))
+        quantized = self.quantized if rows is None else self.quantized[rows]
+        if self.quantization == "binary":
+            # Hamming distance between sign bits, mapped to a cosine-like score
+            distances = count_bits(np.bitwise_xor(quantized, quantize_binary(query_vector[None, :])))
+            scores = 1 - 2 * distances.astype(np.float32) / len(query_vector)
+        else:
+            params = self.config["quantization_params"]
+            scores = np.empty(len(quantized), dtype=np.float32)
+            for start in range(0, len(quantized), QUANTIZED_BLOCK_ROWS):
+                block = quantized[start:start + QUANTIZED_BLOCK_ROWS]
+                scores[start:start + len(block)] = block.astype(np.float32) @ query_vector
+            scores = params["step"] * (scores + 128 * query_vector.sum()) + params["low"] * query_vector.sum()
+        if rows is None:
+            return self.dense_rows, scores[self.dense_rows]
+        return rows, scores
+
+    def dense_top_k(self, query_vector: List[float], top_k: int, rows: Optional[np.ndarray] = None, oversampling: float = 1.0, rescore: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top-k over the original vectors, or over the quantized ones when the collection
+        is quantized: the best top_k * oversampling candidates are then rescored with their
+        original vectors, read from disk, unless rescore is False.
+        """
+        if self.quantization is None:
+            return top_k_rows(*self.dense_scores(query_vector, rows), top_k)
+        candidate_rows, scores = self.quantized_scores(query_vector, rows)
+        candidate_rows, scores = top_k_rows(candidate_rows, scores, max(top_k, math.ceil(top_k * oversampling)))
+        if rescore:
+            candidate_rows, scores = self.dense_scores(query_vector, np.sort(candidate_rows))
+        return top_k_rows(candidate_rows, scores, top_k)
+
+    def sparse_scores(self, indices: List[int], values: List[float]) -> Tuple[np.ndarray, np.ndarray]:
+        # Dot products summed over the postings of the query terms; rows sharing no term are left out
+        indices = np.asarray(indices, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float32)
+        known = indices < len(self.postings_indptr) - 1
+        indices, values = indices[known], values[known]
+        starts, ends = self.postings_indptr[indices], self.postings_indptr[indices + 1]
+        positions = gather_ranges(starts, ends)
+        rows = self.postings_rows[positions]
+        weights = self.postings_values[positions] * np.repeat(values, ends - starts)
+        scores = np.bincount(rows, weights=weights, minlength=len(self))
+        matched_rows = np.unique(rows)
+        return matched_rows, scores[matched_rows].astype(np.float32)
+
+
+class PendingWrites:
+    def __init__(self):
+        # point id -> (payload, dense vector, sparse vector); a later upsert of an id replaces it
+        self.points: Dict[Union[int, str], Tuple[Dict, Optional[np.ndarray], Optional[Tuple[List[int], List[float]]]]] = {}
+        self.deleted_ids = set()
+
+
+class NumpyVectorStore:
+    """
+    In-process index with the VectorStore interface, for corpora that fit in memory.
+    Dense vectors are a memory-mapped float32 or float16 matrix of normalized rows,
+    scored with one matrix product; sparse vectors are CSR arrays plus their inverted
+    (CSC) copy, scored through the postings of the query terms. Top-k uses argpartition
+    and filters on indexed payload fields become row masks built from precomputed row
+    lists. With int8 or binary quantization, dense candidates are selected on quantized
+    vectors held in RAM and rescored with the memory-mapped originals. Writes are
+    buffered and become visible on flush(), which rewrites the collection files and
+    swaps them in atomically.
+    """
+
+    def __init__(self, storage_path: str, text_encoder: TextEncoder, sparse_vectors_name: str, dense_vectors_name: str, search_cache: Optional[LRUCache] = None, dense_dtype: str = "float32", quantization: Optional[str] = None, quantization_oversampling: float = 2.0, quantization_rescore: bool = True):
+        if dense_dtype not in DENSE_DTYPES:
+            raise ValueError(f"Unknown dense dtype: {dense_dtype}. Expected one of {DENSE_DTYPES}")
+        if quantization is not None and quantization not in QUANTIZATION_TYPES:
+            raise ValueError(f"Unknown quantization: {quantization}. Expected one of {QUANTIZATION_TYPES}")
+        os.makedirs(storage_path, exist_ok=True)
+        self.storage_path = storage_path
+        self.text_encoder = text_encoder
+        self.sparse_vectors_name = sparse_vectors_name
+        self.dense_vectors_name = dense_vectors_name
+        self.search_cache = search_cache
+        self.dense_dtype = dense_dtype
+        self.quantization = quantization
+        self.quantization_oversampling = quantization_oversampling
+        self.quantization_rescore = quantization_rescore
+        self.collections: Dict[str, NumpyCollection] = {}
+        self.pending: Dict[str, PendingWrites] = {}
+        self.lock = threading.Lock()
+
+    def get_collection_path(self, collection_name: str) -> str:
+        return os.path.join(self.storage_path, collection_name)
+
+    def get_collection(self, collection_name: str) -> NumpyCollection:
+        collection = self.collections.get(collection_name)
+        if collection is not None:
+            return collection
+        with self.lock:
+            if collection_name not in self.collections:
+                if not self.collection_exists(collection_name):
+                    raise ValueError(f"Collection {collection_name} not found")
+                self.collections[collection_name] = NumpyCollection(self.get_collection_path(collection_name))
+            return self.collections[collection_name]
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return os.path.exists(os.path.join(self.get_collection_path(collection_name), "config.json"))
+
+    def get_collection_version(self, collection_name: str) -> str:
+        return read_collection_version(self.storage_path, collection_name)
+
+    def bump_collection_version(self, collection_name: str) -> str:
+        return write_collection_version(self.storage_path, collection_name)
+
+    def create_collection(self, collection_name: str, dense_vector_size: int):
+        config = {
+            "dense_size": dense_vector_size,
+            "dense_dtype": self.dense_dtype,
+            "sparse_vectors_name": self.sparse_vectors_name,
+            "dense_vectors_name": self.dense_vectors_name,
+            "payload_indexes": list(PAYLOAD_INDEXES),
+            "quantization": self.quantization,
+        }
+        self.pending.pop(collection_name, None)
+        self.__write_collection(
+            collection_name,
+            config,
+            [],
+            [],
+            np.zeros((0, dense_vector_size), dtype=self.dense_dtype),
+            np.zeros(0, dtype=bool),
+            (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)),
+        )
+
+    def create_payload_indexes(self, collection_name: str, payload_indexes: Optional[Dict[str, models.PayloadSchemaType]] = None) -> List[str]:
+        # Row lists are built for every indexed field at each flush, a new field only needs one rebuild
+        payload_indexes = PAYLOAD_INDEXES if payload_indexes is None else payload_indexes
+        collection = self.get_collection(collection_name)
+        created_indexes = [field for field in payload_indexes if field not in collection.config["payload_indexes"]]
+        if created_indexes:
+            self.__rewrite_collection(
+                collection_name,
+                {**collection.config, "payload_indexes": collection.config["payload_indexes"] + created_indexes},
+                PendingWrites(),
+            )
+        return created_indexes
+
+    def update_quantization(self, collection_name: str) -> bool:
+        # Rebuilds the quantized vectors from the stored originals when the setting changed
+        collection = self.get_collection(collection_name)
+        if collection.config.get("quantization") == self.quantization:
+            return False
+        self.__rewrite_collection(collection_name, {**collection.config, "quantization": self.quantization}, PendingWrites())
+        return True
+
+    def add_documents(self, collection_name: str, documents: List[VectorizableDocument], use_sparse: bool = False, use_dense: bool = False, batch_size: int = 32, verbose: bool = True):
+        with metrics.span("add_documents", kind="dense" if use_dense else "sparse"):
+            sparse_embeddings, dense_embeddings = encode_documents(
+                self.text_encoder, documents, use_sparse, use_dense, batch_size, verbose
+            )
+            pending = self.pending.setdefault(collection_name, PendingWrites())
+            for idx, doc in enumerate(documents):
+                pending.deleted_ids.discard(doc.id)
+                pending.points[doc.id] = (
+                    doc.metadata,
+                    np.asarray(dense_embeddings[idx], dtype=np.float32) if use_dense else None,
+                    sparse_embeddings[idx] if use_sparse else None,
+                )
+            if documents:
+                metrics.increment("points_upserted_total", len(documents), kind="dense" if use_dense else "sparse")
+            return len(documents)
+
+    def delete_points(self, collection_name: str, point_ids: List[Union[int, str]], batch_size: int = 1000) -> int:
+        pending = self.pending.setdefault(collection_name, PendingWrites())
+        for point_id in point_ids:
+            pending.points.pop(point_id, None)
+            pending.deleted_ids.add(point_id)
+        return len(point_ids)
+
+    def flush(self, collection_name: str):
+        """
+        Writes the buffered upserts and deletes of the collection. Searches keep using
+        the previous files until the new ones are complete.
+        """
+        pending = self.pending.pop(collection_name, None)
+        if pending is None or (not pending.points and not pending.deleted_ids):
+            return
+        with metrics.span("numpy_index_flush"):
+            self.__rewrite_collection(collection_name, self.get_collection(collection_name).config, pending)
+
+    def close(self):
+        for collection_name in list(self.pending):
+            self.flush(collection_name)
+        self.collections.clear()
+
+    def __rewrite_collection(self, collection_name: str, config: Dict, pending: PendingWrites):
+        collection = self.get_collection(collection_name)
+        replaced_ids = pending.deleted_ids | pending.points.keys()
+        kept_rows = np.asarray(
+            [row for row, point_id in enumerate(collection.ids) if point_id not in replaced_ids], dtype=np.int64
+        )
+        new_points = list(pending.points.items())
+
+        ids = [collection.ids[row] for row in kept_rows] + [point_id for point_id, _ in new_points]
+        payloads = [collection.payload_bytes(row) for row in kept_rows] + [
+            json.dumps(payload, ensure_ascii=False).encode("utf-8") for _, (payload, _, _) in new_points
+        ]
+
+        dense_vectors = np.zeros((len(new_points), config["dense_size"]), dtype=np.float32)
+        has_dense = np.zeros(len(new_points), dtype=bool)
+        for idx, (_, (_, dense_vector, _)) in enumerate(new_points):
+            if dense_vector is not None:
+                dense_vectors[idx] = dense_vector
+                has_dense[idx] = True
+        dense = np.concatenate([
+            np.asarray(collection.dense[kept_rows], dtype=config["dense_dtype"]),
+            normalize_rows(dense_vectors).astype(config["dense_dtype"]),
+        ])
+        has_dense = np.concatenate([np.isin(kept_rows, collection.dense_rows), has_dense])
+
+        kept_positions = gather_ranges(collection.sparse_indptr[kept_rows], collection.sparse_indptr[kept_rows + 1])
+        new_sparse = [sparse_vector or ([], []) for _, (_, _, sparse_vector) in new_points]
+        lengths = np.concatenate([
+            np.diff(collection.sparse_indptr)[kept_rows],
+            np.asarray([len(indices) for indices, _ in new_sparse], dtype=np.int64),
+        ])
+        sparse_indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        sparse_indices = np.concatenate(
+            [collection.sparse_indices[kept_positions]] + [np.asarray(indices, dtype=np.int32) for indices, _ in new_sparse]
+        ).astype(np.int32)
+        sparse_values = np.concatenate(
+            [collection.sparse_values[kept_positions]] + [np.asarray(values, dtype=np.float32) for _, values in new_sparse]
+        ).astype(np.float32)
+
+        self.__write_collection(collection_name, config, ids, payloads, dense, has_dense, (sparse_indptr, sparse_indices, sparse_values))
+
+    def __write_collection(self, collection_name: str, config: Dict, ids: List[Union[int, str]], payloads: List[bytes], dense: np.ndarray, has_dense: np.ndarray, sparse: Tuple[np.ndarray, np.ndarray, np.ndarray]):
+        path = self.get_collection_path(collection_name)
+        staging_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        os.makedirs(staging_path)
+
+        sparse_indptr, sparse_indices, sparse_values = sparse
+        rows = np.repeat(np.arange(len(ids), dtype=np.int32), np.diff(sparse_indptr))
+        order = np.argsort(sparse_indices, kind="stable")
+        vocabulary_size = int(sparse_indices.max()) + 1 if len(sparse_indices) else 0
+        postings_indptr = np.searchsorted(sparse_indices[order], np.arange(vocabulary_size + 1)).astype(np.int64)
+
+        payload_index = {field: {} for field in config["payload_indexes"]}
+        has_content = np.zeros(len(ids), dtype=bool)
+        for row, payload_bytes in enumerate(payloads):
+            payload = json.loads(payload_bytes)
+            has_content[row] = bool(payload.get("content_chunk"))
+            for field, values in payload_index.items():
+                for value in payload_values(payload, field):
+                    values.setdefault(json.dumps(value), []).append(row)
+
+        config = {key: value for key, value in config.items() if key != "quantization_params"}
+        arrays = {}
+        if config.get("quantization") == "int8":
+            arrays["dense_quantized"], config["quantization_params"] = quantize_int8(dense)
+        elif config.get("quantization") == "binary":
+            arrays["dense_quantized"] = quantize_binary(dense)
+        arrays.update({
+            "dense": dense,
+            "has_dense": has_dense,
+            "has_content": has_content,
+            "sparse_indptr": sparse_indptr,
+            "sparse_indices": sparse_indices,
+            "sparse_values": sparse_values,
+            "postings_indptr": postings_indptr,
+            "postings_rows": rows[order],
+            "postings_values": sparse_values[order],
+            "payload_offsets": np.concatenate([[0], np.cumsum([len(payload) for payload in payloads], dtype=np.int64)]).astype(np.int64),
+        })
+        for name, array in arrays.items():
+            np.save(os.path.join(staging_path, f"{name}.npy"), array)
+        with open(os.path.join(staging_path, "payloads.jsonl"), "wb") as f:
+            f.writelines(payloads)
+        for name, content in (("payload_index", payload_index), ("ids", ids), ("config", config)):
+            with open(os.path.join(staging_path, f"{name}.json"), "w", encoding="utf-8") as f:
+                json.dump(content, f, ensure_ascii=False)
+
+        # Open searches keep their memory maps of the old files, which stay valid once unlinked
+        with self.lock:
+            retired_path = None
+            if os.path.exists(path):
+                retired_path = f"{path}.old-{uuid.uuid4().hex}"
+                os.rename(path, retired_path)
+            os.rename(staging_path, path)
+            self.collections.pop(collection_name, None)
+        if retired_path is not None:
+            shutil.rmtree(retired_path, ignore_errors=True)
+        self.bump_collection_version(collection_name)
+        metrics.increment("numpy_index_flushes_total")
+
+    def iter_points(self, collection_name: str, payload_fields: List[str], batch_size: int = 1000) -> Iterator[Tuple[Union[int, str], Dict]]:
+        collection = self.get_collection(collection_name)
+        for row, point_id in enumerate(collection.ids):
+            yield point_id, collection.select_payload(row, payload_fields)
+
+    def __to_results(self, collection: NumpyCollection, rows: np.ndarray, scores: np.ndarray, with_payload: PayloadSelector) -> List[Tuple]:
+        return [
+            (collection.ids[row], float(score), collection.select_payload(row, with_payload))
+            for row, score in zip(rows.tolist(), scores.tolist())
+        ]
+
+    def get_search_params(self, oversampling: Optional[float], rescore: Optional[bool]) -> Tuple[float, bool]:
+        return (
+            self.quantization_oversampling if oversampling is None else oversampling,
+            self.quantization_rescore if rescore is None else rescore,
+        )
+
+    def __search_rows(self, collection: NumpyCollection, query_embedding: Union[models.NamedVector, models.NamedSparseVector], mask: Optional[np.ndarray], top_k: int, search_params: Tuple[float, bool]) -> Tuple[np.ndarray, np.ndarray]:
+        if isinstance(query_embedding, models.NamedSparseVector):
+            rows, scores = collection.sparse_scores(query_embedding.vector.indices, query_embedding.vector.values)
+            if mask is not None:
+                matched = mask[rows]
+                rows, scores = rows[matched], scores[matched]
+            return top_k_rows(rows, scores, top_k)
+        # Selective filters score only the matching rows
+        rows = collection.dense_rows[mask[collection.dense_rows]] if mask is not None else None
+        oversampling, rescore = search_params
+        return collection.dense_top_k(query_embedding.vector, top_k, rows, oversampling=oversampling, rescore=rescore)
+
+    def hybrid_search(
+        self,
+        collection_name: str,
+        sparse_query_embedding: models.NamedSparseVector,
+        dense_query_embedding: models.NamedVector,
+        mode: str = "rrf",
+        prefetch_limit: int = 100,
+        filter_criteria: Optional[FilterCriteria] = None,
+        top_k: int = 12,
+        with_payload: PayloadSelector = True,
+        oversampling: Optional[float] = None,
+        rescore: Optional[bool] = None,
+    ):
+        # Same modes, results and quantized search parameters as VectorStore.hybrid_search
+        if mode not in HYBRID_SEARCH_MODES:
+            raise ValueError(f"Unknown hybrid search mode: {mode}. Expected one of {HYBRID_SEARCH_MODES}")
+
+        search_params = self.get_search_params(oversampling, rescore)
+        if self.search_cache is not None:
+            # The collection version changes on every write, so results cached before an
+            # ingestion, rebuild or flush (possibly by another process) are never returned
+            key = (
+                "hybrid",
+                self.get_collection_version(collection_name),
+                mode,
+                prefetch_limit,
+                build_search_cache_key(collection_name, sparse_query_embedding, None, top_k),
+                build_search_cache_key(collection_name, dense_query_embedding, filter_criteria, top_k, with_payload),
+                search_params,
+            )
+            return self.search_cache.get_or_compute(
+                key,
+                lambda: self.__hybrid_search(collection_name, sparse_query_embedding, dense_query_embedding, mode, prefetch_limit, filter_criteria, top_k, with_payload, search_params),
+            )
+        return self.__hybrid_search(collection_name, sparse_query_embedding, dense_query_embedding, mode, prefetch_limit, filter_criteria, top_k, with_payload, search_params)
+
+    def __hybrid_search(self, collection_name, sparse_query_embedding, dense_query_embedding, mode, prefetch_limit, filter_criteria, top_k, with_payload, search_params):
+        collection = self.get_collection(collection_name)
+        # Only chunk points carry content, keyword-only points must not reach the results
+        mask = collection.content_mask.copy()
+        filter_mask = collection.filter_mask(filter_criteria)
+        if filter_mask is not None:
+            mask &= filter_mask
+
+        with metrics.span("numpy_index_request", operation=f"hybrid_search_{mode}"):
+            if mode == "keyword_filtered":
+                # Species keyword points pre-select the source URLs, then every chunk of them is searched
+                keyword_mask = ~collection.content_mask
+                if filter_mask is not None:
+                    keyword_mask &= filter_mask
+                keyword_rows, _ = self.__search_rows(collection, sparse_query_embedding, keyword_mask, prefetch_limit, search_params)
+                source_urls = list(dict.fromkeys(
+                    source_url for row in keyword_rows for source_url in payload_values(collection.payload(row), "source_url")
+                ))
+                if source_urls:
+                    mask &= collection.filter_mask({"source_url": source_urls})
+                else:
+                    mask[:] = False
+                rows, scores = self.__search_rows(collection, dense_query_embedding, mask, top_k, search_params)
+            else:
+                sparse_rows, sparse_scores = self.__search_rows(collection, sparse_query_embedding, mask, prefetch_limit, search_params)
+                dense_result = self.__search_rows(collection, dense_query_embedding, mask, prefetch_limit, search_params)
+                fuse = fuse_rrf if mode == "rrf" else fuse_dbsf
+                rows, scores = fuse([(sparse_rows, sparse_scores), dense_result])
+            rows, scores = top_k_rows(rows, scores, top_k)
+        return self.__to_results(collection, rows, scores, with_payload)
+
+    def search(self, collection_name: str, query_embedding: Union[models.NamedVector, models.NamedSparseVector], filter_criteria: Optional[FilterCriteria] = None, top_k: int = 12, with_payload: PayloadSelector = True, oversampling: Optional[float] = None, rescore: Optional[bool] = None):
+        search_params = self.get_search_params(oversampling, rescore)
+        if self.search_cache is not None:
+            return self.search_cache.get_or_compute(
+                (self.get_collection_version(collection_name), build_search_cache_key(collection_name, query_embedding, filter_criteria, top_k, with_payload), search_params),
+                lambda: self.__search(collection_name, query_embedding, filter_criteria, top_k, with_payload, search_params),
+            )
+        return self.__search(collection_name, query_embedding, filter_criteria, top_k, with_payload, search_params)
+
+    def __search(self, collection_name: str, query_embedding: Union[models.NamedVector, models.NamedSparseVector], filter_criteria: Optional[FilterCriteria], top_k: int, with_payload: PayloadSelector, search_params: Tuple[float, bool]):
+        collection = self.get_collection(collection_name)
+        with metrics.span("numpy_index_request", operation="search"):
+            rows, scores = self.__search_rows(collection, query_embedding, collection.filter_mask(filter_criteria), top_k, search_params)
+        return self.__to_results(collection, rows, scores, with_payload)
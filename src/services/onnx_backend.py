@@ -0,0 +1,293 @@
+import json
+import os
+import shutil
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import onnxruntime as ort
+import torch
+from huggingface_hub import snapshot_download
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from tqdm import tqdm
+from transformers import AutoModel, AutoModelForMaskedLM, AutoModelForSequenceClassification, AutoTokenizer
+
+from .quantization import INFERENCE_PRECISIONS
+
+INFERENCE_BACKENDS = ("torch", "onnx")
+ONNX_OPSET = 17
+MODEL_FILE_NAME = "model.onnx"
+
+
+def get_onnx_model_dir(cache_dir: str, model_name: str, precision: str) -> str:
+    return os.path.join(cache_dir, model_name.replace("/", "__"), precision)
+
+
+def create_session(model_path: str, num_threads: int = 0) -> ort.InferenceSession:
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    # 0 lets onnxruntime pick one thread per physical core; set it lower when several
+    # sessions or worker processes share a node so they do not oversubscribe the CPU
+    options.intra_op_num_threads = num_threads
+    options.inter_op_num_threads = 1
+    return ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+class _ExportWrapper(torch.nn.Module):
+    # Positional inputs for torch.onnx.export, post-processing traced into the graph
+    def __init__(self, model: torch.nn.Module, input_names: List[str], output_fn):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+        self.output_fn = output_fn
+
+    def forward(self, *inputs):
+        model_inputs = dict(zip(self.input_names, inputs))
+        return self.output_fn(self.model(**model_inputs), model_inputs["attention_mask"])
+
+
+def export_onnx_model(model: torch.nn.Module, dummy_inputs: Dict[str, torch.Tensor], output_fn, output_name: str, model_dir: str):
+    """
+    Exports the model with dynamic batch and sequence axes into model_dir. The export is
+    written to a temporary directory first, so an interrupted export is never picked up
+    as a cached model.
+    """
+    tmp_dir = f"{model_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    input_names = list(dummy_inputs.keys())
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes[output_name] = {0: "batch"}
+    model.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            _ExportWrapper(model, input_names, output_fn),
+            tuple(dummy_inputs[name] for name in input_names),
+            os.path.join(tmp_dir, MODEL_FILE_NAME),
+            input_names=input_names,
+            output_names=[output_name],
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET,
+            do_constant_folding=True,
+            dynamo=False,
+        )
+    os.replace(tmp_dir, model_dir)
+
+
+def quantize_onnx_model(model_path: str, model_dir: str):
+    # Dynamic int8 quantization of the exported graph, the onnxruntime counterpart of quantize_dynamic in torch
+    tmp_dir = f"{model_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    quantize_dynamic(
+        model_path,
+        os.path.join(tmp_dir, MODEL_FILE_NAME),
+        weight_type=QuantType.QInt8,
+        use_external_data_format=True,
+    )
+    os.replace(tmp_dir, model_dir)
+
+
+class OnnxModel(ABC):
+    """
+    Base class of the onnxruntime models. The fp32 graph is exported once per model into
+    cache_dir and reused by later processes; int8 graphs are quantized from the fp32 export.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = "onnx_models", precision: str = "fp32", num_threads: int = 0):
+        if precision not in INFERENCE_PRECISIONS:
+            raise ValueError(f"Unknown inference precision: {precision}. Expected one of {INFERENCE_PRECISIONS}")
+        self.model_name = model_name
+        self.precision = precision
+        self.device = torch.device("cpu")
+
+        model_path = self.get_model_path(cache_dir)
+        if precision != "fp32":
+            model_dir = get_onnx_model_dir(cache_dir, model_name, precision)
+            if not os.path.exists(model_dir):
+                print(f"# Quantizing ONNX model to {precision}: {model_name}")
+                quantize_onnx_model(model_path, model_dir)
+            model_path = os.path.join(model_dir, MODEL_FILE_NAME)
+
+        self.model_path = model_path
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.session = create_session(model_path, num_threads)
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        print(f"# ONNX model loaded: {model_name} ({precision}, {self.session.get_providers()[0]})")
+
+    def get_model_path(self, cache_dir: str) -> str:
+        model_dir = get_onnx_model_dir(cache_dir, self.model_name, "fp32")
+        if not os.path.exists(model_dir):
+            print(f"# Exporting ONNX model: {self.model_name}")
+            self.export(model_dir)
+        return os.path.join(model_dir, MODEL_FILE_NAME)
+
+    @abstractmethod
+    def export(self, model_dir: str):
+        """Exports the PyTorch model of model_name to an fp32 ONNX graph in model_dir."""
+
+    def run(self, encoded_inputs: Dict[str, np.ndarray]) -> np.ndarray:
+        feeds = {name: np.asarray(encoded_inputs[name], dtype=np.int64) for name in self.input_names if name in encoded_inputs}
+        return self.session.run(None, feeds)[0]
+
+
+class OnnxMaskedLMEncoder(OnnxModel):
+    """
+    SPLADE encoder. The relu, attention mask and max-pool over the sequence are part of the
+    graph, so a batch returns (batch, vocab) activations instead of full token logits.
+    """
+
+    def export(self, model_dir: str):
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        model = AutoModelForMaskedLM.from_pretrained(self.model_name)
+        dummy_inputs = tokenizer(["Hello World", "ONNX export"], padding=True, return_tensors="pt")
+
+        def max_pool(outputs, attention_mask):
+            logits = outputs.logits
+            return torch.max(torch.nn.functional.relu(logits) * attention_mask.unsqueeze(-1).to(logits.dtype), dim=1)[0]
+
+        export_onnx_model(model, dict(dummy_inputs), max_pool, "max_activations", model_dir)
+
+    def encode(self, encoded_inputs: Dict[str, np.ndarray]) -> np.ndarray:
+        return self.run(encoded_inputs)
+
+
+class OnnxCrossEncoder(OnnxModel):
+    """
+    Cross-encoder reranker with the compute_score interface of FlagReranker, so Reranker
+    can use either one. Pairs are tokenized the way FlagReranker does: the query is cut to
+    three quarters of max_length and the passage fills the rest.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = "onnx_models", precision: str = "fp32", num_threads: int = 0, max_length: int = 512):
+        super().__init__(model_name, cache_dir, precision, num_threads)
+        self.max_length = max_length
+
+    def export(self, model_dir: str):
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
+        dummy_inputs = tokenizer(["Hello World", "ONNX"], ["ONNX export", "Hello"], padding=True, return_tensors="pt")
+        export_onnx_model(model, dict(dummy_inputs), lambda outputs, _: outputs.logits.view(-1), "scores", model_dir)
+
+    def compute_score(self, sentence_pairs: List[List[str]], normalize: bool = False, batch_size: int = 32) -> List[float]:
+        query_input_ids = self.tokenizer(
+            [pair[0] for pair in sentence_pairs], add_special_tokens=False, truncation=True, max_length=self.max_length * 3 // 4
+        )["input_ids"]
+        passage_input_ids = self.tokenizer(
+            [pair[1] for pair in sentence_pairs], add_special_tokens=False, truncation=True, max_length=self.max_length
+        )["input_ids"]
+        features = [
+            self.tokenizer.prepare_for_model(query_ids, passage_ids, truncation="only_second", max_length=self.max_length, padding=False)
+            for query_ids, passage_ids in zip(query_input_ids, passage_input_ids)
+        ]
+
+        # Length-sorted batches carry as little padding as possible
+        length_sorted_idx = np.argsort([-len(feature["input_ids"]) for feature in features], kind="stable")
+        scores = np.empty(len(features), dtype=np.float32)
+        for start in range(0, len(features), batch_size):
+            batch_idx = length_sorted_idx[start:start + batch_size]
+            encoded_inputs = self.tokenizer.pad([features[idx] for idx in batch_idx], padding=True, return_tensors="np")
+            scores[batch_idx] = self.run(encoded_inputs)
+
+        if normalize:
+            scores = 1 / (1 + np.exp(-scores))
+        return scores.tolist()
+
+
+class OnnxSentenceEncoder(OnnxModel):
+    """
+    Dense encoder with the encode interface of SentenceTransformer used by TextEncoder.
+    Prompts, pooling and normalization are read from the sentence-transformers configuration
+    of the model. When the model repository publishes its own ONNX graph (jina-embeddings-v3
+    does, with its task LoRA adapters selected by a task_id input) that graph is used instead
+    of a local export, which could not select the task adapters.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = "onnx_models", precision: str = "fp32", num_threads: int = 0):
+        if os.path.isdir(model_name):
+            self.snapshot_dir = model_name
+        else:
+            self.snapshot_dir = snapshot_download(model_name, allow_patterns=["*.json", "onnx/model.onnx*"])
+        super().__init__(model_name, cache_dir, precision, num_threads)
+
+        model_config = self.__read_config("config.json")
+        st_config = self.__read_config("config_sentence_transformers.json")
+        self.prompts: Dict[str, str] = st_config.get("prompts", {})
+        self.tasks: List[str] = model_config.get("lora_adaptations", [])
+        self.max_seq_length = min(
+            self.__read_config("sentence_bert_config.json").get("max_seq_length", self.tokenizer.model_max_length),
+            self.tokenizer.model_max_length,
+        )
+
+        modules = self.__read_config("modules.json") or []
+        pooling_path = next((module["path"] for module in modules if module["type"].endswith("Pooling")), None)
+        pooling_config = self.__read_config(os.path.join(pooling_path, "config.json")) if pooling_path else {}
+        self.pooling_mode = "cls" if pooling_config.get("pooling_mode_cls_token") else "mean"
+        self.normalize = any(module["type"].endswith("Normalize") for module in modules)
+
+    def __read_config(self, file_name: str) -> Union[Dict, List]:
+        path = os.path.join(self.snapshot_dir, file_name)
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def get_model_path(self, cache_dir: str) -> str:
+        published_model_path = os.path.join(self.snapshot_dir, "onnx", MODEL_FILE_NAME)
+        if os.path.exists(published_model_path):
+            return published_model_path
+        return super().get_model_path(cache_dir)
+
+    def export(self, model_dir: str):
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        model = AutoModel.from_pretrained(self.model_name, trust_remote_code=True)
+        dummy_inputs = tokenizer(["Hello World", "ONNX export"], padding=True, return_tensors="pt")
+        export_onnx_model(model, dict(dummy_inputs), lambda outputs, _: outputs[0], "token_embeddings", model_dir)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return len(self.encode("Hello World"))
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        task: Optional[str] = None,
+        prompt_name: Optional[str] = None,
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        show_progress_bar: bool = False,
+    ) -> np.ndarray:
+        single_sentence = isinstance(sentences, str)
+        if single_sentence:
+            sentences = [sentences]
+        prompt = self.prompts.get(prompt_name, "") if prompt_name else ""
+
+        extra_inputs = {}
+        if "task_id" in self.input_names:
+            extra_inputs["task_id"] = np.array(self.tasks.index(task) if task in self.tasks else 0, dtype=np.int64)
+
+        embeddings = []
+        for start in tqdm(range(0, len(sentences), batch_size), disable=not show_progress_bar, desc="Batches"):
+            encoded_inputs = self.tokenizer(
+                [prompt + sentence for sentence in sentences[start:start + batch_size]],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            token_embeddings = self.run({**encoded_inputs, **extra_inputs})
+            embeddings.append(self.__pool(token_embeddings, encoded_inputs["attention_mask"]))
+
+        embeddings = np.concatenate(embeddings).astype(np.float32)
+        return embeddings[0] if single_sentence else embeddings
+
+    def __pool(self, token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.pooling_mode == "cls":
+            embeddings = token_embeddings[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(token_embeddings.dtype)
+            embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
@@ -1,4 +1,8 @@
 import os
+import re
+from itertools import chain, islice
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
 from repositories import SpeciesRepository, CabiSpeciesRepository, SpeciesNewsRepository
 from models import Plague
 
@@ -11,75 +15,94 @@ class PlagueService():
         if not os.path.exists("data/invalid_content"):
             os.makedirs("data/invalid_content", exist_ok=True)
 
-    def __log_invalid_species_content(self, species_list, file_path):
-        invalid_names = [
-            specie.scientific_name
-            for specie in species_list
-            if not isinstance(specie.content, str) or not specie.content.strip()
-        ]
-        with open(file_path, "w", encoding="utf-8") as f:
-            for name in invalid_names:
-                f.write(name + "\n")
+    def __has_valid_content(self, specie) -> bool:
+        return isinstance(specie.content, str) and bool(specie.content.strip())
 
-    def get_plagues(self):
-        # Get all Cabi Species
-        cabi_species = self.cabi_species_repository.get_all_cabi_species()
-        print("# Cabi Species Count:", len(cabi_species))
-        for cabi_specie in cabi_species:
-            cabi_specie.content = (
-                self.cabi_species_repository.get_cabi_specie_content_by_scientific_name(
-                    cabi_specie.scientific_name
-                )
-            )
-        cabi_species_with_content = [
-            cabi_specie for cabi_specie in cabi_species
-            if isinstance(cabi_specie.content, str) and cabi_specie.content.strip()
-        ]
-        self.__log_invalid_species_content(cabi_species, "data/invalid_content/invalid_cabi_species.txt")
-        print(
-            f"# Total elements from Cabi Species with content: {len(cabi_species_with_content)}"
+    def __iter_species_with_content(
+        self,
+        label: str,
+        species: Iterable,
+        get_contents: Callable[[List[str]], Dict[str, str]],
+        content_key: str,
+        file_path: str,
+        batch_size: int,
+    ) -> Iterator:
+        total_count = 0
+        valid_count = 0
+        species = iter(species)
+        with open(file_path, "w", encoding="utf-8") as invalid_file:
+            while True:
+                batch = list(islice(species, batch_size))
+                if not batch:
+                    break
+
+                # One bulk content lookup per batch of source rows
+                contents = get_contents([getattr(specie, content_key) for specie in batch])
+                for specie in batch:
+                    total_count += 1
+                    specie.content = contents.get(getattr(specie, content_key), "")
+                    if not self.__has_valid_content(specie):
+                        invalid_file.write(specie.scientific_name + "\n")
+                        continue
+                    valid_count += 1
+                    yield specie
+
+        print(f"# {label} Count:", total_count)
+        print(f"# Total elements from {label} with content: {valid_count}")
+
+    def iter_cabi_species_plagues(self, batch_size: int = 1000) -> Iterator[Plague]:
+        cabi_species = self.__iter_species_with_content(
+            "Cabi Species",
+            self.cabi_species_repository.iter_all_cabi_species(batch_size),
+            self.cabi_species_repository.get_cabi_species_content_by_scientific_names,
+            "scientific_name",
+            "data/invalid_content/invalid_cabi_species.txt",
+            batch_size,
         )
+        for cabi_specie in cabi_species:
+            yield Plague(cabi_specie.scientific_name, cabi_specie.common_names, cabi_specie.source_url, cabi_specie.content, "Es cuarentenanaria" if cabi_specie.is_quarantine else "No es cuarentenanaria")
 
-        # Get all Species
-        species = self.species_repository.get_all_species()
-        print("# Species Count:", len(species))
+    def iter_species_plagues(self, batch_size: int = 1000) -> Iterator[Plague]:
+        species = self.__iter_species_with_content(
+            "Species",
+            self.species_repository.iter_all_species(batch_size),
+            self.species_repository.get_cabi_species_content_by_source_urls,
+            "source_url",
+            "data/invalid_content/invalid_species.txt",
+            batch_size,
+        )
         for specie in species:
-            specie.content = (
-                self.species_repository.get_cabi_specie_content_by_source_url(
-                    specie.source_url
-                )
-            )
-        species_with_content = [
-            specie for specie in species
-            if isinstance(specie.content, str) and specie.content.strip()
-        ]
-        self.__log_invalid_species_content(species, "data/invalid_content/invalid_species.txt")
-        print(
-            f"# Total elements from Species with content: {len(species_with_content)}"
+            yield Plague(specie.scientific_name, specie.common_names, specie.source_url, specie.content, "-")
+
+    def iter_species_news_plagues(self, batch_size: int = 1000) -> Iterator[Plague]:
+        species_news = self.__iter_species_with_content(
+            "Species News",
+            self.species_news_repository.iter_all_species_news(batch_size),
+            self.species_news_repository.get_news_articles_content_by_source_urls,
+            "source_url",
+            "data/invalid_content/invalid_species_news.txt",
+            batch_size,
         )
+        for specie_new in species_news:
+            yield Plague(specie_new.scientific_name, None, specie_new.source_url, specie_new.content, "Es cuarentenanaria" if specie_new.is_quarantine else "No es cuarentenanaria")
 
-        # Get all Species News
-        species_news = self.species_news_repository.get_all_species_news()
-        print("# Species News Count:", len(species_news))
-        for specie in species_news:
-            specie.content = (
-                self.species_news_repository.get_news_article_content_by_source_url(
-                    specie.source_url
-                )
-            )
-        species_news_with_content = [
-            specie_new for specie_new in species_news
-            if isinstance(specie_new.content, str) and specie_new.content.strip()
-        ]
-        self.__log_invalid_species_content(species_news, "data/invalid_content/invalid_species_news.txt")
-        print(
-            f"# Total elements from Species News with content: {len(species_news_with_content)}"
+    def iter_plagues(self, batch_size: int = 1000) -> Iterator[Plague]:
+        return chain(
+            self.iter_cabi_species_plagues(batch_size),
+            self.iter_species_plagues(batch_size),
+            self.iter_species_news_plagues(batch_size),
         )
 
-        cabi_species_list = [Plague(cabi_specie.scientific_name, cabi_specie.common_names, cabi_specie.source_url, cabi_specie.content, "Es cuarentenanaria" if cabi_specie.is_quarantine else "No es cuarentenanaria") for cabi_specie in cabi_species_with_content]
-        species_list = [Plague(specie.scientific_name, specie.common_names, specie.source_url, specie.content, "-") for specie in species_with_content]
-        species_news_list = [Plague(specie_new.scientific_name, None, specie_new.source_url, specie_new.content, "Es cuarentenanaria" if specie_new.is_quarantine else "No es cuarentenanaria") for specie_new in species_news_with_content]
+    def get_plagues(self):
+        return list(self.iter_plagues())
 
-        cabi_species_list.extend(species_list)
-        cabi_species_list.extend(species_news_list)
-        return cabi_species_list
\ No newline at end of file
+    def iter_species_names(self, batch_size: int = 1000) -> Iterator[Tuple[str, List[str]]]:
+        # Scientific and common names of every species table, without loading their content
+        species = chain(
+            self.cabi_species_repository.iter_all_cabi_species(batch_size),
+            self.species_repository.iter_all_species(batch_size),
+            self.species_news_repository.iter_all_species_news(batch_size),
+        )
+        for specie in species:
+            common_names = re.split(r"[,;]", getattr(specie, "common_names", None) or "")
+            yield specie.scientific_name, [name.strip() for name in common_names if name.strip()]
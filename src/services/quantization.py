@@ -0,0 +1,23 @@
+import torch
+
+INFERENCE_PRECISIONS = ("fp32", "int8")
+
+
+def apply_inference_precision(model: torch.nn.Module, precision: str, device: torch.device) -> torch.nn.Module:
+    """
+    Applies the inference precision to a loaded model, in place. "int8" uses PyTorch dynamic
+    quantization: Linear weights are stored as int8 and activations are quantized on the fly.
+    """
+    if precision not in INFERENCE_PRECISIONS:
+        raise ValueError(f"Unknown inference precision: {precision}. Expected one of {INFERENCE_PRECISIONS}")
+
+    if precision == "fp32":
+        return model
+
+    # Dynamic quantization kernels only exist for CPU
+    if device.type != "cpu":
+        print(f"# Inference precision '{precision}' is only supported on CPU, keeping fp32 on {device}")
+        return model
+
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
@@ -1,14 +1,87 @@
+import hashlib
+import os
+from typing import List, Optional
+
+import numpy as np
 from keybert import KeyBERT
-from sentence_transformers import SentenceTransformer
+
+from .query_cache import LRUCache
+from .model_registry import get_sentence_transformer
+from .metrics import metrics
 
 
 class QueryProcessor:
-    def __init__(self, keyword_model_name):
-        self.model = SentenceTransformer(keyword_model_name, trust_remote_code=True)
+    def __init__(self, keyword_model_name, keywords_cache: Optional[LRUCache] = None, inference_precision: str = "fp32"):
+        # Shared with the dense model of TextEncoder when both use the same model name
+        self.model = get_sentence_transformer(keyword_model_name, inference_precision)
         self.kw_model = KeyBERT(model=self.model)
+        self.keywords_cache = keywords_cache
+        self.model_key = f"{keyword_model_name}@{inference_precision}"
+        self.seed_embedding: Optional[np.ndarray] = None
+        self.seed_keywords_digest: Optional[str] = None
+
+    def warm_up(self):
+        self.kw_model.extract_keywords("Hello World")
+
+    def set_seed_keywords(self, seed_keywords: List[str], cache_dir: Optional[str] = None):
+        """
+        Computes the guided-extraction seed embedding once, so queries do not re-embed the
+        whole seed list. With cache_dir the embedding is persisted and reused across
+        restarts until the seed keywords or the model change.
+        """
+        self.seed_keywords_digest = hashlib.sha256(
+            "\n".join([self.model_key, *seed_keywords]).encode("utf-8")
+        ).hexdigest()
+
+        cache_path = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            cache_path = os.path.join(cache_dir, f"seed_embedding_{self.seed_keywords_digest[:16]}.npy")
+            if os.path.exists(cache_path):
+                self.seed_embedding = np.load(cache_path)
+                print(f"# Seed keyword embedding loaded from: {cache_path}")
+                return
+
+        # Same guidance vector KeyBERT computes internally from a flat seed keyword list
+        self.seed_embedding = self.kw_model.model.embed(seed_keywords).mean(axis=0, keepdims=True)
+        print(f"# Seed keyword embedding computed from {len(seed_keywords)} keywords")
+
+        if cache_path:
+            # Embeddings of previous seed lists are stale once the catalogue changed
+            for file_name in os.listdir(cache_dir):
+                if file_name.startswith("seed_embedding_") and file_name.endswith(".npy"):
+                    os.remove(os.path.join(cache_dir, file_name))
+            np.save(cache_path, self.seed_embedding)
+
+    def extract_keywords(self, query: str, seed_keywords: Optional[List[str]] = None, ngram_range: tuple = (2, 4)) -> str:
+        """
+        Without seed_keywords the extraction is guided by the precomputed seed embedding
+        (see set_seed_keywords); explicit seed_keywords are embedded on every call.
+        """
+        with metrics.span("keyword_extraction"):
+            return self.__extract_keywords_cached(query, seed_keywords, ngram_range)
+
+    def __extract_keywords_cached(self, query: str, seed_keywords: Optional[List[str]], ngram_range: tuple) -> str:
+        if self.keywords_cache is None:
+            return self.__extract_keywords(query, seed_keywords, ngram_range)
+
+        seeds_key = self.seed_keywords_digest if seed_keywords is None else hash(tuple(seed_keywords))
+        key = (query, tuple(ngram_range), seeds_key)
+        return self.keywords_cache.get_or_compute(
+            key, lambda: self.__extract_keywords(query, seed_keywords, ngram_range)
+        )
+
+    def __extract_keywords(self, query: str, seed_keywords: Optional[List[str]], ngram_range: tuple) -> str:
+        doc_embeddings = None
+        if seed_keywords is None and self.seed_embedding is not None:
+            doc_embeddings = (self.kw_model.model.embed([query]) * 3 + self.seed_embedding) / 4
 
-    def extract_keywords(self, query: str, seed_keywords: str, ngram_range: tuple = (2, 4)) -> str:
         keywords = self.kw_model.extract_keywords(
-            query, keyphrase_ngram_range=ngram_range, stop_words=None, use_mmr=True, seed_keywords=seed_keywords
+            query,
+            keyphrase_ngram_range=ngram_range,
+            stop_words=None,
+            use_mmr=True,
+            seed_keywords=seed_keywords,
+            doc_embeddings=doc_embeddings,
         )
         return ", ".join([kw[0] for kw in keywords])
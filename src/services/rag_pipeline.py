@@ -0,0 +1,370 @@
+import os
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+
+from qdrant_client.models import NamedVector, NamedSparseVector, SparseVector
+
+from repositories import CabiSpeciesRepository
+from .vector_store import VectorStore, open_vector_store
+from .query_processor import QueryProcessor
+from .text_encoder import TextEncoder
+from .dense_projection import DenseProjection, get_dense_projection_path
+from .query_cache import LRUCache
+from .reranker import Reranker
+from .plague_service import PlagueService
+from .species_gazetteer import SpeciesGazetteer, build_species_gazetteer, load_species_gazetteer
+from .metrics import collect_cache_metrics, metrics
+from .llm_client import OllamaClient, create_llm_client
+from .context_builder import ContextBuilder, create_context_builder, serialize_json_knowledge
+from .answer_cache import AnswerCache, iter_answer_chunks
+
+# Payload fields read by knowledge building, citations and the HTTP service
+RETRIEVAL_PAYLOAD_FIELDS = ["scientific_name", "common_names", "source_url", "content_chunk"]
+
+SYSTEM_PROMPT_TEMPLATE = """You are a specialized scientific research assistant. Your task is to answer user queries using only the information provided between the [KNOWLEDGE] and [/KNOWLEDGE] tags. Do not incorporate any external knowledge or assumptions.
+
+[KNOWLEDGE]
+{knowledge}
+[/KNOWLEDGE]
+
+If the provided knowledge is insufficient to accurately answer the query, respond with: "I'm not sure" or "The provided information is insufficient to answer that question."
+
+Keep your responses concise, precise, and strictly based on the given information."""
+
+
+class RagPipeline:
+    """
+    Query side of the application: keyword extraction, hybrid retrieval, reranking,
+    knowledge building and answer generation. Models are loaded once and shared by
+    every query, so one instance can serve concurrent callers.
+    """
+
+    def __init__(
+        self,
+        text_encoder: TextEncoder,
+        vector_store: VectorStore,
+        query_processor: QueryProcessor,
+        reranker: Reranker,
+        collection_name: str,
+        sparse_vectors_name: str,
+        dense_vectors_name: str,
+        hybrid_search_mode: str = "rrf",
+        hybrid_search_prefetch_limit: int = 100,
+        top_k: int = 12,
+        query_caches: Dict[str, Union[LRUCache, AnswerCache]] = None,
+        species_gazetteer: Optional[SpeciesGazetteer] = None,
+        llm_client: Optional[OllamaClient] = None,
+        context_builder: Optional[ContextBuilder] = None,
+        answer_cache: Optional[AnswerCache] = None,
+        verbose: bool = False,
+    ):
+        self.text_encoder = text_encoder
+        self.vector_store = vector_store
+        self.query_processor = query_processor
+        self.reranker = reranker
+        self.collection_name = collection_name
+        self.sparse_vectors_name = sparse_vectors_name
+        self.dense_vectors_name = dense_vectors_name
+        self.hybrid_search_mode = hybrid_search_mode
+        self.hybrid_search_prefetch_limit = hybrid_search_prefetch_limit
+        self.top_k = top_k
+        self.query_caches = query_caches or {}
+        self.species_gazetteer = species_gazetteer
+        self.verbose = verbose
+        self.llm_client = llm_client or create_llm_client()
+        # Without a context builder every chunk is sent as indented JSON
+        self.context_builder = context_builder
+        self.answer_cache = answer_cache
+
+    def warm_up(self):
+        # Loads every model and runs one inference each, so the first query pays no lazy-load cost
+        self.query_processor.warm_up()
+        self.text_encoder.warm_up()
+        self.reranker.warm_up()
+        if self.context_builder is not None:
+            self.context_builder.load_tokenizer()
+        if os.getenv("OLLAMA_PRELOAD", "true").lower() == "true":
+            self.llm_client.preload(os.getenv("OLLAMA_MODEL_NAME"))
+
+    def retrieve(self, query: str) -> Tuple[str, List[Tuple]]:
+        with metrics.span("retrieve"):
+            return self.__retrieve(query)
+
+    def __retrieve(self, query: str) -> Tuple[str, List[Tuple]]:
+        # Species mentions are looked up in the gazetteer, KeyBERT only runs when none is found
+        extracted_terms = self.species_gazetteer.extract_terms(query) if self.species_gazetteer else ""
+        if extracted_terms:
+            metrics.increment("query_terms_total", source="gazetteer")
+            if self.verbose:
+                print("# Species Mentions:", extracted_terms)
+        else:
+            # Guided by the seed keyword embedding precomputed in create_rag_pipeline
+            extracted_terms = self.query_processor.extract_keywords(query)
+            metrics.increment("query_terms_total", source="keybert")
+            if self.verbose:
+                print("# Extracted Keywords:", extracted_terms)
+
+        # Encode the extracted keywords into a sparse vector representation.
+        query_indices, query_values = self.text_encoder.encode_sparse(extracted_terms)
+        keyword_query_embedding = NamedSparseVector(
+            name=self.sparse_vectors_name,
+            vector=SparseVector(indices=query_indices, values=query_values),
+        )
+
+        # Encode the original query into a dense vector representation.
+        query_embeddings = self.text_encoder.encode_dense(query, "retrieval.query")
+        semantic_query_embedding = NamedVector(
+            name=self.dense_vectors_name,
+            vector=query_embeddings,
+        )
+
+        # Perform the keyword and the semantic search together, in a single call in the fusion modes.
+        semantic_search_results = self.vector_store.hybrid_search(
+            self.collection_name,
+            keyword_query_embedding,
+            semantic_query_embedding,
+            mode=self.hybrid_search_mode,
+            prefetch_limit=self.hybrid_search_prefetch_limit,
+            top_k=self.top_k,
+            with_payload=RETRIEVAL_PAYLOAD_FIELDS,
+        )
+
+        if self.verbose:
+            print("# Hybrid Search Results:")
+            for result in semantic_search_results:
+                print(
+                    f" - [Score: {result[1]:.2f}] {result[2]['scientific_name']} ({result[2]['source_url']})"
+                )
+
+        if not semantic_search_results:
+            return extracted_terms, []
+
+        avg_score = sum(result[1] for result in semantic_search_results) / len(
+            semantic_search_results
+        )
+        above_average_results = [
+            result for result in semantic_search_results if result[1] > avg_score
+        ]
+        scores = self.reranker.compute_scores(
+            query, [(result[0], result[2]["content_chunk"]) for result in above_average_results]
+        )
+        ranked_semantic_search_results = [
+            item
+            for score, item in sorted(
+                zip(scores, above_average_results), key=lambda x: x[0], reverse=True
+            )
+        ]
+        return extracted_terms, ranked_semantic_search_results
+
+    def build_knowledge(self, ranked_semantic_search_results: List[Tuple]) -> str:
+        if self.verbose:
+            print("# Semantic Search Result Citations:")
+            print("\n".join(set(
+                "- {} ({})".format(result[2]["scientific_name"], result[2]["source_url"])
+                for result in ranked_semantic_search_results
+            )))
+
+        if self.context_builder is None:
+            return serialize_json_knowledge(ranked_semantic_search_results)
+
+        knowledge, stats = self.context_builder.build(ranked_semantic_search_results, measure_savings=self.verbose or metrics.enabled)
+        if self.verbose:
+            print(
+                f"# Knowledge Packed: {stats['chunks'] - stats['dropped_chunks']}/{stats['chunks']} chunks "
+                f"({stats['merged_chunks']} merged), {stats['tokens']} tokens, "
+                f"{stats['tokens_saved']} saved over JSON"
+            )
+        return knowledge
+
+    def build_chat_payload(self, user_prompt: str, knowledge: str) -> Dict:
+        system_prompt = SYSTEM_PROMPT_TEMPLATE.format(knowledge=knowledge)
+        if self.verbose:
+            print(f"# System Prompt:\n{system_prompt}")
+            print(f"# User Message: {user_prompt}")
+
+        return {
+            "model": os.getenv("OLLAMA_MODEL_NAME"),
+            "stream": True,
+            "options": {
+                "temperature": float(os.getenv("OLLAMA_MODEL_TEMPERATURE")),
+            },
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+        }
+
+    def lookup_answer(self, query: str, ranked_semantic_search_results: List[Tuple]) -> Optional[str]:
+        # A similar query that retrieved the same points was answered from the same knowledge
+        if self.answer_cache is None:
+            return None
+        answer = self.answer_cache.get(
+            self.text_encoder.encode_dense(query, "retrieval.query"),
+            [result[0] for result in ranked_semantic_search_results],
+            self.vector_store.get_collection_version(self.collection_name),
+        )
+        if answer is not None and self.verbose:
+            print("# Answer Cache Hit")
+        return answer
+
+    def store_answer(self, query: str, ranked_semantic_search_results: List[Tuple], answer: str):
+        if self.answer_cache is None:
+            return
+        self.answer_cache.put(
+            self.text_encoder.encode_dense(query, "retrieval.query"),
+            [result[0] for result in ranked_semantic_search_results],
+            answer,
+            self.vector_store.get_collection_version(self.collection_name),
+        )
+
+    def answer(self, query: str, ranked_semantic_search_results: List[Tuple]) -> Iterator[str]:
+        """
+        Streams the answer to the query, replaying a cached answer when there is one.
+        A generated answer is cached only once it has been streamed to the end.
+        """
+        cached_answer = self.lookup_answer(query, ranked_semantic_search_results)
+        if cached_answer is not None:
+            return iter_answer_chunks(cached_answer)
+        answer_chunks = self.stream_answer(query, self.build_knowledge(ranked_semantic_search_results))
+        return self.__stream_and_store(query, ranked_semantic_search_results, answer_chunks)
+
+    def __stream_and_store(self, query: str, ranked_semantic_search_results: List[Tuple], answer_chunks: Iterator[str]) -> Iterator[str]:
+        contents = []
+        try:
+            for content in answer_chunks:
+                contents.append(content)
+                yield content
+        finally:
+            answer_chunks.close()
+        self.store_answer(query, ranked_semantic_search_results, "".join(contents))
+
+    def stream_answer(self, user_prompt: str, knowledge: str) -> Iterator[str]:
+        payload = self.build_chat_payload(user_prompt, knowledge)
+        return self.llm_client.stream_chat(payload)
+
+    def astream_answer(self, user_prompt: str, knowledge: str) -> AsyncIterator[str]:
+        payload = self.build_chat_payload(user_prompt, knowledge)
+        return self.llm_client.astream_chat(payload)
+
+
+def create_query_cache(capacity_env_name: str, default_capacity: int) -> LRUCache:
+    ttl_seconds = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+    return LRUCache(int(os.getenv(capacity_env_name, default_capacity)), ttl_seconds=ttl_seconds or None)
+
+
+def create_answer_cache() -> Optional[AnswerCache]:
+    capacity = int(os.getenv("ANSWER_CACHE_CAPACITY", "512"))
+    if capacity <= 0:
+        return None
+    ttl_seconds = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+    return AnswerCache(
+        capacity,
+        ttl_seconds=ttl_seconds or None,
+        similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95")),
+    )
+
+
+def create_species_gazetteer(path: str) -> SpeciesGazetteer:
+    # Reuses the gazetteer saved by create_vector_store.py, building it once when missing
+    if os.path.exists(path):
+        species_gazetteer = load_species_gazetteer(path)
+        if species_gazetteer is not None:
+            return species_gazetteer
+    species_gazetteer = build_species_gazetteer(PlagueService().iter_species_names())
+    species_gazetteer.save(path)
+    return species_gazetteer
+
+
+def create_rag_pipeline(verbose: bool = False) -> RagPipeline:
+    """
+    Builds a RagPipeline from the environment configuration, loading every model once.
+    Raises RuntimeError when the collection has not been created yet.
+    """
+    collection_name = os.getenv("COLLECTION_NAME")
+    inference_precision = os.getenv("INFERENCE_PRECISION", "fp32")
+    inference_options = dict(
+        inference_precision=inference_precision,
+        inference_backend=os.getenv("INFERENCE_BACKEND", "torch"),
+        onnx_cache_dir=os.getenv("ONNX_CACHE_DIR", "onnx_models"),
+        onnx_num_threads=int(os.getenv("ONNX_NUM_THREADS", "0")),
+    )
+    sparse_vectors_name = os.getenv("COLLECTION_SPARSE_VECTORS_NAME")
+    dense_vectors_name = os.getenv("COLLECTION_DENSE_VECTORS_NAME")
+
+    # In-process caches so repeated queries skip model inference and engine calls
+    query_caches = {
+        "keywords": create_query_cache("KEYWORDS_CACHE_CAPACITY", 1024),
+        "query_embeddings": create_query_cache("QUERY_EMBEDDINGS_CACHE_CAPACITY", 2048),
+        "search_results": create_query_cache("SEARCH_CACHE_CAPACITY", 2048),
+        "reranker_scores": create_query_cache("RERANKER_CACHE_CAPACITY", 16384),
+    }
+    answer_cache = create_answer_cache()
+    if answer_cache is not None:
+        query_caches["answers"] = answer_cache
+    if metrics.enabled:
+        metrics.add_collector(lambda: collect_cache_metrics(query_caches))
+
+    # Initialize the `TextEncoder` with sparse and dense model names.
+    text_encoder = TextEncoder(
+        sparse_model_name=os.getenv("SPARSE_EMBEDDINGS_MODEL_NAME"),
+        dense_model_name=os.getenv("DENSE_EMBEDDINGS_MODEL_NAME"),
+        query_cache=query_caches["query_embeddings"],
+        **inference_options,
+    )
+
+    # Initialize the vector store backend selected by VECTOR_STORE_BACKEND.
+    vector_store = open_vector_store(
+        text_encoder,
+        sparse_vectors_name,
+        dense_vectors_name,
+        search_cache=query_caches["search_results"],
+    )
+    print(f"# {type(vector_store).__name__} initialized")
+
+    # Check if the specified collection exists in the vector store.
+    if not vector_store.collection_exists(collection_name):
+        raise RuntimeError(
+            f"The collection '{collection_name}' does not exist. Please execute create_vector_store.py to create it..."
+        )
+
+    # Queries are projected like the indexed chunks when the collection stores reduced dense vectors.
+    dense_projection = DenseProjection.load(get_dense_projection_path(vector_store.storage_path, collection_name))
+    if dense_projection is not None:
+        text_encoder.set_dense_projection(dense_projection)
+        print(f"# Dense projection loaded: {dense_projection}")
+
+    # Initialize the `QueryProcessor` with the dense model name.
+    query_processor = QueryProcessor(
+        os.getenv("DENSE_EMBEDDINGS_MODEL_NAME"),
+        keywords_cache=query_caches["keywords"],
+        inference_precision=inference_precision,
+    )
+
+    cabi_species_repository = CabiSpeciesRepository()
+    cabi_species = cabi_species_repository.get_all_cabi_species()
+    seed_keywords = [cabi_specie.scientific_name for cabi_specie in cabi_species]
+    query_processor.set_seed_keywords(seed_keywords, cache_dir=os.getenv("SEED_EMBEDDINGS_CACHE_DIR"))
+
+    # Initialize the Reranker with the specified model name.
+    reranker = Reranker(
+        os.getenv("RERANKER_MODEL_NAME"),
+        use_fp16=False,
+        score_cache=query_caches["reranker_scores"],
+        **inference_options,
+    )
+
+    return RagPipeline(
+        text_encoder,
+        vector_store,
+        query_processor,
+        reranker,
+        collection_name,
+        sparse_vectors_name,
+        dense_vectors_name,
+        hybrid_search_mode=os.getenv("HYBRID_SEARCH_MODE", "rrf"),
+        hybrid_search_prefetch_limit=int(os.getenv("HYBRID_SEARCH_PREFETCH_LIMIT", "100")),
+        query_caches=query_caches,
+        species_gazetteer=create_species_gazetteer(os.getenv("SPECIES_GAZETTEER_PATH", "data/species_gazetteer.pkl")),
+        context_builder=create_context_builder(),
+        answer_cache=answer_cache,
+        verbose=verbose,
+    )
@@ -0,0 +1,98 @@
+from typing import Hashable, List, Optional, Tuple
+
+import torch
+from FlagEmbedding import FlagReranker
+
+from .query_cache import LRUCache
+from .micro_batcher import MicroBatcher
+from .quantization import apply_inference_precision
+from .onnx_backend import OnnxCrossEncoder
+from .model_registry import model_registry
+from .metrics import SIZE_BUCKETS, metrics
+
+
+class Reranker:
+    def __init__(
+        self,
+        model_name: str,
+        use_fp16: bool = False,
+        score_cache: Optional[LRUCache] = None,
+        inference_precision: str = "fp32",
+        inference_backend: str = "torch",
+        onnx_cache_dir: str = "onnx_models",
+        onnx_num_threads: int = 0,
+    ):
+        self.model_name = model_name
+        self.model = model_registry.get(
+            ("reranker", model_name, inference_backend, inference_precision, use_fp16),
+            lambda: self.__load_model(use_fp16, inference_precision, inference_backend, onnx_cache_dir, onnx_num_threads),
+        )
+        if inference_precision != "fp32":
+            # Quantized scores differ slightly, keep them apart in the score cache
+            backend_prefix = "" if inference_backend == "torch" else f"{inference_backend}-"
+            self.model_name = f"{model_name}@{backend_prefix}{inference_precision}"
+        self.score_cache = score_cache
+        self.batcher: Optional[MicroBatcher] = None
+
+    def __load_model(self, use_fp16: bool, inference_precision: str, inference_backend: str, onnx_cache_dir: str, onnx_num_threads: int):
+        if inference_backend == "onnx":
+            # Same compute_score interface as FlagReranker
+            return OnnxCrossEncoder(self.model_name, onnx_cache_dir, inference_precision, onnx_num_threads)
+        if inference_precision == "fp32":
+            return FlagReranker(self.model_name, use_fp16=use_fp16)
+
+        # Quantized kernels are CPU-only, keep FlagReranker from moving the model to a GPU
+        model = FlagReranker(self.model_name, use_fp16=False, devices="cpu")
+        model.model = apply_inference_precision(model.model, inference_precision, torch.device("cpu"))
+        return model
+
+    def warm_up(self):
+        self.__score_pairs([["Hello", "World"]])
+
+    def enable_micro_batching(self, max_batch_size: int = 32, batch_window_ms: float = 10, max_queue_size: int = 1024):
+        # Sentence pairs from concurrent queries are scored together in one forward pass
+        self.batcher = MicroBatcher(
+            "reranker",
+            self.__score_pairs,
+            max_batch_size=max_batch_size,
+            batch_window_ms=batch_window_ms,
+            max_queue_size=max_queue_size,
+        )
+
+    def __score_pairs(self, sentence_pairs: List[List[str]]) -> List[float]:
+        metrics.observe("reranker_batch_size", len(sentence_pairs), buckets=SIZE_BUCKETS)
+        with metrics.span("reranker_inference"):
+            scores = self.model.compute_score(sentence_pairs, normalize=True, batch_size=len(sentence_pairs))
+        # FlagReranker returns a bare float for a single pair
+        if not isinstance(scores, list):
+            scores = [scores]
+        return scores
+
+    def compute_scores(self, query: str, documents: List[Tuple[Hashable, str]]) -> List[float]:
+        """
+        Scores (point id, text) pairs against the query. Cached scores are keyed by
+        (query, point id), so only unseen pairs go through the model.
+        """
+        with metrics.span("rerank"):
+            return self.__compute_scores(query, documents)
+
+    def __compute_scores(self, query: str, documents: List[Tuple[Hashable, str]]) -> List[float]:
+        scores: List[Optional[float]] = [None] * len(documents)
+        missing_idx = []
+        for idx, (point_id, _) in enumerate(documents):
+            if self.score_cache is not None:
+                scores[idx] = self.score_cache.get((self.model_name, query, point_id))
+            if scores[idx] is None:
+                missing_idx.append(idx)
+
+        if missing_idx:
+            sentence_pairs = [[query, documents[idx][1]] for idx in missing_idx]
+            if self.batcher is not None:
+                computed_scores = self.batcher.process_many(sentence_pairs)
+            else:
+                computed_scores = self.__score_pairs(sentence_pairs)
+            for idx, score in zip(missing_idx, computed_scores):
+                scores[idx] = score
+                if self.score_cache is not None:
+                    self.score_cache.put((self.model_name, query, documents[idx][0]), score)
+        return scores
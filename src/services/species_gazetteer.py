@@ -0,0 +1,111 @@
+import os
+import pickle
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+GAZETTEER_VERSION = 1
+# Marks the end of a name in the trie, tokens are never empty
+TERMINAL = ""
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+def normalize_tokens(text: str) -> List[str]:
+    # Accent- and case-insensitive word tokens: "Phytophthora Infestans (Mont.)" -> ["phytophthora", "infestans", "mont"]
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+class SpeciesGazetteer:
+    """
+    Word-level trie over the scientific and common names of the species catalogue.
+    Matching walks the trie from every query token and keeps the leftmost-longest
+    names, so lookups cost O(query tokens x longest name) however many names are loaded.
+    """
+
+    def __init__(self, min_name_length: int = 3):
+        self.trie: Dict = {}
+        self.name_count = 0
+        self.min_name_length = min_name_length
+
+    def add(self, name: str, scientific_name: str):
+        tokens = normalize_tokens(name)
+        if not tokens or len(" ".join(tokens)) < self.min_name_length:
+            return
+
+        node = self.trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        if TERMINAL not in node:
+            node[TERMINAL] = {"name": name.strip(), "scientific_names": []}
+            self.name_count += 1
+        # A common name can be shared by several species
+        if scientific_name not in node[TERMINAL]["scientific_names"]:
+            node[TERMINAL]["scientific_names"].append(scientific_name)
+
+    def find(self, text: str) -> List[Dict]:
+        tokens = normalize_tokens(text)
+        matches = []
+        start = 0
+        while start < len(tokens):
+            node = self.trie
+            longest_match: Optional[Tuple[int, Dict]] = None
+            for end in range(start, len(tokens)):
+                node = node.get(tokens[end])
+                if node is None:
+                    break
+                if TERMINAL in node:
+                    longest_match = (end + 1, node[TERMINAL])
+            if longest_match is None:
+                start += 1
+                continue
+            start, entry = longest_match
+            matches.append(entry)
+        return matches
+
+    def extract_terms(self, text: str) -> str:
+        """
+        Returns the mentioned names and their scientific names in the "name, name" format
+        of the indexed keywords, or an empty string when no species is mentioned.
+        """
+        terms = []
+        for entry in self.find(text):
+            terms.append(entry["name"])
+            terms.extend(entry["scientific_names"])
+        return ", ".join(dict.fromkeys(terms))
+
+    def save(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(
+                {"version": GAZETTEER_VERSION, "min_name_length": self.min_name_length, "name_count": self.name_count, "trie": self.trie},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_path, path)
+
+
+def build_species_gazetteer(species_names: Iterable[Tuple[str, List[str]]]) -> SpeciesGazetteer:
+    gazetteer = SpeciesGazetteer()
+    for scientific_name, common_names in species_names:
+        gazetteer.add(scientific_name, scientific_name)
+        for common_name in common_names:
+            gazetteer.add(common_name, scientific_name)
+    print(f"# Species gazetteer built with {gazetteer.name_count} names")
+    return gazetteer
+
+
+def load_species_gazetteer(path: str) -> Optional[SpeciesGazetteer]:
+    # The file is a local artifact written by SpeciesGazetteer.save, stale formats are rebuilt
+    with open(path, "rb") as f:
+        data = pickle.load(f)
+    if data.get("version") != GAZETTEER_VERSION:
+        return None
+    gazetteer = SpeciesGazetteer(min_name_length=data["min_name_length"])
+    gazetteer.trie = data["trie"]
+    gazetteer.name_count = data["name_count"]
+    print(f"# Species gazetteer loaded with {gazetteer.name_count} names from: {path}")
+    return gazetteer
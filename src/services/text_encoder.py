@@ -1,11 +1,20 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple, Union
 
+import numpy as np
 import torch
 from transformers import AutoTokenizer, AutoModelForMaskedLM
-from sentence_transformers import SentenceTransformer
 from transformers import logging as hf_logging
 hf_logging.set_verbosity_error()
 
+from .embedding_cache import EmbeddingCache
+from .dense_projection import DenseProjection
+from .query_cache import LRUCache
+from .micro_batcher import MicroBatcher
+from .quantization import apply_inference_precision
+from .onnx_backend import INFERENCE_BACKENDS, OnnxMaskedLMEncoder, OnnxSentenceEncoder
+from .model_registry import model_registry, get_sentence_transformer
+from .metrics import SIZE_BUCKETS, metrics
+
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 print('# Available device:', device)
 
@@ -14,35 +23,249 @@ class TextEncoder:
         self,
         sparse_model_name: str,
         dense_model_name: str,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        query_cache: Optional[LRUCache] = None,
+        inference_precision: str = "fp32",
+        inference_backend: str = "torch",
+        onnx_cache_dir: str = "onnx_models",
+        onnx_num_threads: int = 0,
+        dense_projection: Optional[DenseProjection] = None,
     ):
+        if inference_backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend: {inference_backend}. Expected one of {INFERENCE_BACKENDS}")
+        self.embedding_cache = embedding_cache
+        self.query_cache = query_cache
+        self.sparse_batcher: Optional[MicroBatcher] = None
+        self.dense_batcher: Optional[MicroBatcher] = None
         self.sparse_tokenizer = None
         self.sparse_model = None
         self.dense_model = None
         self.sparse_model_name = sparse_model_name
         self.dense_model_name = dense_model_name
+        self.inference_precision = inference_precision
+        self.inference_backend = inference_backend
+        self.onnx_cache_dir = onnx_cache_dir
+        self.onnx_num_threads = onnx_num_threads
+        # Quantized models produce slightly different vectors, keep them apart in the embedding cache.
+        # fp32 onnxruntime matches PyTorch within float tolerance, so it shares the fp32 entries.
+        precision_suffix = ""
+        if inference_precision != "fp32":
+            precision_suffix = f"@{inference_precision}" if inference_backend == "torch" else f"@{inference_backend}-{inference_precision}"
+        self.sparse_cache_key = f"{sparse_model_name}{precision_suffix}"
+        self.dense_cache_key = f"{dense_model_name}{precision_suffix}"
+        self.dense_projection = dense_projection
 
-    def encode_sparse(self, text: str) -> Tuple[List[int], List[float]]:
+    def set_dense_projection(self, dense_projection: Optional[DenseProjection]):
+        """
+        Projects every dense embedding returned from now on. The embedding cache keeps the
+        full embeddings, so changing the projection never requires re-encoding the corpus.
+        """
+        self.dense_projection = dense_projection
+
+    def enable_micro_batching(self, max_batch_size: int = 32, batch_window_ms: float = 10, max_queue_size: int = 1024):
+        """
+        Routes single-text encode_sparse / encode_dense calls through micro-batchers, so
+        concurrent callers share one batched forward pass instead of running at batch size 1.
+        """
+        self.sparse_batcher = MicroBatcher(
+            "sparse",
+            lambda texts: self.encode_sparse_batch(texts, batch_size=len(texts)),
+            max_batch_size=max_batch_size,
+            batch_window_ms=batch_window_ms,
+            max_queue_size=max_queue_size,
+        )
+        self.dense_batcher = MicroBatcher(
+            "dense",
+            self.__encode_dense_requests,
+            max_batch_size=max_batch_size,
+            batch_window_ms=batch_window_ms,
+            max_queue_size=max_queue_size,
+        )
+
+    def load_sparse_model(self):
         if self.sparse_model is None:
-            self.sparse_tokenizer = AutoTokenizer.from_pretrained(self.sparse_model_name)
-            self.sparse_model = AutoModelForMaskedLM.from_pretrained(self.sparse_model_name)
-            self.sparse_model.to(device)
-            print(f"# Sparse model loaded on device: {device}")
-
-        encoded_inputs = self.sparse_tokenizer(
-            text, padding=True, truncation=True, return_tensors="pt"
-        ).to(device)
-        with torch.no_grad():
-            logits = self.sparse_model(**encoded_inputs).logits
-            max_activations = torch.max(torch.nn.functional.relu(logits), dim=1)[0]
-        indices = max_activations.nonzero(as_tuple=True)[1].tolist()
-        values = max_activations[0, indices].tolist()
-        return indices, values
-
-    def encode_dense(self, text: str, task:str) -> List[float]:
-        if self.dense_model is None:
-            self.dense_model = SentenceTransformer(self.dense_model_name, trust_remote_code=True)
-            print(f"# Dense model loaded on device: {self.dense_model.device}")
-        return self.dense_model.encode(text, task=task, prompt_name=task).tolist()
+            self.sparse_tokenizer, self.sparse_model = model_registry.get(
+                ("sparse", self.sparse_model_name, self.inference_backend, self.inference_precision),
+                self.__load_sparse_model,
+            )
+
+    def __load_sparse_model(self):
+        if self.inference_backend == "onnx":
+            sparse_model = OnnxMaskedLMEncoder(
+                self.sparse_model_name, self.onnx_cache_dir, self.inference_precision, self.onnx_num_threads
+            )
+            return sparse_model.tokenizer, sparse_model
+
+        sparse_tokenizer = AutoTokenizer.from_pretrained(self.sparse_model_name)
+        sparse_model = AutoModelForMaskedLM.from_pretrained(self.sparse_model_name)
+        sparse_model.to(device)
+        sparse_model.eval()
+        sparse_model = apply_inference_precision(sparse_model, self.inference_precision, device)
+        print(f"# Sparse model loaded on device: {device} ({self.inference_precision})")
+        return sparse_tokenizer, sparse_model
+
+    def encode_sparse(self, text: str) -> Tuple[List[int], List[float]]:
+        with metrics.span("query_encode", kind="sparse"):
+            if self.query_cache is not None:
+                return self.query_cache.get_or_compute(
+                    ("sparse", self.sparse_cache_key, text),
+                    lambda: self.__encode_sparse_text(text),
+                )
+            return self.__encode_sparse_text(text)
+
+    def __encode_sparse_text(self, text: str) -> Tuple[List[int], List[float]]:
+        if self.sparse_batcher is not None:
+            return self.sparse_batcher.process(text)
+        return self.encode_sparse_batch([text], batch_size=1)[0]
+
+    def encode_sparse_batch(self, texts: List[str], batch_size: int = 32) -> List[Tuple[List[int], List[float]]]:
+        if self.embedding_cache is None:
+            return self.__compute_sparse_batch(texts, batch_size)
+
+        sparse_embeddings = self.embedding_cache.get_sparse(self.sparse_cache_key, texts)
+        missing_idx = [idx for idx, embedding in enumerate(sparse_embeddings) if embedding is None]
+        if missing_idx:
+            missing_texts = [texts[idx] for idx in missing_idx]
+            computed_embeddings = self.__compute_sparse_batch(missing_texts, batch_size)
+            self.embedding_cache.put_sparse(self.sparse_cache_key, missing_texts, computed_embeddings)
+            for idx, embedding in zip(missing_idx, computed_embeddings):
+                sparse_embeddings[idx] = embedding
+        return sparse_embeddings
+
+    def __compute_sparse_batch(self, texts: List[str], batch_size: int) -> List[Tuple[List[int], List[float]]]:
+        self.load_sparse_model()
+
+        sparse_embeddings = []
+        for start in range(0, len(texts), batch_size):
+            batch_texts = texts[start:start + batch_size]
+            metrics.observe("encoder_batch_size", len(batch_texts), buckets=SIZE_BUCKETS, kind="sparse")
+            with metrics.span("encoder_inference", kind="sparse"):
+                sparse_embeddings.extend(self.__infer_sparse_batch(batch_texts))
+        return sparse_embeddings
+
+    def __infer_sparse_batch(self, batch_texts: List[str]) -> List[Tuple[List[int], List[float]]]:
+        if self.inference_backend == "onnx":
+            # The exported graph already applies the mask and max-pool
+            encoded_inputs = self.sparse_tokenizer(batch_texts, padding=True, truncation=True, return_tensors="np")
+            max_activations = torch.from_numpy(self.sparse_model.encode(encoded_inputs))
+        else:
+            encoded_inputs = self.sparse_tokenizer(
+                batch_texts, padding=True, truncation=True, return_tensors="pt"
+            ).to(device)
+            with torch.no_grad():
+                logits = self.sparse_model(**encoded_inputs).logits
+                # Padding positions must not contribute to the max-pool
+                attention_mask = encoded_inputs["attention_mask"].unsqueeze(-1).to(logits.dtype)
+                max_activations = torch.max(torch.nn.functional.relu(logits) * attention_mask, dim=1)[0]
+        return self.__to_sparse_vectors(max_activations)
+
+    def __to_sparse_vectors(self, max_activations: torch.Tensor) -> List[Tuple[List[int], List[float]]]:
+        sparse_vectors = []
+        for row in max_activations:
+            indices = row.nonzero(as_tuple=True)[0]
+            sparse_vectors.append((indices.tolist(), row[indices].tolist()))
+        return sparse_vectors
+
+    def load_dense_model(self):
+        if self.dense_model is None and self.inference_backend == "onnx":
+            # Same encode interface as SentenceTransformer, the rest of the encoder is unchanged
+            self.dense_model = model_registry.get(
+                ("dense", self.dense_model_name, self.inference_backend, self.inference_precision),
+                lambda: OnnxSentenceEncoder(
+                    self.dense_model_name, self.onnx_cache_dir, self.inference_precision, self.onnx_num_threads
+                ),
+            )
+        elif self.dense_model is None:
+            # Same instance as the KeyBERT model of QueryProcessor
+            self.dense_model = get_sentence_transformer(self.dense_model_name, self.inference_precision)
+            print(f"# Dense model loaded on device: {self.dense_model.device} ({self.inference_precision})")
+
+    def warm_up(self):
+        """
+        Loads both models and runs one forward pass each, bypassing the caches, so the
+        first query does not pay for lazy loading or first-call initialization.
+        """
+        self.load_sparse_model()
+        self.load_dense_model()
+        self.__compute_sparse_batch(["Hello World"], 1)
+        self.__compute_dense_batch(["Hello World"], "retrieval.query", 1, False)
+
+    def encode_dense(self, text: Union[str, List[str]], task: str, batch_size: int = 32, show_progress_bar: bool = False) -> Union[List[float], np.ndarray]:
+        if isinstance(text, str):
+            with metrics.span("query_encode", kind="dense"):
+                if self.query_cache is not None:
+                    projection_key = self.dense_projection.key if self.dense_projection is not None else None
+                    return self.query_cache.get_or_compute(
+                        ("dense", self.dense_cache_key, projection_key, task, text),
+                        lambda: self.__encode_dense_text(text, task),
+                    )
+                return self.__encode_dense_text(text, task)
+
+        texts = text
+        if self.embedding_cache is None or not texts:
+            return self.__project_dense(self.__compute_dense_batch(texts, task, batch_size, show_progress_bar))
+
+        cached_embeddings = self.embedding_cache.get_dense(self.dense_cache_key, task, texts)
+        missing_idx = [idx for idx, embedding in enumerate(cached_embeddings) if embedding is None]
+        if missing_idx:
+            missing_texts = [texts[idx] for idx in missing_idx]
+            computed_embeddings = self.__compute_dense_batch(missing_texts, task, batch_size, show_progress_bar)
+            self.embedding_cache.put_dense(self.dense_cache_key, task, missing_texts, computed_embeddings)
+            for idx, embedding in zip(missing_idx, computed_embeddings):
+                cached_embeddings[idx] = embedding
+        return self.__project_dense(np.ascontiguousarray(np.stack(cached_embeddings), dtype=np.float32))
+
+    def __project_dense(self, embeddings: np.ndarray) -> np.ndarray:
+        if self.dense_projection is None:
+            return embeddings
+        return self.dense_projection.project(embeddings)
+
+    def __encode_dense_text(self, text: str, task: str) -> List[float]:
+        if self.dense_batcher is not None:
+            return self.dense_batcher.process((text, task))
+        if self.embedding_cache is not None:
+            return self.encode_dense([text], task)[0].tolist()
+        self.load_dense_model()
+        metrics.observe("encoder_batch_size", 1, buckets=SIZE_BUCKETS, kind="dense")
+        with metrics.span("encoder_inference", kind="dense"):
+            return self.__project_dense(self.dense_model.encode(text, task=task, prompt_name=task)).tolist()
+
+    def __encode_dense_requests(self, requests: List[Tuple[str, str]]) -> List[List[float]]:
+        # One forward pass per task, results returned in request order
+        results: List[Optional[List[float]]] = [None] * len(requests)
+        for task in dict.fromkeys(task for _, task in requests):
+            task_idx = [idx for idx, (_, request_task) in enumerate(requests) if request_task == task]
+            embeddings = self.encode_dense([requests[idx][0] for idx in task_idx], task, batch_size=len(task_idx))
+            for idx, embedding in zip(task_idx, embeddings):
+                results[idx] = embedding.tolist()
+        return results
+
+    def __compute_dense_batch(self, texts: List[str], task: str, batch_size: int, show_progress_bar: bool) -> np.ndarray:
+        self.load_dense_model()
+        if not texts:
+            return np.empty((0, self.dense_model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # encode() already sorts the texts by length, so every batch carries little padding,
+        # and returns the embeddings in input order
+        metrics.observe("encoder_batch_size", min(batch_size, len(texts)), buckets=SIZE_BUCKETS, kind="dense")
+        with metrics.span("encoder_inference", kind="dense"):
+            embeddings = self.dense_model.encode(
+                texts,
+                task=task,
+                prompt_name=task,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=show_progress_bar,
+            )
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def get_full_dense_embedding_size(self) -> int:
+        self.load_dense_model()
+        # Custom model modules may not report their dimension, fall back to encoding a text
+        return self.dense_model.get_sentence_embedding_dimension() or len(self.__compute_dense_batch(["Hello World"], "retrieval.passage", 1, False)[0])
 
     def get_dense_embedding_size(self) -> int:
-        return len(self.encode_dense("Hello World", 'retrieval.passage'))
+        # Size of the stored and searched vectors, read from the model config instead of encoding a text
+        if self.dense_projection is not None:
+            return self.dense_projection.output_dim
+        return self.get_full_dense_embedding_size()
@@ -1,22 +1,112 @@
-from typing import Dict, List, Optional, Union
+import hashlib
+import os
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
+import numpy as np
 import tqdm
 from qdrant_client import QdrantClient, models
 
 from models import VectorizableDocument
 from .text_encoder import TextEncoder
+from .query_cache import LRUCache
+from .metrics import SIZE_BUCKETS, metrics
+
+HYBRID_SEARCH_MODES = ("keyword_filtered", "rrf", "dbsf")
+
+# Payload fields used in search filters, indexed so filtering does not scan every payload
+PAYLOAD_INDEXES = {
+    "source_url": models.PayloadSchemaType.KEYWORD,
+    "scientific_name": models.PayloadSchemaType.KEYWORD,
+    # Stored as the "Es cuarentenanaria" / "No es cuarentenanaria" / "-" label shown to the LLM
+    "es_cuarentenaria": models.PayloadSchemaType.KEYWORD,
+}
+
+# Dense vector quantization, kept in RAM while the original vectors stay on disk for rescoring
+QUANTIZATION_TYPES = ("int8", "binary")
+
+PayloadSelector = Union[bool, List[str]]
+FilterCriteria = Dict[str, Union[List[Union[str, int]], str, int, bool]]
+
+
+def read_collection_version(storage_path: str, collection_name: str) -> str:
+    try:
+        with open(os.path.join(storage_path, f"{collection_name}.version"), encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def write_collection_version(storage_path: str, collection_name: str) -> str:
+    version = uuid.uuid4().hex
+    path = os.path.join(storage_path, f"{collection_name}.version")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(path + ".tmp", path)
+    return version
+
+
+def build_search_cache_key(collection_name: str, query_embedding: Union[models.NamedVector,models.NamedSparseVector], filter_criteria: Optional[FilterCriteria], top_k: int, with_payload: PayloadSelector = True) -> tuple:
+    if isinstance(query_embedding, models.NamedSparseVector):
+        vector = (tuple(query_embedding.vector.indices), tuple(query_embedding.vector.values))
+    else:
+        vector = tuple(query_embedding.vector)
+    vector_hash = hashlib.sha256(repr(vector).encode("utf-8")).hexdigest()
+    filter_key = tuple(sorted(
+        (key, tuple(values) if isinstance(values, (list, tuple)) else values)
+        for key, values in (filter_criteria or {}).items()
+    ))
+    payload_key = tuple(with_payload) if isinstance(with_payload, list) else with_payload
+    return (collection_name, query_embedding.name, vector_hash, filter_key, top_k, payload_key)
+
+
+def encode_documents(text_encoder: TextEncoder, documents: List[VectorizableDocument], use_sparse: bool, use_dense: bool, batch_size: int, verbose: bool) -> Tuple[Optional[List[Tuple[List[int], List[float]]]], Optional[np.ndarray]]:
+    sparse_embeddings = None
+    if use_sparse:
+        # Chunks of the same species share their sparse text, encode each one once
+        sparse_texts = list(dict.fromkeys(doc.sparse_text for doc in documents))
+        unique_sparse_embeddings = []
+        for start in tqdm.tqdm(range(0, len(sparse_texts), batch_size), disable=not verbose):
+            unique_sparse_embeddings.extend(
+                text_encoder.encode_sparse_batch(sparse_texts[start:start + batch_size], batch_size=batch_size)
+            )
+        sparse_embeddings_by_text = dict(zip(sparse_texts, unique_sparse_embeddings))
+        sparse_embeddings = [sparse_embeddings_by_text[doc.sparse_text] for doc in documents]
+
+    dense_embeddings = None
+    if use_dense:
+        dense_embeddings = text_encoder.encode_dense(
+            [doc.text for doc in documents], 'retrieval.passage', batch_size=batch_size, show_progress_bar=verbose
+        )
+    return sparse_embeddings, dense_embeddings
+
 
 class VectorStore:
-    def __init__(self, storage_path: str, text_encoder: TextEncoder, sparse_vectors_name: str, dense_vectors_name:str):
+    def __init__(self, storage_path: str, text_encoder: TextEncoder, sparse_vectors_name: str, dense_vectors_name:str, search_cache: Optional[LRUCache] = None, quantization: Optional[str] = None, quantization_oversampling: float = 2.0, quantization_rescore: bool = True):
+        if quantization is not None and quantization not in QUANTIZATION_TYPES:
+            raise ValueError(f"Unknown quantization: {quantization}. Expected one of {QUANTIZATION_TYPES}")
         self.client = QdrantClient(path=storage_path)
+        self.storage_path = storage_path
         self.text_encoder = text_encoder
         self.sparse_vectors_name = sparse_vectors_name
         self.dense_vectors_name = dense_vectors_name
+        self.search_cache = search_cache
+        self.quantization = quantization
+        self.quantization_oversampling = quantization_oversampling
+        self.quantization_rescore = quantization_rescore
         
     def collection_exists(self, collection_name: str) -> bool:
         return collection_name in [col.name for col in self.client.get_collections().collections]
     
+    def get_collection_version(self, collection_name: str) -> str:
+        # Changes on every write to the collection, so caches of answers built from it can be dropped
+        return read_collection_version(self.storage_path, collection_name)
+
+    def bump_collection_version(self, collection_name: str) -> str:
+        return write_collection_version(self.storage_path, collection_name)
+
     def create_collection(self, collection_name: str, dense_vector_size: int):
+        self.bump_collection_version(collection_name)
         self.client.recreate_collection(
             collection_name=collection_name,
             sparse_vectors_config={
@@ -37,26 +127,79 @@ class VectorStore:
                 full_scan_threshold=10000,
                 on_disk=True
             ),
-            on_disk_payload=True
+            on_disk_payload=True,
+            quantization_config=self.get_quantization_config(),
+        )
+        self.create_payload_indexes(collection_name)
+
+    def get_quantization_config(self) -> Optional[models.QuantizationConfig]:
+        if self.quantization == "int8":
+            return models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+            )
+        if self.quantization == "binary":
+            return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def update_quantization(self, collection_name: str) -> bool:
+        """
+        Applies the configured quantization to an existing collection, Qdrant builds the
+        quantized vectors from the stored originals. Returns True when it changed. Like
+        payload indexes, quantization only takes effect on a Qdrant server.
+        """
+        quantization_config = self.get_quantization_config()
+        if self.client.get_collection(collection_name).config.quantization_config == quantization_config:
+            return False
+        self.client.update_collection(
+            collection_name=collection_name,
+            quantization_config=quantization_config or models.Disabled.DISABLED,
         )
+        return True
+
+    def get_search_params(self, oversampling: Optional[float], rescore: Optional[bool]) -> Optional[models.SearchParams]:
+        # Candidates are selected on the quantized vectors, oversampled, then rescored with the originals
+        if self.quantization is None:
+            return None
+        return models.SearchParams(
+            quantization=models.QuantizationSearchParams(
+                ignore=False,
+                rescore=self.quantization_rescore if rescore is None else rescore,
+                oversampling=self.quantization_oversampling if oversampling is None else oversampling,
+            )
+        )
+
+    def create_payload_indexes(self, collection_name: str, payload_indexes: Optional[Dict[str, models.PayloadSchemaType]] = None) -> List[str]:
+        """
+        Creates the payload indexes missing from the collection, or replaces those of another
+        type, and returns their field names, so existing collections can be indexed without
+        a rebuild. The local (path-based) Qdrant client accepts them but only a Qdrant
+        server uses them.
+        """
+        payload_indexes = PAYLOAD_INDEXES if payload_indexes is None else payload_indexes
+        existing_indexes = self.client.get_collection(collection_name).payload_schema or {}
+        created_indexes = []
+        for field_name, field_schema in payload_indexes.items():
+            if field_name in existing_indexes:
+                if existing_indexes[field_name].data_type == field_schema:
+                    continue
+                self.client.delete_payload_index(collection_name=collection_name, field_name=field_name)
+            self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema,
+            )
+            created_indexes.append(field_name)
+        return created_indexes
     
-    def add_documents(self, collection_name: str, documents: List[VectorizableDocument], use_sparse: bool = False, use_dense: bool = False):
-        texts = [doc.text for doc in documents]
-
-        sparse_embeddings = []
-        if use_sparse:
-            for text in tqdm.tqdm(texts):
-                sparse_embeddings.append(self.text_encoder.encode_sparse(text))
-        else:
-            sparse_embeddings = None
-
-        dense_embeddings = []
-        if use_dense:
-            for text in tqdm.tqdm(texts):
-                dense_embeddings.append(self.text_encoder.encode_dense(text, 'retrieval.passage'))
-        else:
-            dense_embeddings = None
-        
+    def add_documents(self, collection_name: str, documents: List[VectorizableDocument], use_sparse: bool = False, use_dense: bool = False, batch_size: int = 32, verbose: bool = True):
+        with metrics.span("add_documents", kind="dense" if use_dense else "sparse"):
+            return self.__add_documents(collection_name, documents, use_sparse, use_dense, batch_size, verbose)
+
+    def __add_documents(self, collection_name: str, documents: List[VectorizableDocument], use_sparse: bool, use_dense: bool, batch_size: int, verbose: bool):
+        sparse_embeddings, dense_embeddings = encode_documents(
+            self.text_encoder, documents, use_sparse, use_dense, batch_size, verbose
+        )
+
         points = []
         for idx, doc in enumerate(documents):
             vector_data = {}
@@ -66,7 +209,7 @@ class VectorStore:
                     values=sparse_embeddings[idx][1]
                 )
             if use_dense:
-                vector_data[self.dense_vectors_name] = dense_embeddings[idx]
+                vector_data[self.dense_vectors_name] = dense_embeddings[idx].tolist()
             
             points.append(models.PointStruct(
                 id=doc.id,
@@ -74,32 +217,250 @@ class VectorStore:
                 payload=doc.metadata
             ))
         
-        if use_sparse:
+        if verbose and use_sparse:
             print(f"# Saving {len(points)} sparse embeddings to Qdrant")
-            self.client.upsert(collection_name=collection_name, points=points)
-        if use_dense:
+        if verbose and use_dense:
             print(f"# Saving {len(points)} dense embeddings to Qdrant")
-            self.client.upsert(collection_name=collection_name, points=points)
+        if points:
+            metrics.observe("qdrant_upsert_batch_size", len(points), buckets=SIZE_BUCKETS)
+            with metrics.span("qdrant_request", operation="upsert"):
+                self.client.upsert(collection_name=collection_name, points=points)
+            self.bump_collection_version(collection_name)
+            metrics.increment("points_upserted_total", len(points), kind="dense" if use_dense else "sparse")
         return len(points)
     
-    def search(self, collection_name: str, query_embedding: Union[models.NamedVector,models.NamedSparseVector], filter_criteria: Optional[Dict[str, List[str]]] = None,top_k: int = 12):
-        search_filter = None
-
-        if filter_criteria:
-            must_conditions = [
-                models.FieldCondition(
-                    key=key,
-                    match=models.MatchAny(any=values)
+    def flush(self, collection_name: str):
+        # Qdrant persists every upsert and delete, there is nothing to write
+        pass
+
+    def close(self):
+        self.client.close()
+
+    def iter_points(self, collection_name: str, payload_fields: List[str], batch_size: int = 1000) -> Iterator[Tuple[Union[int, str], Dict]]:
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=payload_fields,
+                with_vectors=False,
+            )
+            for point in points:
+                yield point.id, point.payload
+            if offset is None:
+                break
+
+    def delete_points(self, collection_name: str, point_ids: List[Union[int, str]], batch_size: int = 1000) -> int:
+        for start in range(0, len(point_ids), batch_size):
+            self.client.delete(
+                collection_name=collection_name,
+                points_selector=models.PointIdsList(points=point_ids[start:start + batch_size]),
+            )
+        if point_ids:
+            self.bump_collection_version(collection_name)
+        return len(point_ids)
+
+    def hybrid_search(
+        self,
+        collection_name: str,
+        sparse_query_embedding: models.NamedSparseVector,
+        dense_query_embedding: models.NamedVector,
+        mode: str = "rrf",
+        prefetch_limit: int = 100,
+        filter_criteria: Optional[FilterCriteria] = None,
+        top_k: int = 12,
+        with_payload: PayloadSelector = True,
+        oversampling: Optional[float] = None,
+        rescore: Optional[bool] = None,
+    ):
+        """
+        Runs sparse and dense retrieval together.
+
+        Modes:
+        - "rrf" / "dbsf": independent sparse and dense prefetches over the chunks, merged in a
+          single Query API call with Reciprocal Rank Fusion or Distribution-Based Score Fusion.
+        - "keyword_filtered": the sparse keyword search picks the `prefetch_limit` best species
+          keyword points, then a dense search runs over every chunk of their source URLs, as
+          the former keyword search plus source_url filter. It takes two requests.
+
+        `with_payload` is True for the whole payload, False for none, or the list of
+        payload fields to return. `oversampling` and `rescore` override the quantized
+        search settings of the store for this call.
+        """
+        if mode not in HYBRID_SEARCH_MODES:
+            raise ValueError(f"Unknown hybrid search mode: {mode}. Expected one of {HYBRID_SEARCH_MODES}")
+
+        search_params = self.get_search_params(oversampling, rescore)
+        if self.search_cache is not None:
+            # The collection version changes on every write, so results cached before an
+            # ingestion, rebuild or flush (possibly by another process) are never returned
+            key = (
+                "hybrid",
+                self.get_collection_version(collection_name),
+                mode,
+                prefetch_limit,
+                build_search_cache_key(collection_name, sparse_query_embedding, None, top_k),
+                build_search_cache_key(collection_name, dense_query_embedding, filter_criteria, top_k, with_payload),
+                repr(search_params),
+            )
+            return self.search_cache.get_or_compute(
+                key,
+                lambda: self.__hybrid_search(collection_name, sparse_query_embedding, dense_query_embedding, mode, prefetch_limit, filter_criteria, top_k, with_payload, search_params),
+            )
+        return self.__hybrid_search(collection_name, sparse_query_embedding, dense_query_embedding, mode, prefetch_limit, filter_criteria, top_k, with_payload, search_params)
+
+    def __hybrid_search(self, collection_name, sparse_query_embedding, dense_query_embedding, mode, prefetch_limit, filter_criteria, top_k, with_payload, search_params):
+        # Only chunk points carry content, keyword-only points must not reach the results
+        chunk_conditions = [
+            models.IsEmptyCondition(is_empty=models.PayloadField(key="content_chunk"))
+        ]
+        search_filter = self.__build_filter(filter_criteria)
+        prefetch_filter = models.Filter(
+            must=search_filter.must if search_filter else None,
+            must_not=chunk_conditions,
+        )
+        if mode == "keyword_filtered":
+            with metrics.span("qdrant_request", operation=f"hybrid_search_{mode}"):
+                points = self.__query_keyword_filtered_points(
+                    collection_name, sparse_query_embedding, dense_query_embedding, search_filter, chunk_conditions, prefetch_limit, top_k, with_payload, search_params
                 )
-                for key, values in filter_criteria.items()
-            ]
-            search_filter = models.Filter(must=must_conditions)
+            return [(res.id, res.score, res.payload) for res in points]
+
+        sparse_prefetch = models.Prefetch(
+            query=sparse_query_embedding.vector,
+            using=sparse_query_embedding.name,
+            filter=prefetch_filter,
+            limit=prefetch_limit,
+        )
 
-        results = self.client.search(
+        with metrics.span("qdrant_request", operation=f"hybrid_search_{mode}"):
+            response = self.__query_hybrid_points(
+                collection_name, sparse_prefetch, dense_query_embedding, mode, prefetch_filter, prefetch_limit, top_k, with_payload, search_params
+            )
+        return [(res.id, res.score, res.payload) for res in response.points]
+
+    def __query_keyword_filtered_points(self, collection_name, sparse_query_embedding, dense_query_embedding, search_filter, chunk_conditions, prefetch_limit, top_k, with_payload, search_params):
+        # Chunks of a species share its keyword vector, so the sparse scores of chunks tie and a
+        # prefetch over them would drop chunks arbitrarily. Species keyword points are ranked
+        # instead, and the dense query is restricted to their source URLs (two requests, as a
+        # prefetch can only narrow the outer query by point ids, not by payload values).
+        must_conditions = list(search_filter.must) if search_filter else []
+        keyword_points = self.client.query_points(
+            collection_name=collection_name,
+            query=sparse_query_embedding.vector,
+            using=sparse_query_embedding.name,
+            query_filter=models.Filter(must=must_conditions + chunk_conditions),
+            limit=prefetch_limit,
+            with_payload=["source_url"],
+        ).points
+        source_urls = list(dict.fromkeys(point.payload["source_url"] for point in keyword_points if point.payload.get("source_url")))
+        if not source_urls:
+            return []
+        return self.client.query_points(
             collection_name=collection_name,
-            query_vector=query_embedding,
-            query_filter=search_filter,
-            limit=top_k
+            query=dense_query_embedding.vector,
+            using=dense_query_embedding.name,
+            query_filter=models.Filter(
+                must=must_conditions + [models.FieldCondition(key="source_url", match=models.MatchAny(any=source_urls))],
+                must_not=chunk_conditions,
+            ),
+            search_params=search_params,
+            limit=top_k,
+            with_payload=with_payload,
+        ).points
+
+    def __query_hybrid_points(self, collection_name, sparse_prefetch, dense_query_embedding, mode, prefetch_filter, prefetch_limit, top_k, with_payload, search_params):
+        dense_prefetch = models.Prefetch(
+            query=dense_query_embedding.vector,
+            using=dense_query_embedding.name,
+            filter=prefetch_filter,
+            params=search_params,
+            limit=prefetch_limit,
+        )
+        return self.client.query_points(
+            collection_name=collection_name,
+            prefetch=[sparse_prefetch, dense_prefetch],
+            query=models.FusionQuery(
+                fusion=models.Fusion.RRF if mode == "rrf" else models.Fusion.DBSF
+            ),
+            limit=top_k,
+            with_payload=with_payload,
         )
 
-        return [(res.id, res.score, res.payload) for res in results]
\ No newline at end of file
+    def search(self, collection_name: str, query_embedding: Union[models.NamedVector,models.NamedSparseVector], filter_criteria: Optional[FilterCriteria] = None,top_k: int = 12, with_payload: PayloadSelector = True, oversampling: Optional[float] = None, rescore: Optional[bool] = None):
+        # with_payload selects the payload fields to transfer (True for all, False for none)
+        search_params = self.get_search_params(oversampling, rescore)
+        if self.search_cache is not None:
+            return self.search_cache.get_or_compute(
+                (self.get_collection_version(collection_name), build_search_cache_key(collection_name, query_embedding, filter_criteria, top_k, with_payload), repr(search_params)),
+                lambda: self.__search(collection_name, query_embedding, filter_criteria, top_k, with_payload, search_params),
+            )
+        return self.__search(collection_name, query_embedding, filter_criteria, top_k, with_payload, search_params)
+
+    def __search(self, collection_name: str, query_embedding: Union[models.NamedVector,models.NamedSparseVector], filter_criteria: Optional[FilterCriteria], top_k: int, with_payload: PayloadSelector, search_params: Optional[models.SearchParams]):
+        search_filter = self.__build_filter(filter_criteria)
+
+        with metrics.span("qdrant_request", operation="search"):
+            results = self.client.search(
+                collection_name=collection_name,
+                query_vector=query_embedding,
+                query_filter=search_filter,
+                search_params=search_params,
+                limit=top_k,
+                with_payload=with_payload,
+            )
+
+        return [(res.id, res.score, res.payload) for res in results]
+
+    def __build_filter(self, filter_criteria: Optional[FilterCriteria]) -> Optional[models.Filter]:
+        if not filter_criteria:
+            return None
+
+        # Lists match any of their values, single values (e.g. es_cuarentenaria="Es cuarentenanaria") match exactly
+        must_conditions = [
+            models.FieldCondition(
+                key=key,
+                match=models.MatchAny(any=list(values)) if isinstance(values, (list, tuple)) else models.MatchValue(value=values)
+            )
+            for key, values in filter_criteria.items()
+        ]
+        return models.Filter(must=must_conditions)
+
+
+def open_vector_store(text_encoder: TextEncoder, sparse_vectors_name: str, dense_vectors_name: str, search_cache: Optional[LRUCache] = None):
+    """
+    Opens the vector store backend selected by VECTOR_STORE_BACKEND: "qdrant" (default,
+    embedded Qdrant in QDRANT_STORAGE_PATH) or "numpy" (in-process memory-mapped index
+    in NUMPY_STORAGE_PATH). Both expose the same interface, with the dense quantization
+    set by DENSE_QUANTIZATION (none, int8 or binary).
+    """
+    backend = os.getenv("VECTOR_STORE_BACKEND", "qdrant")
+    quantization = os.getenv("DENSE_QUANTIZATION", "none")
+    quantization_options = dict(
+        quantization=None if quantization in ("", "none") else quantization,
+        quantization_oversampling=float(os.getenv("QUANTIZATION_OVERSAMPLING", "2.0")),
+        quantization_rescore=os.getenv("QUANTIZATION_RESCORE", "true").lower() == "true",
+    )
+    if backend == "numpy":
+        from .numpy_vector_store import NumpyVectorStore
+
+        return NumpyVectorStore(
+            os.getenv("NUMPY_STORAGE_PATH", "numpy_storage"),
+            text_encoder,
+            sparse_vectors_name,
+            dense_vectors_name,
+            search_cache=search_cache,
+            dense_dtype=os.getenv("NUMPY_DENSE_DTYPE", "float32"),
+            **quantization_options,
+        )
+    if backend != "qdrant":
+        raise ValueError(f"Unknown vector store backend: {backend}. Expected qdrant or numpy")
+    return VectorStore(
+        os.getenv("QDRANT_STORAGE_PATH", "qdrant_storage"),
+        text_encoder,
+        sparse_vectors_name,
+        dense_vectors_name,
+        search_cache=search_cache,
+        **quantization_options,
+    )
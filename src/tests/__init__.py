@@ -0,0 +1,14 @@
+import sys
+import types
+from unittest import mock
+
+import mongomock
+from sqlalchemy.orm import declarative_base
+
+# Stand-in for db.py, which connects to PostgreSQL and MongoDB on import. Installed when the
+# package is imported, before any test module imports the services
+fake_db = types.ModuleType("db")
+fake_db.EntityBase = declarative_base()
+fake_db.PostgresSession = mock.MagicMock()
+fake_db.MongoSession = mongomock.MongoClient()["plagues"]
+sys.modules.setdefault("db", fake_db)
@@ -0,0 +1,104 @@
+import asyncio
+import time
+import unittest
+
+from fake_ollama_server import FakeOllamaServer
+from services.llm_client import LLMRequestError, OllamaClient
+
+PAYLOAD = {"model": "fake", "stream": True, "messages": [{"role": "user", "content": "Hello"}]}
+TOKENS = 32
+FIRST_TOKEN_MS = 50
+TOKEN_MS = 5
+
+
+def wait_for(predicate, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+class OllamaClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOllamaServer(FIRST_TOKEN_MS, TOKEN_MS, TOKENS).start()
+        self.client = OllamaClient(self.server.url, keep_alive="10m")
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_streams_every_token_over_one_pooled_connection(self):
+        self.assertTrue(self.client.preload("fake"))
+        for _ in range(3):
+            start = time.perf_counter()
+            first_token_ms = None
+            tokens = []
+            for content in self.client.stream_chat(PAYLOAD):
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - start) * 1000
+                tokens.append(content)
+            self.assertEqual(len(tokens), TOKENS)
+            # The first token arrives before the end of the stream, answers are not buffered
+            self.assertLess(first_token_ms, FIRST_TOKEN_MS + TOKENS * TOKEN_MS / 2)
+        self.assertEqual(self.server.requests[-1].get("keep_alive"), "10m")
+        self.assertEqual(self.server.connections, 1)
+
+    def test_closing_the_stream_cancels_the_generation(self):
+        answer_chunks = self.client.stream_chat(PAYLOAD)
+        next(answer_chunks)
+        answer_chunks.close()
+        self.assertTrue(wait_for(lambda: self.server.cancelled_streams == 1))
+
+    def test_stalled_stream_times_out(self):
+        with FakeOllamaServer(first_token_ms=1000, tokens=1) as slow_server:
+            client = OllamaClient(slow_server.url, read_timeout=0.2)
+            start = time.perf_counter()
+            with self.assertRaises(LLMRequestError):
+                list(client.stream_chat(PAYLOAD))
+            self.assertLess(time.perf_counter() - start, 0.9)
+            client.close()
+
+
+class AsyncOllamaClientTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = FakeOllamaServer(FIRST_TOKEN_MS, TOKEN_MS, TOKENS).start()
+        self.client = OllamaClient(self.server.url)
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+        self.client.close()
+        self.server.stop()
+
+    async def read_answer(self):
+        return [content async for content in self.client.astream_chat(PAYLOAD)]
+
+    async def test_concurrent_streams_reuse_pooled_connections(self):
+        answers = await asyncio.gather(*[self.read_answer() for _ in range(4)])
+        self.assertTrue(all(len(answer) == TOKENS for answer in answers))
+        await self.read_answer()
+        self.assertLessEqual(self.server.connections, 4)
+
+    async def test_cancelling_the_task_cancels_the_generation(self):
+        task = asyncio.ensure_future(self.read_answer())
+        await asyncio.sleep((FIRST_TOKEN_MS + 2 * TOKEN_MS) / 1000)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertTrue(await asyncio.to_thread(wait_for, lambda: self.server.cancelled_streams == 1))
+
+    async def test_stalled_stream_times_out(self):
+        with FakeOllamaServer(first_token_ms=1000, tokens=1) as slow_server:
+            client = OllamaClient(slow_server.url, read_timeout=0.2)
+            start = time.perf_counter()
+            with self.assertRaises(LLMRequestError):
+                async for _ in client.astream_chat(PAYLOAD):
+                    pass
+            self.assertLess(time.perf_counter() - start, 0.9)
+            await client.aclose()
+            client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
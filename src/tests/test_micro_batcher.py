@@ -0,0 +1,71 @@
+import threading
+import unittest
+from concurrent.futures import Future
+
+from services.micro_batcher import MicroBatcher
+
+TIMEOUT = 5
+
+
+class MicroBatcherTest(unittest.TestCase):
+    def create_batcher(self, process_batch, **kwargs):
+        batcher = MicroBatcher("test", process_batch, **kwargs)
+        self.addCleanup(batcher.close)
+        return batcher
+
+    def test_results_follow_item_order(self):
+        batcher = self.create_batcher(lambda items: [item * 2 for item in items], batch_window_ms=20)
+        self.assertEqual(batcher.process_many(list(range(10))), [item * 2 for item in range(10)])
+
+    def test_missing_results_fail_every_future(self):
+        batcher = self.create_batcher(lambda items: items[:-1], batch_window_ms=50)
+        futures = [batcher.submit(item) for item in range(3)]
+        for future in futures:
+            with self.assertRaisesRegex(RuntimeError, "2 results for 3 items"):
+                future.result(timeout=TIMEOUT)
+
+    def test_worker_survives_base_exceptions(self):
+        calls = []
+
+        def process_batch(items):
+            calls.append(items)
+            if len(calls) == 1:
+                raise KeyboardInterrupt()
+            return items
+
+        batcher = self.create_batcher(process_batch, batch_window_ms=0)
+        with self.assertRaises(KeyboardInterrupt):
+            batcher.submit(1).result(timeout=TIMEOUT)
+        self.assertEqual(batcher.submit(2).result(timeout=TIMEOUT), 2)
+
+    def test_close_fails_items_queued_behind_the_stop(self):
+        started, release = threading.Event(), threading.Event()
+
+        def process_batch(items):
+            started.set()
+            release.wait(TIMEOUT)
+            return items
+
+        batcher = MicroBatcher("test", process_batch, max_batch_size=1, batch_window_ms=0)
+        first = batcher.submit(1)
+        second = batcher.submit(2)
+        started.wait(TIMEOUT)
+        closing = threading.Thread(target=batcher.close)
+        closing.start()
+        while batcher.pending.qsize() < 2:
+            threading.Event().wait(0.001)
+        # A submit that passed the closed check just before close() queues behind the stop marker
+        late = Future()
+        batcher.pending.put((3, late))
+        release.set()
+        closing.join(TIMEOUT)
+
+        self.assertFalse(closing.is_alive())
+        self.assertEqual([first.result(timeout=TIMEOUT), second.result(timeout=TIMEOUT)], [1, 2])
+        with self.assertRaisesRegex(RuntimeError, "closed"):
+            late.result(timeout=TIMEOUT)
+        with self.assertRaisesRegex(RuntimeError, "closed"):
+            batcher.submit(4)
+
+if __name__ == "__main__":
+    unittest.main()
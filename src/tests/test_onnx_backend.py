@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pytest
+from dotenv import load_dotenv
+from huggingface_hub import try_to_load_from_cache
+
+pytest.importorskip("onnxruntime")
+
+from services import Reranker, TextEncoder  # noqa: E402
+
+# Exported variables take precedence over .env, to point the tests at other models
+load_dotenv()
+
+# Maximum absolute difference accepted between fp32 ONNX and PyTorch outputs
+ATOL = 1e-3
+TEXTS = [
+    "Hello World",
+    "Which crops are affected by Bactericera cockerelli?",
+    "Azolla pinnata is a floating aquatic fern that can cover the surface of ponds and rice fields.",
+    "Tuta absoluta larvae mine the leaves, stems and fruits of tomato plants, causing losses of up to 100% in greenhouses.",
+]
+
+
+def get_cached_model(variable: str) -> str:
+    # Exporting needs the PyTorch weights, the tests never download a model
+    model_name = os.getenv(variable)
+    if not model_name:
+        raise unittest.SkipTest(f"{variable} is not set")
+    if not os.path.isdir(model_name) and not isinstance(try_to_load_from_cache(model_name, "config.json"), str):
+        raise unittest.SkipTest(f"{model_name} is not in the Hugging Face cache")
+    return model_name
+
+
+class OnnxBackendTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.onnx_cache = tempfile.TemporaryDirectory()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.onnx_cache.cleanup()
+
+    def create_encoders(self):
+        sparse_model_name = get_cached_model("SPARSE_EMBEDDINGS_MODEL_NAME")
+        dense_model_name = get_cached_model("DENSE_EMBEDDINGS_MODEL_NAME")
+        torch_encoder = TextEncoder(sparse_model_name=sparse_model_name, dense_model_name=dense_model_name)
+        onnx_encoder = TextEncoder(
+            sparse_model_name=sparse_model_name,
+            dense_model_name=dense_model_name,
+            inference_backend="onnx",
+            onnx_cache_dir=self.onnx_cache.name,
+        )
+        return torch_encoder, onnx_encoder
+
+    def test_dense_embeddings_match_pytorch(self):
+        torch_encoder, onnx_encoder = self.create_encoders()
+        for task in ("retrieval.query", "retrieval.passage"):
+            with self.subTest(task=task):
+                np.testing.assert_allclose(onnx_encoder.encode_dense(TEXTS, task), torch_encoder.encode_dense(TEXTS, task), rtol=0, atol=ATOL)
+
+    def test_sparse_embeddings_match_pytorch(self):
+        torch_encoder, onnx_encoder = self.create_encoders()
+        for (torch_indices, torch_values), (onnx_indices, onnx_values) in zip(
+            torch_encoder.encode_sparse_batch(TEXTS), onnx_encoder.encode_sparse_batch(TEXTS)
+        ):
+            # Activations close to zero may fall on either side of it, compare dense vectors
+            torch_vector = dict(zip(torch_indices, torch_values))
+            onnx_vector = dict(zip(onnx_indices, onnx_values))
+            indices = sorted(torch_vector.keys() | onnx_vector.keys())
+            np.testing.assert_allclose(
+                [onnx_vector.get(index, 0.0) for index in indices], [torch_vector.get(index, 0.0) for index in indices], rtol=0, atol=ATOL
+            )
+
+    def test_reranker_scores_match_pytorch(self):
+        model_name = get_cached_model("RERANKER_MODEL_NAME")
+        documents = list(enumerate(TEXTS))
+        torch_scores = Reranker(model_name).compute_scores(TEXTS[1], documents)
+        onnx_scores = Reranker(model_name, inference_backend="onnx", onnx_cache_dir=self.onnx_cache.name).compute_scores(TEXTS[1], documents)
+        np.testing.assert_allclose(onnx_scores, torch_scores, rtol=0, atol=ATOL)
+
+
+if __name__ == "__main__":
+    unittest.main()
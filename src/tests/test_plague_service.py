@@ -0,0 +1,110 @@
+import math
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import mongomock
+
+from entities import CabiSpecie, Specie, SpecieNew
+from services.plague_service import PlagueService
+
+BATCH_SIZE = 1000
+
+
+class CountingCollection:
+    # Counts find() calls, each one is a round-trip to MongoDB
+    def __init__(self, collection):
+        self.collection = collection
+        self.find_calls = 0
+
+    def find(self, *args, **kwargs):
+        self.find_calls += 1
+        return self.collection.find(*args, **kwargs)
+
+
+class PlagueServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.TemporaryDirectory()
+        self.previous_dir = os.getcwd()
+        os.chdir(self.working_dir.name)
+        sys.modules["db"].PostgresSession.query.side_effect = (
+            lambda entity: mock.Mock(yield_per=lambda batch_size: iter(self.rows[entity]))
+        )
+        self.reset_sources()
+
+    def tearDown(self):
+        os.chdir(self.previous_dir)
+        self.working_dir.cleanup()
+
+    def reset_sources(self):
+        self.mongo = mongomock.MongoClient()["plagues"]
+        self.rows = {CabiSpecie: [], Specie: [], SpecieNew: []}
+
+    def add_species(self, count: int):
+        for idx in range(count):
+            self.rows[CabiSpecie].append(CabiSpecie(scientific_name=f"Cabi {idx}", common_names=f"cabi {idx}", source_url=f"https://cabi.org/{idx}", is_quarantine=idx % 2 == 0))
+            self.rows[Specie].append(Specie(scientific_name=f"Specie {idx}", common_names=f"specie {idx}", source_url=f"https://species.org/{idx}"))
+            self.rows[SpecieNew].append(SpecieNew(scientific_name=f"New {idx}", source_url=f"https://news.org/{idx}", is_quarantine=False))
+        self.mongo["cabi_scraper"].insert_many([{"nombre_cientifico": f"Cabi {idx}", "contenido": f"cabi content {idx}"} for idx in range(count)])
+        self.mongo["urls_scraper"].insert_many([{"source_url": f"https://species.org/{idx}", "contenido": f"specie content {idx}"} for idx in range(count)])
+        self.mongo["news_article"].insert_many([{"source_url": f"https://news.org/{idx}", "contenido": f"news content {idx}"} for idx in range(count)])
+
+    def create_service(self):
+        service = PlagueService()
+        self.collections = {
+            "cabi_scraper": CountingCollection(self.mongo["cabi_scraper"]),
+            "urls_scraper": CountingCollection(self.mongo["urls_scraper"]),
+            "news_article": CountingCollection(self.mongo["news_article"]),
+        }
+        service.cabi_species_repository.cabi_scraper_collection = self.collections["cabi_scraper"]
+        service.species_repository.url_scraper_collection = self.collections["urls_scraper"]
+        service.species_news_repository.news_article_collection = self.collections["news_article"]
+        return service
+
+    def test_round_trips_are_bounded_by_batches(self):
+        for count in (10, 2500):
+            with self.subTest(count=count):
+                self.reset_sources()
+                self.add_species(count)
+                plagues = list(self.create_service().iter_plagues(batch_size=BATCH_SIZE))
+                self.assertEqual(len(plagues), 3 * count)
+                for name, collection in self.collections.items():
+                    self.assertEqual(collection.find_calls, math.ceil(count / BATCH_SIZE), name)
+
+    def test_get_plagues_uses_one_query_per_collection(self):
+        self.add_species(500)
+        plagues = self.create_service().get_plagues()
+        self.assertEqual(len(plagues), 1500)
+        self.assertEqual({name: collection.find_calls for name, collection in self.collections.items()}, {"cabi_scraper": 1, "urls_scraper": 1, "news_article": 1})
+        self.assertEqual(plagues[0].content, "cabi content 0")
+        self.assertEqual(plagues[0].is_quarantine, "Es cuarentenanaria")
+
+    def test_first_document_wins_for_duplicate_keys(self):
+        self.add_species(2)
+        self.mongo["cabi_scraper"].insert_one({"nombre_cientifico": "Cabi 1", "contenido": "duplicate cabi content"})
+        self.mongo["urls_scraper"].insert_one({"source_url": "https://species.org/1", "contenido": "duplicate specie content"})
+        self.mongo["news_article"].insert_one({"source_url": "https://news.org/1", "contenido": "duplicate news content"})
+
+        contents = {plague.scientific_name: plague.content for plague in self.create_service().iter_plagues()}
+        self.assertEqual(contents["Cabi 1"], "cabi content 1")
+        self.assertEqual(contents["Specie 1"], "specie content 1")
+        self.assertEqual(contents["New 1"], "news content 1")
+
+    def test_species_without_content_are_logged(self):
+        self.add_species(3)
+        self.mongo["cabi_scraper"].delete_one({"nombre_cientifico": "Cabi 1"})
+        self.mongo["urls_scraper"].update_one({"source_url": "https://species.org/2"}, {"$set": {"contenido": "   "}})
+
+        names = [plague.scientific_name for plague in self.create_service().iter_plagues()]
+        self.assertNotIn("Cabi 1", names)
+        self.assertNotIn("Specie 2", names)
+        with open("data/invalid_content/invalid_cabi_species.txt", encoding="utf-8") as f:
+            self.assertEqual(f.read(), "Cabi 1\n")
+        with open("data/invalid_content/invalid_species.txt", encoding="utf-8") as f:
+            self.assertEqual(f.read(), "Specie 2\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
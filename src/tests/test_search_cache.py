@@ -0,0 +1,68 @@
+import tempfile
+import unittest
+
+import numpy as np
+from qdrant_client.models import NamedSparseVector, NamedVector, SparseVector
+
+from models import VectorizableDocument
+from services.numpy_vector_store import NumpyVectorStore
+from services.query_cache import LRUCache
+from services.vector_store import VectorStore
+
+DENSE_SIZE = 4
+
+
+class ArrayEncoder:
+    # Encodes "<sparse index>-<point id>" texts as fixed vectors, so no model is loaded
+    def encode_sparse_batch(self, texts, batch_size=32):
+        return [([int(text.split("-")[0])], [1.0]) for text in texts]
+
+    def encode_dense(self, texts, task, batch_size=32, show_progress_bar=False):
+        return np.stack([np.eye(DENSE_SIZE, dtype=np.float32)[int(text.split("-")[-1]) % DENSE_SIZE] for text in texts])
+
+
+class NumpySearchCacheTest(unittest.TestCase):
+    store_class = NumpyVectorStore
+
+    def setUp(self):
+        self.storage = tempfile.TemporaryDirectory()
+        self.vector_store = self.store_class(self.storage.name, ArrayEncoder(), "keywords", "content", search_cache=LRUCache(16))
+        self.vector_store.create_collection("plagues", dense_vector_size=DENSE_SIZE)
+        self.query = NamedVector(name="content", vector=[1.0, 0.0, 0.0, 0.0])
+        self.sparse_query = NamedSparseVector(name="keywords", vector=SparseVector(indices=[0], values=[1.0]))
+
+    def tearDown(self):
+        self.vector_store.close()
+        self.storage.cleanup()
+
+    def add_chunks(self, ids):
+        documents = [
+            VectorizableDocument(id=point_id, text=f"0-{point_id}", sparse_text="0", metadata={"source_url": "u0", "content_chunk": f"chunk {point_id}"})
+            for point_id in ids
+        ]
+        self.vector_store.add_documents("plagues", documents, use_sparse=True, use_dense=True, verbose=False)
+        self.vector_store.flush("plagues")
+
+    def test_search_results_follow_collection_writes(self):
+        self.add_chunks([4])
+        self.assertEqual([result[0] for result in self.vector_store.search("plagues", self.query, top_k=2)], [4])
+        self.add_chunks([8])
+        self.assertEqual(sorted(result[0] for result in self.vector_store.search("plagues", self.query, top_k=2)), [4, 8])
+
+        self.vector_store.delete_points("plagues", [4, 8])
+        self.vector_store.flush("plagues")
+        self.assertEqual(self.vector_store.search("plagues", self.query, top_k=2), [])
+
+    def test_hybrid_search_results_follow_collection_writes(self):
+        self.add_chunks([4])
+        self.assertEqual([result[0] for result in self.vector_store.hybrid_search("plagues", self.sparse_query, self.query, top_k=2)], [4])
+        self.add_chunks([8])
+        self.assertEqual(sorted(result[0] for result in self.vector_store.hybrid_search("plagues", self.sparse_query, self.query, top_k=2)), [4, 8])
+
+
+class QdrantSearchCacheTest(NumpySearchCacheTest):
+    store_class = VectorStore
+
+
+if __name__ == "__main__":
+    unittest.main()
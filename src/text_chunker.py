@@ -0,0 +1,106 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+
+class TokenChunker:
+    """
+    Splits texts into windows of chunk_size tokens overlapping by chunk_overlap tokens.
+    Texts are tokenized in batches by a fast tokenizer and every chunk is sliced from the
+    original text through the token offsets, so no token is decoded back into text.
+    """
+
+    def __init__(self, tokenizer_name: str, chunk_size: int = 400, chunk_overlap: int = 80):
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+        self.tokenizer_name = tokenizer_name
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        # The backend tokenizers.Tokenizer of the fast tokenizer, which pickles on its own, so
+        # worker processes receive it loaded and never import transformers (and through it torch)
+        self.tokenizer = None
+
+    def load_tokenizer(self):
+        if self.tokenizer is None:
+            from transformers import AutoTokenizer
+
+            tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name, trust_remote_code=True)
+            if not tokenizer.is_fast:
+                raise ValueError(f"Offset-based chunking needs a fast tokenizer, {self.tokenizer_name} has none")
+            self.tokenizer = tokenizer.backend_tokenizer
+            self.tokenizer.no_truncation()
+            self.tokenizer.no_padding()
+
+    def split_text(self, text: str) -> List[str]:
+        return self.split_texts([text])[0]
+
+    def split_texts(self, texts: List[str]) -> List[List[str]]:
+        self.load_tokenizer()
+        offset_mappings = [encoding.offsets for encoding in self.tokenizer.encode_batch(texts, add_special_tokens=False)]
+
+        chunks = []
+        for text, offsets in zip(texts, offset_mappings):
+            text_chunks = []
+            start = 0
+            while start < len(offsets):
+                end = min(start + self.chunk_size, len(offsets))
+                chunk = text[offsets[start][0]:offsets[end - 1][1]].strip()
+                if chunk:
+                    text_chunks.append(chunk)
+                if end == len(offsets):
+                    break
+                start += self.chunk_size - self.chunk_overlap
+            chunks.append(text_chunks)
+        return chunks
+
+
+# Spawned workers unpickle the chunker from this module, which is kept outside the services
+# package: importing services would load torch, the models and qdrant in every worker
+_worker_chunker: Optional[TokenChunker] = None
+
+
+def _init_chunk_worker(chunker: TokenChunker):
+    global _worker_chunker
+    _worker_chunker = chunker
+
+
+def _split_texts_in_worker(texts: List[str]) -> List[List[str]]:
+    return _worker_chunker.split_texts(texts)
+
+
+def iter_split_texts(
+    chunker: TokenChunker,
+    items: Iterable[Tuple[Any, str]],
+    workers: int = 0,
+    batch_size: int = 16,
+) -> Iterator[Tuple[Any, List[str]]]:
+    """
+    Splits the text of every (key, text) item, yielding (key, chunks) in input order.
+    With workers > 0 batches of texts are split across a process pool; at most
+    2 * workers batches are in flight, so the input is still consumed lazily.
+    """
+    items = iter(items)
+    if workers <= 0:
+        while batch := list(islice(items, batch_size)):
+            yield from zip([key for key, _ in batch], chunker.split_texts([text for _, text in batch]))
+        return
+
+    # spawn instead of fork: the parent already runs torch and tokenizer threads
+    chunker.load_tokenizer()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_chunk_worker,
+        initargs=(chunker,),
+    ) as executor:
+        pending = deque()
+        while batch := list(islice(items, batch_size)):
+            pending.append(([key for key, _ in batch], executor.submit(_split_texts_in_worker, [text for _, text in batch])))
+            if len(pending) >= 2 * workers:
+                keys, future = pending.popleft()
+                yield from zip(keys, future.result())
+        while pending:
+            keys, future = pending.popleft()
+            yield from zip(keys, future.result())